@@ -1,13 +1,24 @@
 from aiogram import Router, F
-from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, URLInputFile, ReplyKeyboardRemove
+from aiogram.types import Message, ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
-from app.core.parser import get_driver, parse_product_page, get_product_links
+from selenium.common.exceptions import WebDriverException
+from app.core.parser import get_driver_pool, parse_product, iter_search_cards, quit_driver_in_background
 from app.core.utils import log_info, log_error, log_warning, log_processed_item
-from app.core.filters import is_matching_deal
+from app.core.filters import is_matching_deal, is_plausible_deal
+from app.core.config import FIND_DEALS_WORKERS, CARD_PREFILTER_ENABLED, DATASET_ENABLED, ADMIN_USER_IDS, WB_BASE_URL
+from app.core.metrics import get_metrics
+from app.core.dataset import get_dataset_writer
+from app.bot.scheduler import get_job_scheduler, SchedulerFull
+from app.bot.outbox import get_outbox
+from app.bot.photo_cache import get_photo_cache
 import asyncio
+import html
 import random
+import re
+import threading
+import time
 
 # --- Текстовые константы ---
 MSG_GREETING = (
@@ -31,9 +42,9 @@ MSG_SEARCH_STARTED = "Начинаю поиск по запросу: '{search_qu
 MSG_NO_LINKS_FOUND = "🤷‍♂️ По запросу '{search_query}' ничего не найдено на указанном количестве страниц."
 MSG_LINKS_FOUND_START_PROCESSING = "Найдено {count} товаров. Начинаю проверку на выгодные предложения..."
 MSG_ITEMS_CHECKED_PROGRESS = "Проверено {checked} из {total} товаров..."
-MSG_SEARCH_COMPLETED = "🎉 Поиск завершен!\nПроверено товаров: {processed} из {total_links}.\nНайдено выгодных предложений: {deals_count} 🏁"
+MSG_SEARCH_COMPLETED = "🎉 Поиск завершен!\nПроверено товаров: {processed} из {total_links}.\nОтсеяно по цене в выдаче: {skipped}.\nНайдено выгодных предложений: {deals_count} 🏁"
 MSG_CAPTCHA_DETECTED = "🛡️ Не удалось получить данные: обнаружена капча на странице {url}. Попробуйте позже."
-MSG_PARSE_ERROR_DEBUG_HTML = "🐞 Не удалось полностью разобрать страницу для: {url}. Проверьте debug_wb.html. {message}"
+MSG_PARSE_ERROR_DEBUG_HTML = "🐞 Не удалось полностью разобрать страницу для: {url}. {message}"
 MSG_DATA_NOT_FOUND = "❓ Не удалось получить данные для: {url}. Возможно, структура страницы изменилась или товар недоступен."
 MSG_CRITICAL_ERROR_PROCESSING_LINK = "💥 Произошла критическая ошибка при обработке ссылки: {url}. Попробуйте позже."
 MSG_ERROR_GETTING_LINKS = "🕸️ Не удалось получить список товаров для поиска. Попробуйте позже."
@@ -56,15 +67,22 @@ MSG_SEARCH_STATS_FORMAT = (
     "🔄 Проверено товаров: {processed_count} из {total_links}\n"
     "🔥 Найдено выгодных предложений: {deals_found}"
 )
+MSG_SEARCH_QUEUED = "🕒 Поиск поставлен в очередь, ваше место: {position}. Начну, как только освободится место."
+MSG_QUEUE_POSITION = "🕒 Поиск ждет в очереди, ваше место: {position}."
+MSG_SEARCH_QUEUE_FULL = "🚦 Сейчас слишком много поисков в очереди. Попробуйте чуть позже."
+MSG_SEARCH_USER_LIMIT = "⏳ У вас уже есть поиск в работе или в очереди. Дождитесь его завершения или остановите его."
+MSG_SEARCH_REMOVED_FROM_QUEUE = "🗑️ Поиск убран из очереди."
+MSG_METRICS_EMPTY = "📈 Метрик пока нет: ни одной загрузки или отправки с запуска бота."
 STATS_UNAVAILABLE = "ℹ️ Статистика поиска в данный момент недоступна или поиск уже завершен."
 
 DEAL_ALERT_PREFIX = "🔥 <b>ВЫГОДНОЕ ПРЕДЛОЖЕНИЕ!</b> Цена ниже скидки за отзыв!\n"
 
 # --- Константы для логики ---
-WB_URL_REGEX = r"https://www\.wildberries\.ru/catalog/\d+/detail\.aspx"
+WB_URL_REGEX = re.escape(WB_BASE_URL) + r"catalog/\d+/detail\.aspx" # Ссылки на карточки того WB, на который смотрит парсер
 # PROGRESS_UPDATE_INTERVAL = 10 # Больше не используется для сообщений в чат
 
 router = Router()
+_background_tasks = set() # Ссылки на фоновые задачи, чтобы их не собрал сборщик мусора
 
 # --- Состояния для поиска выгодных предложений ---
 class FindDealsStates(StatesGroup):
@@ -96,8 +114,8 @@ search_stats_kb = ReplyKeyboardMarkup(
     resize_keyboard=True
 )
 
-async def _send_formatted_product_message(message: Message, product_data: dict, product_url: str, deal_alert_prefix: str = ""):
-    """Вспомогательная функция для форматирования и отправки сообщения о товаре."""
+def _format_product_message(product_data: dict, product_url: str, deal_alert_prefix: str = ""):
+    """Текст сообщения о товаре и ссылка на первое фото (или None)."""
     current_price = product_data.get('current_price', 0.0)
     second_price = product_data.get('second_price', 0.0)
     feedback_discount = product_data.get('feedback_discount', 0.0)
@@ -116,13 +134,22 @@ async def _send_formatted_product_message(message: Message, product_data: dict,
         f"<b>Рейтинг:</b> {product_data.get('rating', 0.0)} ({product_data.get('reviews', 0)} отзывов)\n"
         f"<a href='{product_url}'>Ссылка на товар</a>"
     )
+    images = product_data.get("images")
+    return response_text, (images[0] if images else None)
 
-    if product_data.get("images"):
+async def _send_formatted_product_message(message: Message, product_data: dict, product_url: str, deal_alert_prefix: str = ""):
+    """Вспомогательная функция для форматирования и отправки сообщения о товаре."""
+    response_text, image_url = _format_product_message(product_data, product_url, deal_alert_prefix)
+    photo_cache = get_photo_cache()
+    photo = await photo_cache.input_file(image_url) if image_url else None # file_id, локальная копия или None
+    if photo:
         try:
-            image_url = product_data["images"][0]
-            await message.answer_photo(photo=URLInputFile(image_url), caption=response_text, parse_mode="HTML")
+            with get_metrics().timer("telegram_send", kind="deal", source="bot_link"):
+                sent_message = await message.answer_photo(photo=photo, caption=response_text, parse_mode="HTML")
+            photo_cache.remember_message(image_url, sent_message)
         except Exception as e:
             log_error(f"Ошибка отправки фото для {product_url}: {e}")
+            photo_cache.forget(image_url)
             await message.answer(response_text, parse_mode="HTML", disable_web_page_preview=True)
     else:
         await message.answer(response_text, parse_mode="HTML", disable_web_page_preview=True)
@@ -132,8 +159,32 @@ async def _send_formatted_product_message(message: Message, product_data: dict,
 async def cmd_start(message: Message, state: FSMContext): # Добавил state для единообразия, хотя он тут не используется
     # Если пользователь был в каком-то состоянии, очистим его при /start
     await state.clear()
+    # /start сбрасывает и поиск пользователя — выполняющийся или ожидающий в очереди
+    scheduler = get_job_scheduler()
+    job = scheduler.active_job(message.from_user.id)
+    if job:
+        scheduler.cancel(job.id)
     await message.answer(MSG_GREETING, reply_markup=main_kb)
 
+@router.message(Command("metrics"))
+async def cmd_metrics(message: Message):
+    # Только для админов из WB_ADMIN_IDS, остальным команда не отвечает
+    if message.from_user.id not in ADMIN_USER_IDS:
+        return
+    report = get_metrics().summary()
+    if not report:
+        await message.answer(MSG_METRICS_EMPTY)
+        return
+    # Отчет режется на части под лимит сообщения Telegram
+    chunks = [[]]
+    for line in report.splitlines():
+        if chunks[-1] and sum(len(part) + 1 for part in chunks[-1]) + len(line) > 3500:
+            chunks.append([])
+        chunks[-1].append(line)
+    for chunk in chunks:
+        chunk_text = html.escape("\n".join(chunk))
+        await message.answer(f"<pre>{chunk_text}</pre>", parse_mode="HTML")
+
 @router.message(F.text == BTN_PARSE_SINGLE_ITEM) # Используем константу
 async def ask_link(message: Message):
     await message.answer(MSG_ASK_LINK)
@@ -144,20 +195,9 @@ async def process_link(message: Message):
     processing_message = await message.answer(MSG_PARSING_STARTED.format(url=url))
     log_info(f"Получена ссылка от пользователя {message.from_user.id}: {url}")
 
-    driver_instance = None
     try:
-        def run_parser_sync(u):
-            nonlocal driver_instance
-            try:
-                driver_instance = get_driver()
-                data = parse_product_page(driver_instance, u)
-                return data
-            finally:
-                if driver_instance:
-                    driver_instance.quit()
-                    driver_instance = None
-        
-        data = await asyncio.to_thread(run_parser_sync, url)
+        # HTTP-загрузка с фолбеком на драйвер из пула
+        data = await asyncio.to_thread(parse_product, url, source="bot_link")
 
         if data and data.get("product_name"):
             deal_alert_text = ""
@@ -188,9 +228,6 @@ async def process_link(message: Message):
                 await processing_message.delete()
             except Exception:
                 pass
-        if driver_instance:
-            log_warning(f"Драйвер не был закрыт в потоке для {url}. Закрываю принудительно.")
-            driver_instance.quit()
 
 # Обработчики для /find_deals и новой кнопки
 @router.message(Command("find_deals"))
@@ -275,95 +312,144 @@ async def process_all_filters_and_search(message: Message, state: FSMContext):
     
     await state.clear() # Очищаем состояние после получения всех данных
 
+    # Поиск выполняется через общую очередь: число одновременных поисков ограничено на весь бот
+    async def run_search_job(job):
+        await _run_find_deals_search(message, state, job, search_query, min_price, max_price, num_pages_to_check)
+
+    scheduler = get_job_scheduler()
+    try:
+        job = scheduler.submit(message.from_user.id, run_search_job,
+                               info={"query": search_query, "min_price": min_price, "max_price": max_price})
+    except SchedulerFull as e:
+        await message.answer(MSG_SEARCH_USER_LIMIT if e.reason == "user" else MSG_SEARCH_QUEUE_FULL, reply_markup=main_kb)
+        return
+    position = scheduler.position(job.id)
+    if position:
+        # Пока поиск ждет, кнопки статистики и остановки показывают место в очереди и убирают из нее
+        await state.set_state(FindDealsStates.processing_items)
+        await message.answer(MSG_SEARCH_QUEUED.format(position=position), reply_markup=search_stats_kb)
+
+async def _run_find_deals_search(message: Message, state: FSMContext, job, search_query, min_price, max_price, num_pages_to_check):
+    """Сам поиск выгодных товаров; запускается очередью поисков (см. app/bot/scheduler.py).
+
+    Прогресс пишется в job.progress, отмена приходит через job.token: FSM трогается только в начале и в конце.
+    """
     initial_message_text = (
-        f"🚀 Начинаю поиск по запросу: '{search_query}'\\n"
-        f"💰 Цена от: {'не указана' if min_price is None else min_price} до {'не указана' if max_price is None else max_price}\\n"
-        f"📄 Проверка страниц: {num_pages_to_check}\\n\\n"
+        f"🚀 Начинаю поиск по запросу: '{search_query}'\n"
+        f"💰 Цена от: {'не указана' if min_price is None else min_price} до {'не указана' if max_price is None else max_price}\n"
+        f"📄 Проверка страниц: {num_pages_to_check}\n\n"
         "⏳ Это может занять некоторое время..."
     )
     await message.answer(initial_message_text)
 
-    links_driver_instance = None
-    product_links = []
-    processed_items_count_local = 0
-    deals_found_count_local = 0
-
-    try:
-        def get_links_threaded(query, num_pages, p_min, p_max):
-            nonlocal links_driver_instance
-            try:
-                log_info(f"Запускаю get_driver для get_product_links с запросом: {query}, мин.цена: {p_min}, макс.цена: {p_max}")
-                links_driver_instance = get_driver()
-                log_info(f"Драйвер для get_product_links получен. Запускаю get_product_links.")
-                found_links = get_product_links(links_driver_instance, 
-                                                search_query=query, 
-                                                max_pages=num_pages, 
-                                                min_price_rub=p_min, 
-                                                max_price_rub=p_max)
-                log_info(f"get_product_links завершен, найдено ссылок: {len(found_links)}")
-                return found_links
-            finally:
-                if links_driver_instance:
-                    log_info("Закрываю драйвер после get_product_links.")
-                    links_driver_instance.quit()
-                    links_driver_instance = None
-        
-        product_links = await asyncio.to_thread(get_links_threaded, search_query, num_pages_to_check, min_price, max_price)
-        log_info(f"Найдено {len(product_links)} ссылок по запросу '{search_query}' (с учетом фильтра цен priceU). Ссылки: {product_links if len(product_links) < 10 else str(product_links[:10]) + '...'}")
-
-    except Exception as e:
-        log_error(f"Ошибка при получении списка ссылок для '{search_query}': {type(e).__name__} - {e}")
-        await message.answer(MSG_ERROR_GETTING_LINKS, reply_markup=main_kb)
-        return # состояние уже очищено выше
-    
-    if not product_links:
-        await message.answer(MSG_NO_LINKS_FOUND.format(search_query=search_query), reply_markup=main_kb)
-        return # состояние уже очищено выше
+    progress = job.progress
+    outbox = get_outbox(message.bot)
+    links_error = False
 
+    # Ссылки приходят постранично: проверка товаров идет параллельно с загрузкой следующих страниц выдачи
     await state.set_state(FindDealsStates.processing_items)
-    await state.update_data(
-        search_query_for_stats=search_query,
-        min_price_for_stats=min_price,
-        max_price_for_stats=max_price,
-        total_links_for_stats=len(product_links),
-        processed_items_count_stats=0,
-        deals_found_count_stats=0,
-        cancel_requested=False # Флаг для отмены
-    )
     await message.answer(MSG_SEARCH_PROCESSING_PROMPT, reply_markup=search_stats_kb)
-    
-    item_parser_driver_instance_main = None
-    try:
-        log_info(f"Создаю основной драйвер для цикла парсинга {len(product_links)} товаров.")
-        item_parser_driver_instance_main = get_driver()
-        if not item_parser_driver_instance_main:
-            await message.answer(MSG_DRIVER_INIT_FAILED_FOR_ITEMS, reply_markup=main_kb)
-            log_error("Не удалось создать основной драйвер для парсинга элементов.")
-            current_fsm_state_init_fail = await state.get_state()
-            if current_fsm_state_init_fail == FindDealsStates.processing_items.state: # Очищаем, если ошибка на этом этапе
-                 await state.clear()
-            return
 
-        for i, product_url in enumerate(product_links):
-            current_fsm_data = await state.get_data() # Получаем актуальные данные FSM
-            if current_fsm_data.get("cancel_requested"):
-                await message.answer(MSG_SEARCH_STOPPED_BY_USER, reply_markup=main_kb)
-                break 
+    # Один драйвер занят выдачей, остальные остаются под фолбек карточек
+    workers_count = max(1, min(FIND_DEALS_WORKERS, get_driver_pool().size))
+    links_queue = asyncio.Queue() # Ссылки на товары; None — сигнал воркеру завершиться
+    loop = asyncio.get_running_loop()
+    links_stop = threading.Event() # Просит поток выдачи не грузить следующие страницы
+    stop_event = asyncio.Event() # Останавливает всех воркеров: отмена, нет драйвера
+    stop_reason = None
+
+    def enqueue_link(product_url):
+        progress.increment("total_links")
+        links_queue.put_nowait(product_url)
+
+    def produce_links_threaded(query, num_pages, p_min, p_max):
+        log_info(f"Беру драйвер из пула для iter_search_cards с запросом: {query}, мин.цена: {p_min}, макс.цена: {p_max}")
+        pool = get_driver_pool()
+        links_driver_instance = pool.acquire()
+        if not links_driver_instance:
+            raise RuntimeError("Не удалось получить драйвер из пула для iter_search_cards")
+        # Отмена обрывает и загрузку текущей страницы выдачи
+        cancel_callback_id = job.token.register(lambda: quit_driver_in_background(links_driver_instance))
+        found_count = 0
+        broken = False
+        try:
+            for card in iter_search_cards(links_driver_instance,
+                                          search_query=query,
+                                          max_pages=num_pages,
+                                          min_price_rub=p_min,
+                                          max_price_rub=p_max):
+                if links_stop.is_set():
+                    break
+                found_count += 1
+                # Цена и бейдж "рубли за отзыв" видны в выдаче: заведомо невыгодные товары не открываем
+                if CARD_PREFILTER_ENABLED and not is_plausible_deal(card, user_min_price=p_min, user_max_price=p_max):
+                    progress.increment("skipped")
+                    continue
+                loop.call_soon_threadsafe(enqueue_link, card["url"])
+        except Exception as e:
+            broken = isinstance(e, WebDriverException)
+            if job.token.cancelled:
+                return # Драйвер закрыт отменой поиска
+            raise
+        finally:
+            job.token.unregister(cancel_callback_id)
+            # После отмены драйвер уже закрывается в фоне: в пул он не возвращается, даже если пока отвечает
+            pool.release(links_driver_instance, broken=broken or job.token.cancelled)
+        log_info(f"Выдача по запросу '{query}' загружена, найдено ссылок: {found_count}, отсеяно по карточкам: {progress.get('skipped')}")
+
+    async def links_producer():
+        nonlocal links_error
+        try:
+            await asyncio.to_thread(produce_links_threaded, search_query, num_pages_to_check, min_price, max_price)
+        except Exception as e:
+            links_error = True
+            log_error(f"Ошибка при получении списка ссылок для '{search_query}': {type(e).__name__} - {e}")
+        finally:
+            for _ in range(workers_count):
+                links_queue.put_nowait(None)
+
+    def stop_search(reason_text):
+        # Причину остановки запоминает только первый вызов, сообщение уходит в конце поиска
+        nonlocal stop_reason
+        if not stop_event.is_set():
+            stop_event.set()
+            links_stop.set()
+            stop_reason = reason_text
+            for _ in range(workers_count):
+                links_queue.put_nowait(None) # Будим воркеров, ждущих следующую ссылку
+
+    # Кнопка "Остановить поиск" отменяет токен: воркеры останавливаются сразу, загрузки в браузере обрываются
+    job.token.register(lambda: loop.call_soon_threadsafe(stop_search, MSG_SEARCH_STOPPED_BY_USER))
+
+    async def item_worker():
+        while not stop_event.is_set():
+            product_url = await links_queue.get()
+            if product_url is None or stop_event.is_set():
+                return
 
-            log_processed_item(f"Начало обработки URL: {product_url}")
+            log_processed_item(f"Начало обработки URL: {product_url}", url=product_url, job=job.id)
+            item_started = time.perf_counter()
             try:
-                def run_single_item_parser_sync_reuse_driver(driver_to_use, url_to_parse):
-                    data = parse_product_page(driver_to_use, url_to_parse)
-                    return data
-                
-                data = await asyncio.to_thread(run_single_item_parser_sync_reuse_driver, item_parser_driver_instance_main, product_url)
-                processed_items_count_local += 1
+                # Драйвер (если HTTP-загрузки не хватило) берется из пула на время одного товара
+                data = await asyncio.to_thread(parse_product, product_url, source="find_deals", cancel_token=job.token)
+                if data and data.get("status") == "driver_unavailable":
+                    log_error("Не удалось получить драйвер из пула для парсинга элементов.")
+                    stop_search(MSG_DRIVER_INIT_FAILED_FOR_ITEMS)
+                    return
+                if stop_event.is_set():
+                    return # Результат пришел после остановки поиска — не учитываем его
+                progress.increment("processed")
 
                 if data and data.get("product_name"):
-                    log_processed_item(f"Успешно: {product_url} - {data.get('product_name')}")
+                    log_processed_item(f"Успешно: {product_url} - {data.get('product_name')}", url=product_url,
+                                       article=data.get("article"), status="ok", duration=round(time.perf_counter() - item_started, 3), job=job.id)
+                    if DATASET_ENABLED:
+                        # Заполненная пачка пишется в Parquet прямо в add: не в цикле событий бота
+                        await asyncio.to_thread(get_dataset_writer().add, data, query=search_query, source="find_deals")
                     if is_matching_deal(data, user_min_price=min_price, user_max_price=max_price): # Используем min_price, max_price из замыкания
-                        deals_found_count_local += 1
-                        await _send_formatted_product_message(message, data, product_url, DEAL_ALERT_PREFIX)
+                        progress.increment("deals")
+                        # Отправкой занимается очередь чата: воркер не ждет Telegram и сразу берет следующий товар
+                        outbox.send_deal(message.chat.id, *_format_product_message(data, product_url, DEAL_ALERT_PREFIX))
                 elif data and data.get("status") == "captcha_detected": # Исправлена вложенность
                     log_warning(f"Капча при обработке {product_url} в цикле.")
                 elif data and data.get("status") == "product_unavailable": # Исправлена вложенность
@@ -372,38 +458,44 @@ async def process_all_filters_and_search(message: Message, state: FSMContext):
                     log_warning(f"Нет данных для {product_url} в цикле: {data.get('message', '')}")
                 else: # Исправлена вложенность
                     log_warning(f"Не удалось получить данные для {product_url} в цикле. Результат: {data}")
-                
-                # Обновляем данные для статистики в FSM
-                current_fsm_state_in_loop = await state.get_state() 
-                if current_fsm_state_in_loop == FindDealsStates.processing_items.state:
-                    await state.update_data(processed_items_count_stats=processed_items_count_local, deals_found_count_stats=deals_found_count_local)
-                else: 
-                    log_warning(f"Состояние FSM изменилось во время обработки ({current_fsm_state_in_loop}), прерываю поиск.")
-                    await message.answer("Поиск был прерван из-за смены команды.", reply_markup=main_kb)
-                    break
             except Exception as e_item:
                 log_error(f"Ошибка в цикле обработки товара {product_url}: {type(e_item).__name__} - {e_item}")
 
+    search_failed = False
+    try:
+        log_info(f"Начинаю проверку товаров по запросу '{search_query}' в {workers_count} потоков на драйверах из пула.")
+        producer_task = asyncio.create_task(links_producer())
+        _background_tasks.add(producer_task) # Поток выдачи может доработать страницу уже после остановки поиска
+        producer_task.add_done_callback(_background_tasks.discard)
+        # Результаты приходят в порядке готовности: счетчики и is_matching_deal от порядка не зависят
+        await asyncio.gather(*(item_worker() for _ in range(workers_count)))
+        links_stop.set()
+        if not stop_event.is_set():
+            await producer_task
+            if progress.get("total_links") == 0 and progress.get("skipped") == 0:
+                search_failed = True
+                await message.answer(MSG_ERROR_GETTING_LINKS if links_error else MSG_NO_LINKS_FOUND.format(search_query=search_query), reply_markup=main_kb)
+
     except Exception as e_main_loop:
         log_error(f"Главная ошибка в цикле проверки товаров: {type(e_main_loop).__name__} - {e_main_loop}")
         await message.answer(MSG_ERROR_IN_ITEM_PROCESSING_LOOP, reply_markup=main_kb)
-        # Если была ошибка в основном цикле, состояние processing_items тоже надо очистить
-        current_fsm_state_on_error = await state.get_state()
-        if current_fsm_state_on_error == FindDealsStates.processing_items.state:
-            await state.clear()
     finally:
-        if item_parser_driver_instance_main:
-            log_info("Закрываю основной драйвер после цикла парсинга.")
-            item_parser_driver_instance_main.quit()
-        
-        await message.answer(
-            MSG_SEARCH_COMPLETED.format(
-                processed=processed_items_count_local, 
-                total_links=len(product_links),
-                deals_count=deals_found_count_local
-            ),
-            reply_markup=main_kb
-        )
+        links_stop.set()
+        # Итоги идут через ту же очередь, что и находки, чтобы не обогнать их
+        if stop_reason:
+            outbox.send_text(message.chat.id, stop_reason, reply_markup=main_kb)
+        if not search_failed:
+            counters = progress.snapshot()
+            outbox.send_text(
+                message.chat.id,
+                MSG_SEARCH_COMPLETED.format(
+                    processed=counters["processed"], 
+                    total_links=counters["total_links"],
+                    skipped=counters["skipped"],
+                    deals_count=counters["deals"]
+                ),
+                reply_markup=main_kb
+            )
         current_fsm_state_finally = await state.get_state()
         if current_fsm_state_finally == FindDealsStates.processing_items.state:
             await state.clear()
@@ -411,38 +503,48 @@ async def process_all_filters_and_search(message: Message, state: FSMContext):
 # Обработчик для кнопки "Остановить поиск"
 @router.message(FindDealsStates.processing_items, F.text == BTN_STOP_SEARCH)
 async def cmd_stop_search(message: Message, state: FSMContext):
-    await state.update_data(cancel_requested=True)
-    await message.answer(MSG_SEARCH_STOP_REQUESTED, reply_markup=ReplyKeyboardRemove())
+    scheduler = get_job_scheduler()
+    job = scheduler.active_job(message.from_user.id)
+    result = scheduler.cancel(job.id) if job else None
+    if result == "cancelling":
+        await message.answer(MSG_SEARCH_STOP_REQUESTED, reply_markup=ReplyKeyboardRemove())
+        return
+    # Поиск еще ждал в очереди или уже завершился
+    await state.clear()
+    await message.answer(MSG_SEARCH_REMOVED_FROM_QUEUE if result == "dequeued" else STATS_UNAVAILABLE, reply_markup=main_kb)
 
 # Обработчик для кнопки статистики
 @router.message(FindDealsStates.processing_items, F.text == BTN_SHOW_STATS)
 async def show_search_stats(message: Message, state: FSMContext):
-    stats_data = await state.get_data()
-    if not stats_data or 'total_links_for_stats' not in stats_data:
+    scheduler = get_job_scheduler()
+    job = scheduler.active_job(message.from_user.id)
+    if not job:
         await message.answer(STATS_UNAVAILABLE, reply_markup=main_kb)
         current_fsm_state_no_data = await state.get_state()
         if current_fsm_state_no_data == FindDealsStates.processing_items.state:
             await state.clear()
         return
+    queue_position = scheduler.position(job.id)
+    if queue_position:
+        await message.answer(MSG_QUEUE_POSITION.format(position=queue_position), reply_markup=search_stats_kb)
+        return
 
-    query = stats_data.get('search_query_for_stats', 'неизвестно')
-    min_p = stats_data.get('min_price_for_stats')
-    max_p = stats_data.get('max_price_for_stats')
-    total = stats_data.get('total_links_for_stats', 0)
-    processed = stats_data.get('processed_items_count_stats', 0)
-    deals = stats_data.get('deals_found_count_stats', 0)
-    last_stats_message_id = stats_data.get('last_stats_message_id')
+    # Счетчики живые: читаются прямо из задачи, без хранилища FSM
+    counters = job.progress.snapshot()
+    min_p = job.info.get('min_price')
+    max_p = job.info.get('max_price')
+    last_stats_message_id = job.stats_message_id
 
     min_p_str = str(min_p) if min_p is not None else 'не указана'
     max_p_str = str(max_p) if max_p is not None else 'не указана'
 
     text_to_send = MSG_SEARCH_STATS_FORMAT.format(
-        query=query,
+        query=job.info.get('query', 'неизвестно'),
         min_price=min_p_str,
         max_price=max_p_str,
-        total_links=total,
-        processed_count=processed,
-        deals_found=deals
+        total_links=counters["total_links"],
+        processed_count=counters["processed"],
+        deals_found=counters["deals"]
     )
 
     try:
@@ -458,10 +560,10 @@ async def show_search_stats(message: Message, state: FSMContext):
             # await message.delete() # Раскомментировать, если нужно удалять сообщение с кнопкой
         else:
             sent_message = await message.answer(text_to_send, parse_mode="HTML", reply_markup=search_stats_kb)
-            await state.update_data(last_stats_message_id=sent_message.message_id)
+            job.stats_message_id = sent_message.message_id
     except Exception as e: # Если редактирование не удалось (например, сообщение слишком старое или удалено)
         log_warning(f"Не удалось отредактировать сообщение статистики (ID: {last_stats_message_id}): {e}. Отправляю новое.")
         sent_message = await message.answer(text_to_send, parse_mode="HTML", reply_markup=search_stats_kb)
-        await state.update_data(last_stats_message_id=sent_message.message_id)
+        job.stats_message_id = sent_message.message_id
 
 # Убедимся, что router.include_router(other_router) или dp.include_router(router) есть в main.py или app.py 
\ No newline at end of file
@@ -1,18 +1,46 @@
 import asyncio
 from aiogram import Bot, Dispatcher
 from app.bot.handlers import router
-from app.core.utils import setup_logging
+from app.bot.outbox import get_outbox
+from app.bot.photo_cache import get_photo_cache
+from app.core.parser import get_driver_pool
+from app.core.storage import get_product_store
+from app.core.dataset import get_dataset_writer
+from app.core.config import DATASET_ENABLED, METRICS_HOST, METRICS_PORT
+from app.core.metrics import start_metrics_server
+from app.core.utils import setup_logging, log_error
 import os
 
 TOKEN = os.getenv("WB_BOT_TOKEN", "7416839304:AAH0oZxFeBdRQdYLEnft6YiPx-k7UOa2bwQ")
 
+async def on_startup():
+    # Прогреваем пул в фоне, чтобы не задерживать запуск поллинга
+    async def warm_up_pool():
+        try:
+            await asyncio.to_thread(get_driver_pool().warm_up)
+        except Exception as e:
+            log_error(f"Ошибка прогрева пула драйверов: {e}")
+    asyncio.create_task(warm_up_pool())
+    if METRICS_PORT:
+        start_metrics_server(METRICS_HOST, METRICS_PORT) # Эндпоинт Prometheus только на локальном интерфейсе
+
+async def on_shutdown(bot: Bot):
+    await get_outbox(bot).close() # Досылаем находки и итоги поисков, уже стоящие в очереди
+    get_photo_cache().save()
+    await asyncio.to_thread(get_driver_pool().close)
+    await asyncio.to_thread(get_product_store().close) # Дописываем накопленные наблюдения
+    if DATASET_ENABLED:
+        await asyncio.to_thread(get_dataset_writer().close)
+
 async def main():
     bot = Bot(token=TOKEN)
     dp = Dispatcher()
     dp.include_router(router)
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
 
 if __name__ == "__main__":
     setup_logging()
-    asyncio.run(main()) 
\ No newline at end of file
+    asyncio.run(main())
@@ -0,0 +1,196 @@
+import asyncio
+import time
+from collections import deque
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from aiogram.types import InputMediaPhoto
+from app.core.config import (OUTBOX_PER_CHAT_INTERVAL, OUTBOX_GLOBAL_RATE, OUTBOX_MAX_BATCH, OUTBOX_MAX_QUEUED_PER_CHAT,
+                             OUTBOX_MAX_RETRIES, OUTBOX_CLOSE_TIMEOUT)
+from app.core.utils import log_warning, log_error
+from app.core.metrics import get_metrics, TELEGRAM_SENDS
+from app.bot.photo_cache import get_photo_cache
+
+# Очередь исходящих сообщений бота. Воркеры поиска кладут находки без ожидания, отправкой занимается
+# отдельная задача на каждый чат: она соблюдает интервал между сообщениями в чат и общий лимит бота,
+# а находки, накопившиеся за время ожидания, отправляет одним альбомом или сводкой.
+
+DIGEST_HEADER = "🔥 <b>Выгодные предложения ({count}):</b>\n\n"
+DIGEST_SEPARATOR = "\n\n———\n\n"
+TELEGRAM_TEXT_LIMIT = 4096
+TELEGRAM_CAPTION_LIMIT = 1024
+
+class OutboxItem:
+    def __init__(self, kind, text, image_url=None, kwargs=None):
+        self.kind = kind # "deal" — находка, может попасть в альбом или сводку; "text" — обычное сообщение
+        self.text = text
+        self.image_url = image_url
+        self.kwargs = kwargs or {}
+
+class Outbox:
+    """Очереди исходящих сообщений по чатам (все методы вызываются из цикла событий бота)."""
+
+    def __init__(self, bot, per_chat_interval=OUTBOX_PER_CHAT_INTERVAL, global_rate=OUTBOX_GLOBAL_RATE,
+                 max_batch=OUTBOX_MAX_BATCH, max_queued_per_chat=OUTBOX_MAX_QUEUED_PER_CHAT, max_retries=OUTBOX_MAX_RETRIES,
+                 photo_cache=None):
+        self.bot = bot
+        self.photos = photo_cache or get_photo_cache()
+        self.per_chat_interval = per_chat_interval
+        self.global_interval = 1 / global_rate
+        self.max_batch = max(1, min(max_batch, 10))
+        self.max_queued_per_chat = max_queued_per_chat
+        self.max_retries = max_retries
+        self._queues = {} # чат -> deque(OutboxItem)
+        self._senders = {} # чат -> задача отправки
+        self._chat_next_at = {} # чат -> когда можно отправлять следующее сообщение
+        self._global_next_at = 0.0
+        self.dropped = 0
+
+    def send_deal(self, chat_id, text, image_url=None):
+        """Ставит находку в очередь чата и сразу возвращается."""
+        self._put(chat_id, OutboxItem("deal", text, image_url))
+
+    def send_text(self, chat_id, text, **kwargs):
+        """Ставит обычное сообщение в очередь чата: оно уйдет после уже поставленных находок."""
+        self._put(chat_id, OutboxItem("text", text, kwargs=kwargs))
+
+    def _put(self, chat_id, item):
+        chat_queue = self._queues.setdefault(chat_id, deque())
+        if len(chat_queue) >= self.max_queued_per_chat and item.kind == "deal":
+            self.dropped += 1
+            log_warning(f"Очередь сообщений чата {chat_id} переполнена, находка отброшена.")
+            return
+        chat_queue.append(item)
+        if chat_id not in self._senders:
+            self._senders[chat_id] = asyncio.create_task(self._sender(chat_id))
+
+    async def flush(self, chat_id, timeout=None):
+        """Ждет, пока очередь чата не опустеет."""
+        sender = self._senders.get(chat_id)
+        if sender:
+            await asyncio.wait({sender}, timeout=timeout)
+
+    async def close(self, timeout=OUTBOX_CLOSE_TIMEOUT):
+        """Дожидается отправки всех очередей (не дольше timeout), остальное отменяет."""
+        senders = set(self._senders.values())
+        if not senders:
+            return
+        _, pending = await asyncio.wait(senders, timeout=timeout)
+        for sender in pending:
+            sender.cancel()
+        if pending:
+            log_warning(f"Не отправлены сообщения в {len(pending)} чатов: истекло время ожидания при остановке.")
+
+    async def _wait_chat_turn(self, chat_id):
+        delay = self._chat_next_at.get(chat_id, 0.0) - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _wait_turn(self, chat_id, messages_count):
+        # Вызывается перед каждым запросом к Telegram; альбом из N фото Telegram считает как N сообщений
+        now = time.monotonic()
+        start_at = max(now, self._chat_next_at.get(chat_id, 0.0), self._global_next_at)
+        self._global_next_at = start_at + self.global_interval * messages_count
+        self._chat_next_at[chat_id] = start_at + self.per_chat_interval
+        if start_at > now:
+            await asyncio.sleep(start_at - now)
+
+    def _take_batch(self, chat_queue):
+        item = chat_queue.popleft()
+        if item.kind != "deal":
+            return [item]
+        batch = [item]
+        while chat_queue and chat_queue[0].kind == "deal" and len(batch) < self.max_batch:
+            batch.append(chat_queue.popleft())
+        return batch
+
+    async def _sender(self, chat_id):
+        chat_queue = self._queues[chat_id]
+        try:
+            while chat_queue:
+                # Пока ждем очереди чата, подряд идущие находки копятся и уходят одним сообщением;
+                # общий лимит резервируется уже по размеру пачки (см. _send_batch)
+                await self._wait_chat_turn(chat_id)
+                batch = self._take_batch(chat_queue)
+                await self._send_with_retries(chat_id, batch)
+        finally:
+            del self._senders[chat_id]
+            if not chat_queue:
+                del self._queues[chat_id]
+
+    async def _send_with_retries(self, chat_id, batch):
+        metrics = get_metrics()
+        kind = batch[0].kind if len(batch) == 1 else "batch"
+        for attempt in range(self.max_retries + 1):
+            try:
+                with metrics.timer("telegram_send", kind=kind, source="bot"):
+                    await self._send_batch(chat_id, batch)
+                metrics.inc(TELEGRAM_SENDS, kind=kind, result="ok", source="bot")
+                return
+            except TelegramRetryAfter as e:
+                metrics.inc(TELEGRAM_SENDS, kind=kind, result="retry_after", source="bot")
+                # Флуд-контроль: вся очередь чата ждет, воркеры поиска продолжают работать
+                log_warning(f"Telegram просит подождать {e.retry_after} с перед отправкой в чат {chat_id}.")
+                self._chat_next_at[chat_id] = time.monotonic() + e.retry_after # Повтор дождется этого в _wait_turn
+            except TelegramBadRequest as e:
+                metrics.inc(TELEGRAM_SENDS, kind=kind, result="bad_request", source="bot")
+                # Повтор не поможет; альбом или фото не приняты (например, битая ссылка на изображение) — отправляем текстом
+                log_error(f"Telegram отклонил сообщение в чат {chat_id}: {e}")
+                if batch[0].kind == "deal":
+                    for item in batch:
+                        self.photos.forget(item.image_url) # Сохраненный file_id мог устареть
+                    await self._send_text_fallback(chat_id, batch)
+                return
+            except Exception as e:
+                metrics.inc(TELEGRAM_SENDS, kind=kind, result="error", source="bot")
+                log_error(f"Ошибка отправки в чат {chat_id} (попытка {attempt + 1}): {type(e).__name__} - {e}")
+        log_error(f"Сообщение в чат {chat_id} не отправлено после {self.max_retries + 1} попыток.")
+
+    async def _send_batch(self, chat_id, batch):
+        if batch[0].kind == "text":
+            await self._wait_turn(chat_id, 1)
+            await self.bot.send_message(chat_id, batch[0].text, **batch[0].kwargs)
+            return
+        # Фото берутся из кэша: по file_id повторная отправка мгновенная; не получилось скачать — находка уходит текстом
+        photos = [await self.photos.input_file(item.image_url) if item.image_url else None for item in batch]
+        if len(batch) == 1 and photos[0]:
+            await self._wait_turn(chat_id, 1)
+            sent = await self.bot.send_photo(chat_id, photo=photos[0], caption=batch[0].text, parse_mode="HTML")
+            self.photos.remember_message(batch[0].image_url, sent)
+        elif len(batch) == 1:
+            await self._wait_turn(chat_id, 1)
+            await self.bot.send_message(chat_id, batch[0].text, parse_mode="HTML", disable_web_page_preview=True)
+        elif all(photos) and all(len(item.text) <= TELEGRAM_CAPTION_LIMIT for item in batch):
+            await self._wait_turn(chat_id, len(batch))
+            sent = await self.bot.send_media_group(chat_id, media=[
+                InputMediaPhoto(media=photo, caption=item.text, parse_mode="HTML") for item, photo in zip(batch, photos)
+            ])
+            for item, sent_message in zip(batch, sent or ()):
+                self.photos.remember_message(item.image_url, sent_message)
+        else:
+            # Сводок может быть несколько: каждая — отдельное сообщение со своей очередью и повторами
+            await self._send_text_fallback(chat_id, batch)
+
+    def _digests(self, batch):
+        """Сводки находок, каждая не длиннее лимита сообщения Telegram."""
+        digests, current = [], []
+        for item in batch:
+            candidate = current + [item.text]
+            if current and len(DIGEST_HEADER) + 8 + len(DIGEST_SEPARATOR.join(candidate)) > TELEGRAM_TEXT_LIMIT:
+                digests.append(current)
+                candidate = [item.text]
+            current = candidate
+        digests.append(current)
+        return [texts[0] if len(texts) == 1 else DIGEST_HEADER.format(count=len(texts)) + DIGEST_SEPARATOR.join(texts)
+                for texts in digests]
+
+    async def _send_text_fallback(self, chat_id, batch):
+        for digest in self._digests(batch):
+            await self._send_with_retries(chat_id, [OutboxItem("text", digest, kwargs={"parse_mode": "HTML", "disable_web_page_preview": True})])
+
+_outbox = None
+
+def get_outbox(bot):
+    """Общая очередь исходящих сообщений бота."""
+    global _outbox
+    if _outbox is None:
+        _outbox = Outbox(bot)
+    return _outbox
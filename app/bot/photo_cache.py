@@ -0,0 +1,203 @@
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+import requests
+from aiogram.types import BufferedInputFile, FSInputFile
+from app.core.config import (PHOTO_FILE_ID_CACHE_FILE, PHOTO_FILE_ID_MAX_ITEMS, PHOTO_FILE_ID_SAVE_EVERY, PHOTO_CACHE_DIR,
+                             PHOTO_CACHE_MAX_FILES, PHOTO_CACHE_MAX_BYTES, PHOTO_CACHE_PRUNE_EVERY, PHOTO_DOWNLOAD_TIMEOUT,
+                             PHOTO_MAX_BYTES)
+from app.core.fetcher import get_http_fetcher
+from app.core.utils import log_info, log_warning
+
+# Кэш фото товаров для отправки в Telegram. После первой отправки Telegram возвращает file_id,
+# по которому то же фото уходит повторно мгновенно и без загрузки. Пока file_id нет, изображение
+# скачивается один раз с таймаутом и хранится на диске (LRU по времени доступа, лимит по числу и размеру).
+
+class PhotoCache:
+    """Ссылка на изображение -> file_id Telegram или локальная копия."""
+
+    def __init__(self, index_path=PHOTO_FILE_ID_CACHE_FILE, max_file_ids=PHOTO_FILE_ID_MAX_ITEMS, cache_dir=PHOTO_CACHE_DIR,
+                 max_files=PHOTO_CACHE_MAX_FILES, max_bytes=PHOTO_CACHE_MAX_BYTES, download_timeout=PHOTO_DOWNLOAD_TIMEOUT):
+        self.index_path = index_path
+        self.max_file_ids = max_file_ids
+        self.cache_dir = cache_dir
+        self.max_files = max_files
+        self.max_bytes = max_bytes
+        self.download_timeout = download_timeout
+        self._file_ids = OrderedDict() # ссылка -> file_id
+        self._lock = threading.Lock()
+        self._unsaved = 0
+        self._downloads_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+        self._load_index()
+
+    def _load_index(self):
+        if not self.index_path:
+            return
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                self._file_ids.update(json.load(f))
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            log_warning(f"Поврежденный индекс file_id фото {self.index_path}: {e}")
+
+    def save(self):
+        """Записывает индекс file_id на диск."""
+        if not self.index_path:
+            return
+        with self._lock:
+            snapshot = dict(self._file_ids)
+            self._unsaved = 0
+        try:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot, f)
+            os.replace(tmp_path, self.index_path)
+        except Exception as e:
+            log_warning(f"Не удалось сохранить индекс file_id фото: {e}")
+
+    def file_id(self, url):
+        with self._lock:
+            file_id = self._file_ids.get(url)
+            if file_id:
+                self._file_ids.move_to_end(url)
+            return file_id
+
+    def remember(self, url, file_id):
+        """Запоминает file_id, который Telegram вернул на отправку фото по этой ссылке."""
+        if not url or not file_id:
+            return
+        with self._lock:
+            if self._file_ids.get(url) == file_id:
+                return
+            self._file_ids[url] = file_id
+            self._file_ids.move_to_end(url)
+            while len(self._file_ids) > self.max_file_ids:
+                self._file_ids.popitem(last=False)
+            self._unsaved += 1
+            need_save = self._unsaved >= PHOTO_FILE_ID_SAVE_EVERY
+        if need_save:
+            self.save()
+
+    def remember_message(self, url, message):
+        """file_id самого крупного размера из отправленного сообщения с фото."""
+        if message and message.photo:
+            self.remember(url, message.photo[-1].file_id)
+
+    def forget(self, url):
+        """Убирает file_id, который Telegram отклонил."""
+        with self._lock:
+            self._file_ids.pop(url, None)
+
+    def _file_name(self, url):
+        digest = hashlib.sha1(url.encode("utf-8")).hexdigest()
+        extension = os.path.splitext(url.split("?", 1)[0])[1][:5] or ".jpg"
+        return f"{digest}{extension}"
+
+    def _local_path(self, url):
+        file_name = self._file_name(url)
+        return os.path.join(self.cache_dir, file_name[:2], file_name)
+
+    async def input_file(self, url):
+        """Что передать в send_photo: file_id, локальная копия или только что скачанное фото; None, если фото не получить."""
+        file_id = self.file_id(url)
+        if file_id:
+            self.hits += 1
+            return file_id
+        self.misses += 1
+        if self.cache_dir:
+            path = self._local_path(url)
+            if os.path.exists(path):
+                try:
+                    os.utime(path) # Время доступа для вытеснения самых старых копий
+                except OSError:
+                    pass
+                return FSInputFile(path)
+        content = await asyncio.to_thread(self._download, url)
+        if content is None:
+            return None
+        return BufferedInputFile(content, filename=self._file_name(url))
+
+    def _download(self, url):
+        try:
+            response = get_http_fetcher().session.get(url, timeout=self.download_timeout, stream=True)
+            with response:
+                if response.status_code != 200 or not response.headers.get("Content-Type", "image/").startswith("image/"):
+                    log_warning(f"Фото {url} не загружено: HTTP {response.status_code}, {response.headers.get('Content-Type')}")
+                    return None
+                content = response.raw.read(PHOTO_MAX_BYTES + 1, decode_content=True)
+        except requests.RequestException as e:
+            log_warning(f"Фото {url} не загружено: {type(e).__name__} - {e}")
+            return None
+        if len(content) > PHOTO_MAX_BYTES:
+            log_warning(f"Фото {url} больше лимита Telegram, отправляю без него.")
+            return None
+        self._store(url, content)
+        return content
+
+    def _store(self, url, content):
+        if not self.cache_dir:
+            return
+        path = self._local_path(url)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            log_warning(f"Не удалось сохранить фото {url} в кэш: {e}")
+            return
+        with self._lock:
+            self._downloads_since_prune += 1
+            need_prune = self._downloads_since_prune >= PHOTO_CACHE_PRUNE_EVERY
+            if need_prune:
+                self._downloads_since_prune = 0
+        if need_prune:
+            self.prune_disk()
+
+    def prune_disk(self):
+        """Удаляет самые давно использованные копии сверх max_files и max_bytes."""
+        entries = []
+        try:
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if not entry.name.endswith(".tmp"):
+                        stat = entry.stat()
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        for index, (_, size, path) in enumerate(entries):
+            if len(entries) - index <= self.max_files and total_bytes <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+                total_bytes -= size
+            except OSError:
+                pass
+        if removed:
+            log_info(f"Кэш фото: удалено {removed} старых копий с диска.")
+        return removed
+
+_photo_cache = None
+_photo_cache_lock = threading.Lock()
+
+def get_photo_cache():
+    """Общий для бота кэш фото товаров."""
+    global _photo_cache
+    with _photo_cache_lock:
+        if _photo_cache is None:
+            _photo_cache = PhotoCache()
+        return _photo_cache
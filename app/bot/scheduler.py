@@ -0,0 +1,161 @@
+import asyncio
+import itertools
+import time
+from collections import OrderedDict, deque
+from app.core.config import (SCHEDULER_MAX_RUNNING_JOBS, SCHEDULER_PER_USER_LIMIT, SCHEDULER_MAX_QUEUED_PER_USER,
+                             SCHEDULER_MAX_QUEUED_TOTAL)
+from app.core.jobs import CancellationToken, ProgressCounters
+from app.core.utils import log_info, log_error
+
+# Очередь поисков /find_deals: одновременно выполняется не больше SCHEDULER_MAX_RUNNING_JOBS поисков
+# (каждый занимает до FIND_DEALS_WORKERS потоков и драйверы из общего пула), у одного пользователя —
+# не больше SCHEDULER_PER_USER_LIMIT. Ожидающие поиски запускаются по кругу между пользователями,
+# чтобы один человек с несколькими поисками не занимал всю очередь.
+
+class SchedulerFull(Exception):
+    """Очередь переполнена (общий лимит или лимит пользователя)."""
+
+    def __init__(self, reason):
+        super().__init__(reason)
+        self.reason = reason # "total" или "user"
+
+class SearchJob:
+    """Поиск в очереди: живые счетчики прогресса и токен отмены читаются напрямую, без хранилища FSM."""
+
+    def __init__(self, job_id, user_id, factory, info=None):
+        self.id = job_id
+        self.user_id = user_id
+        self.factory = factory # async-функция, принимающая SearchJob и выполняющая поиск
+        self.info = info or {} # Параметры поиска для показа пользователю
+        self.status = "queued" # queued, running, done, cancelled
+        self.enqueued_at = time.monotonic()
+        self.task = None
+        self.token = CancellationToken()
+        self.progress = ProgressCounters("total_links", "processed", "skipped", "deals")
+        self.stats_message_id = None # Сообщение со статистикой, которое редактируется при повторных запросах
+
+class JobScheduler:
+    """Справедливая ограниченная очередь поисков (все методы вызываются из цикла событий бота)."""
+
+    def __init__(self, max_running=SCHEDULER_MAX_RUNNING_JOBS, per_user_limit=SCHEDULER_PER_USER_LIMIT,
+                 max_queued_per_user=SCHEDULER_MAX_QUEUED_PER_USER, max_queued_total=SCHEDULER_MAX_QUEUED_TOTAL):
+        self.max_running = max(1, max_running)
+        self.per_user_limit = max(1, per_user_limit)
+        self.max_queued_per_user = max_queued_per_user
+        self.max_queued_total = max_queued_total
+        self._queues = OrderedDict() # пользователь -> очередь его поисков; порядок словаря = порядок обхода
+        self._running = {} # пользователь -> число выполняемых поисков
+        self._jobs = {}
+        self._ids = itertools.count(1)
+
+    @property
+    def running_count(self):
+        return sum(self._running.values())
+
+    @property
+    def queued_count(self):
+        return sum(len(user_queue) for user_queue in self._queues.values())
+
+    def submit(self, user_id, factory, info=None):
+        """Ставит поиск в очередь и сразу запускает, если есть место; SchedulerFull, если места в очереди нет."""
+        user_queued = len(self._queues.get(user_id, ()))
+        if self._running.get(user_id, 0) + user_queued >= self.per_user_limit + self.max_queued_per_user:
+            raise SchedulerFull("user")
+        if self.queued_count >= self.max_queued_total and self.running_count >= self.max_running:
+            raise SchedulerFull("total")
+        job = SearchJob(next(self._ids), user_id, factory, info)
+        self._jobs[job.id] = job
+        self._queues.setdefault(user_id, deque()).append(job)
+        self._dispatch()
+        return job
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def active_job(self, user_id):
+        """Выполняющийся поиск пользователя, иначе первый ожидающий; None, если поисков нет."""
+        user_jobs = [job for job in self._jobs.values() if job.user_id == user_id]
+        running = [job for job in user_jobs if job.status == "running"]
+        return (running or user_jobs or [None])[0]
+
+    def position(self, job_id):
+        """Место в очереди (1 — следующий); 0 — поиск уже выполняется или не найден.
+
+        Считается по порядку кругового обхода: k-й поиск пользователя стартует в k-м круге.
+        """
+        job = self._jobs.get(job_id)
+        if not job or job.status != "queued":
+            return 0
+        user_order = list(self._queues)
+        job_round = self._queues[job.user_id].index(job)
+        job_user_index = user_order.index(job.user_id)
+        ahead = 0
+        for user_index, user_id in enumerate(user_order):
+            # Поиски из предыдущих кругов, а из текущего — только у пользователей раньше в порядке обхода
+            ahead += min(len(self._queues[user_id]), job_round + (1 if user_index < job_user_index else 0))
+        return ahead + 1
+
+    def cancel(self, job_id):
+        """Ожидающий поиск убирает из очереди ("dequeued"), выполняющемуся отменяет токен ("cancelling").
+
+        None, если такого поиска нет.
+        """
+        job = self._jobs.get(job_id)
+        if not job:
+            return None
+        if job.status == "running":
+            job.token.cancel()
+            return "cancelling"
+        user_queue = self._queues[job.user_id]
+        user_queue.remove(job)
+        if not user_queue:
+            del self._queues[job.user_id]
+        job.status = "cancelled"
+        del self._jobs[job_id]
+        log_info(f"Поиск #{job.id} пользователя {job.user_id} убран из очереди.")
+        return "dequeued"
+
+    def _next_job(self):
+        for user_id in list(self._queues):
+            if self._running.get(user_id, 0) >= self.per_user_limit:
+                continue
+            # Обслуженный пользователь уходит в конец круга
+            user_queue = self._queues.pop(user_id)
+            job = user_queue.popleft()
+            if user_queue:
+                self._queues[user_id] = user_queue
+            return job
+        return None
+
+    def _dispatch(self):
+        while self.running_count < self.max_running:
+            job = self._next_job()
+            if not job:
+                return
+            job.status = "running"
+            self._running[job.user_id] = self._running.get(job.user_id, 0) + 1
+            log_info(f"Запускаю поиск #{job.id} пользователя {job.user_id} после {time.monotonic() - job.enqueued_at:.1f} с в очереди "
+                     f"(выполняется {self.running_count}, в очереди {self.queued_count}).")
+            job.task = asyncio.create_task(self._run(job))
+
+    async def _run(self, job):
+        try:
+            await job.factory(job)
+        except Exception as e:
+            log_error(f"Ошибка в поиске #{job.id} пользователя {job.user_id}: {type(e).__name__} - {e}")
+        finally:
+            job.status = "done"
+            self._running[job.user_id] -= 1
+            if not self._running[job.user_id]:
+                del self._running[job.user_id]
+            self._jobs.pop(job.id, None)
+            self._dispatch()
+
+_scheduler = None
+
+def get_job_scheduler():
+    """Общая очередь поисков бота."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = JobScheduler()
+    return _scheduler
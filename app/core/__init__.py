@@ -1,4 +1,16 @@
 from .parser import *
 from .filters import *
 from .utils import *
-from .config import * 
\ No newline at end of file
+from .config import *
+from .chromedriver import *
+from .fetcher import *
+from .snapshots import *
+from .html_backend import *
+from .extraction import *
+from .cache import *
+from .storage import *
+from .dataset import *
+from .analytics import *
+from .throttle import *
+from .proxies import *
+from .jobs import *
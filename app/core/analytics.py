@@ -0,0 +1,84 @@
+from .config import DATASET_DIR
+from .dataset import require_pyarrow
+
+try:
+    import pyarrow as pa
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+except ImportError: # Необязательная зависимость, см. dataset.py
+    pa = None
+
+# Аналитика по выгрузке в Parquet (см. dataset.py): все вычисления — векторные операции pyarrow
+# над целыми столбцами, без обхода строк в Python, поэтому миллионы наблюдений считаются за один проход.
+
+def load_products(root=DATASET_DIR, since_date=None, until_date=None, query=None, columns=None):
+    """Читает выгрузку в pyarrow.Table; фильтры по разделам (дата "ГГГГ-ММ-ДД", запрос) отсекают лишние файлы целиком."""
+    require_pyarrow()
+    dataset = ds.dataset(root, format="parquet", partitioning="hive")
+    condition = None
+    for expression in (
+        ds.field("date") >= since_date if since_date else None,
+        ds.field("date") <= until_date if until_date else None,
+        ds.field("query") == query if query is not None else None
+    ):
+        if expression is not None:
+            condition = expression if condition is None else condition & expression
+    return dataset.to_table(columns=columns, filter=condition)
+
+def deal_mask(table, user_min_price=None, user_max_price=None):
+    """Векторный аналог filters.is_matching_deal: булев столбец "скидка за отзыв больше цены и цена в диапазоне"."""
+    require_pyarrow()
+    current_price = pc.fill_null(table["current_price"], 0.0)
+    feedback_discount = pc.fill_null(table["feedback_discount"], 0.0)
+    mask = pc.and_(pc.greater(feedback_discount, current_price), pc.greater(current_price, 0.0))
+    if user_min_price is not None:
+        mask = pc.and_(mask, pc.greater_equal(current_price, user_min_price))
+    if user_max_price is not None:
+        mask = pc.and_(mask, pc.less_equal(current_price, user_max_price))
+    return mask
+
+def with_deal_columns(table, user_min_price=None, user_max_price=None):
+    """Добавляет is_deal, feedback_margin (скидка за отзыв минус цена), discount_ratio (скидка от старой цены)
+    и second_price_delta (обычная цена минус текущая)."""
+    require_pyarrow()
+    current_price = pc.fill_null(table["current_price"], 0.0)
+    original_price = table["original_price"]
+    has_original = pc.greater(pc.fill_null(original_price, 0.0), 0.0)
+    discount_ratio = pc.if_else(has_original, pc.subtract(1.0, pc.divide(current_price, original_price)), None)
+    second_price = table["second_price"]
+    has_second = pc.greater(pc.fill_null(second_price, 0.0), 0.0) # 0.0 — второй цены на странице не было
+    second_price_delta = pc.if_else(has_second, pc.subtract(second_price, current_price), None)
+    return (table
+            .append_column("is_deal", deal_mask(table, user_min_price, user_max_price))
+            .append_column("feedback_margin", pc.subtract(pc.fill_null(table["feedback_discount"], 0.0), current_price))
+            .append_column("discount_ratio", discount_ratio)
+            .append_column("second_price_delta", second_price_delta))
+
+def deal_summary(table, by=("date", "query"), user_min_price=None, user_max_price=None):
+    """Доля выгодных предложений и средние разницы цен по группам (по умолчанию — по разделам выгрузки)."""
+    require_pyarrow()
+    enriched = with_deal_columns(table, user_min_price, user_max_price)
+    enriched = enriched.append_column("deal_count", pc.cast(enriched["is_deal"], pa.int64()))
+    summary = enriched.group_by(list(by)).aggregate([
+        ("article", "count"),
+        ("article", "count_distinct"),
+        ("deal_count", "sum"),
+        ("feedback_margin", "mean"),
+        ("discount_ratio", "mean"),
+        ("second_price_delta", "mean")
+    ])
+    deal_ratio = pc.divide(pc.cast(summary["deal_count_sum"], pa.float64()), pc.cast(summary["article_count"], pa.float64()))
+    return summary.append_column("deal_ratio", deal_ratio)
+
+def price_changes(table):
+    """По каждому артикулу: первая и последняя наблюдавшаяся цена, минимум, максимум и изменение цены."""
+    require_pyarrow()
+    ordered = table.select(["article", "observed_at", "current_price"]).sort_by([("article", "ascending"), ("observed_at", "ascending")])
+    changes = ordered.group_by("article", use_threads=False).aggregate([
+        ("current_price", "first"),
+        ("current_price", "last"),
+        ("current_price", "min"),
+        ("current_price", "max"),
+        ("current_price", "count")
+    ])
+    return changes.append_column("price_delta", pc.subtract(changes["current_price_last"], changes["current_price_first"]))
@@ -0,0 +1,70 @@
+import argparse
+import logging
+import sys
+import time
+from .config import BENCHMARK_CORPUS_DIR
+from .html_backend import available_backends, check_backend_parity
+from .utils import general_logger
+
+# Проверка, что все HTML-движки дают одинаковый результат разбора на сохраненных страницах:
+#   python -m app.core.backend_parity                 # весь корпус бенчмарка (app/data/corpus/v1), карточки и выдача
+#   python -m app.core.backend_parity app/data/debug_wb.html --url https://www.wildberries.ru/catalog/28970360/detail.aspx
+# Код возврата 1 — хотя бы одно поле разошлось с первым движком, 2 — сравнивать не с чем (доступен один движок).
+
+def _diff_results(reference, result):
+    return {field: (reference.get(field), result.get(field))
+            for field in set(reference) | set(result)
+            if reference.get(field) != result.get(field)}
+
+def check_corpus_parity(corpus_dir, backends):
+    """Разбирает каждую страницу корпуса всеми движками; возвращает [(страница, время, расхождения с первым движком)]."""
+    from .benchmark import extract_page, load_corpus # Локальный импорт: benchmark тянет parser и метрики
+    _, pages = load_corpus(corpus_dir)
+    report = []
+    for page, page_source in pages:
+        results, timings = {}, {}
+        for backend in backends:
+            started = time.perf_counter()
+            results[backend] = extract_page(page, page_source, backend)
+            timings[backend] = time.perf_counter() - started
+        reference = results[backends[0]]
+        mismatches = {backend: diff for backend in backends[1:] if (diff := _diff_results(reference, results[backend]))}
+        report.append((page, timings, mismatches))
+    return report
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Сравнение HTML-движков на сохраненных страницах")
+    arg_parser.add_argument('pages', nargs='*', help='HTML-файлы карточек товаров (по умолчанию — корпус бенчмарка)')
+    arg_parser.add_argument('--corpus', type=str, default=BENCHMARK_CORPUS_DIR, help='Каталог корпуса с manifest.json')
+    arg_parser.add_argument('--url', type=str, default='https://www.wildberries.ru/catalog/0/detail.aspx', help='URL, от которого считаются относительные ссылки')
+    arg_parser.add_argument('--backends', type=str, default=None, help='Движки через запятую (по умолчанию все доступные)')
+    args = arg_parser.parse_args(argv)
+    general_logger.setLevel(logging.ERROR) # Капча и пустые карточки в корпусе — ожидаемые предупреждения разбора
+
+    backends = args.backends.split(',') if args.backends else available_backends()
+    if len(backends) < 2:
+        print(f"Для сравнения нужно хотя бы два движка, а есть только: {', '.join(backends)}. Установи lxml (pip install -r requirements.txt).")
+        return 2
+    if args.pages:
+        report = []
+        for page_path in args.pages:
+            with open(page_path, 'r', encoding='utf-8') as f:
+                page_source = f.read()
+            _, timings, mismatches = check_backend_parity(page_source, args.url, backends)
+            report.append(({"id": page_path}, timings, mismatches))
+    else:
+        report = check_corpus_parity(args.corpus, backends)
+
+    failed = False
+    for page, timings, mismatches in report:
+        timings_text = ", ".join(f"{backend}: {seconds * 1000:.1f} мс" for backend, seconds in timings.items())
+        print(f"{page['id']}: {timings_text}")
+        for backend, diff in mismatches.items():
+            failed = True
+            for field, (expected, actual) in diff.items():
+                print(f"  РАСХОЖДЕНИЕ {backend}.{field}: {expected!r} != {actual!r}")
+    print("Расхождения найдены." if failed else f"Движки {', '.join(backends)} дают одинаковый результат.")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import time
+from .config import BENCHMARK_CORPUS_DIR, BENCHMARK_BASELINE_PATH, BENCHMARK_REPEAT, BENCHMARK_MAX_REGRESSION
+from .html_backend import resolve_backend
+from .metrics import MetricsRegistry, STAGE_SECONDS, use_metrics
+from .parser import parse_product_html, extract_search_cards, extract_results_count
+from .utils import general_logger
+
+# Офлайн-бенчмарк извлечения по версионированному корпусу сохраненных страниц (без браузера и сети):
+#   python -m app.core.benchmark                      # прогон, проверка ожидаемых полей, сравнение с базой
+#   python -m app.core.benchmark --save-baseline      # записать замеры этой машины как базу
+# Код возврата 1 — поле не совпало с ожидаемым или проход корпуса стал медленнее базы больше чем на --max-regression.
+
+FLOAT_TOLERANCE = 0.01
+
+def load_corpus(corpus_dir):
+    """Манифест корпуса и HTML его страниц (файлы .gz распаковываются)."""
+    with open(os.path.join(corpus_dir, "manifest.json"), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    pages = []
+    for page in manifest["pages"]:
+        path = os.path.join(corpus_dir, page["file"])
+        opener = gzip.open if path.endswith(".gz") else open
+        with opener(path, 'rt', encoding='utf-8') as f:
+            pages.append((page, f.read()))
+    return manifest, pages
+
+def extract_page(page, page_source, backend=None):
+    """Разбор страницы корпуса так же, как в рабочем коде: карточка товара или страница выдачи."""
+    if page["kind"] == "search":
+        cards = extract_search_cards(page_source, backend)
+        return {
+            "cards_count": len(cards),
+            "results_count": extract_results_count(page_source),
+            "cards_with_price": sum(1 for card in cards if card["card_price"]),
+            "cards_with_feedback": sum(1 for card in cards if card["card_feedback_discount"]),
+            "first_article": cards[0]["article"] if cards else None,
+        }
+    data = parse_product_html(page_source, page["url"], backend=backend)
+    data["images_count"] = len(data.get("images") or [])
+    return data
+
+def check_expected(expected, actual):
+    """Поля, не совпавшие с ожидаемыми: {поле: (ожидалось, получено)}."""
+    mismatches = {}
+    for field, expected_value in expected.items():
+        actual_value = actual.get(field)
+        if isinstance(expected_value, float) and isinstance(actual_value, (int, float)):
+            matched = abs(actual_value - expected_value) <= FLOAT_TOLERANCE
+        else:
+            matched = actual_value == expected_value
+        if not matched:
+            mismatches[field] = (expected_value, actual_value)
+    return mismatches
+
+def benchmark_page(page, page_source, repeat, backend=None):
+    """Медиана и p95 времени разбора страницы и среднее время извлечения каждого поля на один прогон."""
+    # Поля замеряются тем же таймером, что и в рабочем коде
+    with use_metrics(MetricsRegistry(enabled=True)) as registry:
+        result = extract_page(page, page_source, backend) # Прогрев: ленивые импорты и компиляция селекторов
+        registry.reset()
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            extract_page(page, page_source, backend)
+            timings.append(time.perf_counter() - started)
+    field_timings = {labels["field"]: total / repeat
+                     for labels, _, total in registry.histograms(STAGE_SECONDS) if labels.get("stage") == "field"}
+    timings.sort()
+    return {
+        "median": statistics.median(timings),
+        "p95": timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        "fields": field_timings,
+    }, result
+
+def load_baseline(path):
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_baseline(path, corpus_version, backend, report):
+    baseline = {
+        "corpus_version": corpus_version,
+        "backend": backend,
+        "python": platform.python_version(),
+        "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "pages": {page_id: {"median": stats["median"]} for page_id, stats in report.items()},
+    }
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(baseline, f, ensure_ascii=False, indent=2)
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Офлайн-бенчмарк извлечения по корпусу сохраненных страниц")
+    arg_parser.add_argument('--corpus', type=str, default=BENCHMARK_CORPUS_DIR, help='Каталог корпуса с manifest.json')
+    arg_parser.add_argument('--repeat', type=int, default=BENCHMARK_REPEAT, help='Прогонов каждой страницы')
+    arg_parser.add_argument('--backend', type=str, default=None, help='HTML-движок (по умолчанию HTML_PARSER_BACKEND)')
+    arg_parser.add_argument('--baseline', type=str, default=BENCHMARK_BASELINE_PATH, help='Файл базовых замеров')
+    arg_parser.add_argument('--save-baseline', action='store_true', help='Сохранить замеры как базу вместо сравнения')
+    arg_parser.add_argument('--max-regression', type=float, default=BENCHMARK_MAX_REGRESSION, help='Допустимое замедление прохода корпуса (доля)')
+    arg_parser.add_argument('--fields', action='store_true', help='Показать время извлечения каждого поля')
+    args = arg_parser.parse_args(argv)
+    # Предупреждения о капче и распроданных товарах на страницах корпуса ожидаемы и повторяются на каждом прогоне
+    general_logger.setLevel(logging.ERROR)
+
+    manifest, pages = load_corpus(args.corpus)
+    backend = resolve_backend(args.backend)
+    repeat = max(1, args.repeat)
+    print(f"Корпус v{manifest['version']} ({len(pages)} стр.), движок {backend}, прогонов на страницу: {repeat}")
+
+    failed = False
+    report = {}
+    for page, page_source in pages:
+        stats, result = benchmark_page(page, page_source, repeat, backend)
+        report[page["id"]] = stats
+        mismatches = check_expected(page.get("expected", {}), result)
+        verdict = "OK" if not mismatches else "FAIL"
+        print(f"{page['id']:<28} {stats['median'] * 1000:8.2f} мс (p95 {stats['p95'] * 1000:.2f} мс)  поля: {verdict}")
+        for field, (expected_value, actual_value) in mismatches.items():
+            failed = True
+            print(f"  НЕ СОВПАЛО {field}: ожидалось {expected_value!r}, получено {actual_value!r}")
+        if args.fields:
+            for field, seconds in sorted(stats["fields"].items(), key=lambda item: -item[1]):
+                print(f"    {field:<24} {seconds * 1_000_000:9.1f} мкс")
+
+    total_seconds = sum(stats["median"] for stats in report.values())
+    print(f"Итого: {total_seconds * 1000:.2f} мс на проход корпуса, {len(report) / total_seconds:.1f} стр./с")
+
+    if args.save_baseline:
+        save_baseline(args.baseline, manifest["version"], backend, report)
+        print(f"База сохранена в {args.baseline}")
+        return 1 if failed else 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print(f"Базы {args.baseline} нет, сравнение пропущено (создать: --save-baseline).")
+    elif baseline.get("corpus_version") != manifest["version"] or baseline.get("backend") != backend:
+        print(f"База снята на другом корпусе или движке (v{baseline.get('corpus_version')}, {baseline.get('backend')}), сравнение пропущено.")
+    else:
+        # Страницы в доли миллисекунды шумят сильнее порога, поэтому по отдельным страницам только предупреждаем,
+        # а падаем по времени прохода всего корпуса (то есть по пропускной способности)
+        for page_id, stats in report.items():
+            base_stats = baseline["pages"].get(page_id)
+            if not base_stats:
+                continue
+            change = stats["median"] / base_stats["median"] - 1
+            if change > args.max_regression:
+                print(f"  медленнее базы {page_id}: {base_stats['median'] * 1000:.2f} -> {stats['median'] * 1000:.2f} мс ({change:+.0%})")
+        base_total = sum(stats["median"] for page_id, stats in baseline["pages"].items() if page_id in report)
+        compared_total = sum(stats["median"] for page_id, stats in report.items() if page_id in baseline["pages"])
+        if base_total:
+            total_change = compared_total / base_total - 1
+            print(f"Относительно базы: {total_change:+.1%} ко времени прохода корпуса")
+            if total_change > args.max_regression:
+                failed = True
+                print(f"РЕГРЕССИЯ: проход корпуса медленнее базы больше чем на {args.max_regression:.0%}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,180 @@
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from .config import (PRODUCT_CACHE_TTL, PRODUCT_CACHE_MEMORY_ITEMS, PRODUCT_CACHE_DIR, PRODUCT_CACHE_DISK_ITEMS,
+                     PRODUCT_CACHE_PRUNE_EVERY)
+from .utils import log_info, log_warning
+
+# Кэш результатов parse_product по артикулу: LRU в памяти + JSON-файлы на диске, общий TTL.
+# Одновременные запросы одного артикула ждут один общий разбор (single-flight).
+
+def is_cacheable_product(data):
+    """Кэшируем только полноценно разобранные карточки, статусы ошибок не кэшируем."""
+    return bool(data) and not data.get("status") and bool(data.get("product_name"))
+
+class ProductCache:
+    """Двухуровневый кэш карточек товаров с TTL и объединением одновременных запросов."""
+
+    def __init__(self, ttl=PRODUCT_CACHE_TTL, max_memory_items=PRODUCT_CACHE_MEMORY_ITEMS,
+                 cache_dir=PRODUCT_CACHE_DIR, max_disk_items=PRODUCT_CACHE_DISK_ITEMS):
+        self.ttl = ttl
+        self.max_memory_items = max_memory_items
+        self.cache_dir = cache_dir
+        self.max_disk_items = max_disk_items
+        self._memory = OrderedDict() # артикул -> (время сохранения, данные)
+        self._inflight = {} # артикул -> Future текущего разбора
+        self._lock = threading.Lock()
+        self._writes_since_prune = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _disk_path(self, article):
+        # Раскладываем по подкаталогам, чтобы не держать десятки тысяч файлов в одной папке
+        return os.path.join(self.cache_dir, article[-2:], f"{article}.json")
+
+    def _read_disk(self, article):
+        if not self.cache_dir:
+            return None
+        try:
+            with open(self._disk_path(article), 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            return entry["stored_at"], entry["data"]
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            log_warning(f"Поврежденная запись кэша для артикула {article}: {e}")
+            return None
+
+    def _write_disk(self, article, stored_at, data):
+        if not self.cache_dir:
+            return
+        path = self._disk_path(article)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({"stored_at": stored_at, "data": data}, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            log_warning(f"Не удалось записать кэш для артикула {article}: {e}")
+
+    def _is_fresh(self, stored_at):
+        return time.time() - stored_at < self.ttl
+
+    def get(self, article):
+        """Свежие данные по артикулу (копия) или None."""
+        with self._lock:
+            entry = self._memory.get(article)
+            if entry and self._is_fresh(entry[0]):
+                self._memory.move_to_end(article)
+                self.hits += 1
+                return copy.deepcopy(entry[1])
+            if entry:
+                del self._memory[article]
+        disk_entry = self._read_disk(article)
+        with self._lock:
+            if disk_entry and self._is_fresh(disk_entry[0]):
+                self._remember(article, disk_entry[0], disk_entry[1])
+                self.hits += 1
+                return copy.deepcopy(disk_entry[1])
+            self.misses += 1
+        return None
+
+    def _remember(self, article, stored_at, data):
+        self._memory[article] = (stored_at, data)
+        self._memory.move_to_end(article)
+        while len(self._memory) > self.max_memory_items:
+            self._memory.popitem(last=False)
+
+    def put(self, article, data):
+        stored_at = time.time()
+        data = copy.deepcopy(data)
+        with self._lock:
+            self._remember(article, stored_at, data)
+            self._writes_since_prune += 1
+            need_prune = self._writes_since_prune >= PRODUCT_CACHE_PRUNE_EVERY
+            if need_prune:
+                self._writes_since_prune = 0
+        self._write_disk(article, stored_at, data)
+        if need_prune:
+            self.prune_disk()
+
+    def get_or_load(self, article, loader):
+        """Данные из кэша, иначе loader(); одновременные вызовы с одним артикулом ждут один loader.
+
+        Если загрузку лидера отменила его задача (статус "cancelled"), ожидающие не получают этот результат,
+        а загружают товар заново сами.
+        """
+        while True:
+            cached = self.get(article)
+            if cached is not None:
+                return cached
+            with self._lock:
+                future = self._inflight.get(article)
+                is_leader = future is None
+                if is_leader:
+                    future = Future()
+                    self._inflight[article] = future
+            if is_leader:
+                break
+            data = future.result()
+            if not (data and data.get("status") == "cancelled"):
+                return copy.deepcopy(data)
+        try:
+            data = loader()
+            if is_cacheable_product(data):
+                self.put(article, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(article, None)
+
+    def prune_disk(self):
+        """Удаляет просроченные записи и самые старые сверх max_disk_items."""
+        entries = []
+        try:
+            for shard in os.scandir(self.cache_dir):
+                if not shard.is_dir():
+                    continue
+                for entry in os.scandir(shard.path):
+                    if entry.name.endswith(".json"):
+                        entries.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:
+            return 0
+        entries.sort()
+        expire_before = time.time() - self.ttl
+        removed = 0
+        for index, (mtime, path) in enumerate(entries):
+            if mtime >= expire_before and len(entries) - index <= self.max_disk_items:
+                break
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+        if removed:
+            log_info(f"Кэш карточек: удалено {removed} устаревших записей с диска.")
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+
+_product_cache = None
+_product_cache_lock = threading.Lock()
+
+def get_product_cache():
+    """Общий для процесса кэш карточек."""
+    global _product_cache
+    with _product_cache_lock:
+        if _product_cache is None:
+            _product_cache = ProductCache()
+        return _product_cache
@@ -0,0 +1,113 @@
+import json
+import os
+import socket
+import threading
+import time
+from .config import CHROMEDRIVER_CACHE_FILE, CHROMEDRIVER_PATH, CHROMEDRIVER_OFFLINE
+from .utils import log_info, log_warning, log_error
+
+# Кэш пути к chromedriver и версии Chrome.
+# Файл общий, записи разделены по имени хоста, чтобы каталог app/data можно было шарить между машинами.
+
+_cache_lock = threading.Lock()
+_memory_entry = None
+
+if CHROMEDRIVER_OFFLINE:
+    # Selenium Manager (фолбек без явного пути) тоже не должен ходить в сеть
+    os.environ.setdefault("SE_OFFLINE", "true")
+
+def _host_key():
+    return socket.gethostname() or "localhost"
+
+def _load_cache_file():
+    try:
+        with open(CHROMEDRIVER_CACHE_FILE, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return data if isinstance(data, dict) else {}
+    except FileNotFoundError:
+        return {}
+    except Exception as e:
+        log_warning(f"Не удалось прочитать кэш chromedriver {CHROMEDRIVER_CACHE_FILE}: {e}")
+        return {}
+
+def _save_cache_entry(entry):
+    data = _load_cache_file()
+    if entry is None:
+        data.pop(_host_key(), None)
+    else:
+        data[_host_key()] = entry
+    try:
+        os.makedirs(os.path.dirname(CHROMEDRIVER_CACHE_FILE) or '.', exist_ok=True)
+        tmp_path = CHROMEDRIVER_CACHE_FILE + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, CHROMEDRIVER_CACHE_FILE)
+    except Exception as e:
+        log_warning(f"Не удалось сохранить кэш chromedriver: {e}")
+
+def resolve_chromedriver_path(refresh=False):
+    """Возвращает путь к chromedriver: из явной настройки, из кэша или через ChromeDriverManager.
+
+    None означает, что путь неизвестен и Selenium должен найти драйвер сам (PATH / Selenium Manager).
+    """
+    global _memory_entry
+    if CHROMEDRIVER_PATH:
+        return CHROMEDRIVER_PATH
+
+    with _cache_lock:
+        if not refresh:
+            entry = _memory_entry or _load_cache_file().get(_host_key())
+            if entry and entry.get("driver_path") and os.path.isfile(entry["driver_path"]):
+                _memory_entry = entry
+                return entry["driver_path"]
+
+        if CHROMEDRIVER_OFFLINE:
+            log_warning("Офлайн-режим: в кэше нет рабочего chromedriver, используем chromedriver из PATH.")
+            return None
+
+        try:
+            from webdriver_manager.chrome import ChromeDriverManager
+            started = time.perf_counter()
+            driver_path = ChromeDriverManager().install()
+            log_info(f"chromedriver получен через ChromeDriverManager за {time.perf_counter() - started:.2f} с: {driver_path}")
+        except Exception as e:
+            log_error(f"Ошибка ChromeDriverManager: {e}")
+            return None
+
+        _memory_entry = {
+            "driver_path": driver_path,
+            "chrome_version": (_memory_entry or {}).get("chrome_version"),
+            "resolved_at": int(time.time())
+        }
+        _save_cache_entry(_memory_entry)
+        return driver_path
+
+def remember_chrome_version(driver):
+    """Запоминает версию Chrome, с которой реально запустился закэшированный chromedriver."""
+    global _memory_entry
+    try:
+        version = driver.capabilities.get("browserVersion")
+    except Exception:
+        return
+    with _cache_lock:
+        if not _memory_entry or not version or _memory_entry.get("chrome_version") == version:
+            return
+        if _memory_entry.get("chrome_version"):
+            log_info(f"Версия Chrome изменилась: {_memory_entry['chrome_version']} -> {version}")
+        _memory_entry = dict(_memory_entry, chrome_version=version)
+        _save_cache_entry(_memory_entry)
+
+def invalidate_chromedriver_cache():
+    """Сбрасывает кэш, например, если закэшированный chromedriver не подошел к обновившемуся Chrome."""
+    global _memory_entry
+    with _cache_lock:
+        _memory_entry = None
+        _save_cache_entry(None)
+
+# "This version of ChromeDriver only supports Chrome version 114 / Current browser version is 120..."
+VERSION_MISMATCH_MARKERS = ("only supports chrome version", "current browser version")
+
+def is_chromedriver_version_mismatch(error):
+    """Ошибка запуска из-за того, что chromedriver не подходит к установленному Chrome (а не разовый сбой браузера)."""
+    message = str(error).lower()
+    return any(marker in message for marker in VERSION_MISMATCH_MARKERS)
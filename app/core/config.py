@@ -1,5 +1,7 @@
 # ... существующий код config.py ... 
 
+import os
+
 DEFAULT_SEARCH_QUERY = "маска для волос"
 DEFAULT_MAX_PAGES = 2
 DEFAULT_MIN_RATING = 0.0
@@ -8,8 +10,155 @@ DEFAULT_MIN_PRICE = 0.0
 DEFAULT_MAX_PRICE = 100000.0
 DEFAULT_CATEGORY_URL = None  # Можно указать ссылку на категорию
 
+# Адрес Wildberries; для нагрузочных прогонов сюда указывается локальная заглушка (python -m app.core.mock_wb)
+WB_BASE_URL = os.getenv("WB_BASE_URL", "https://www.wildberries.ru/").rstrip("/") + "/"
+
 # Список прокси в формате "ip:port" или "user:pass@ip:port"
 PROXY_LIST = [
     # "login:password@123.45.67.89:8080",
     # "123.45.67.89:8000"
-] 
\ No newline at end of file
+] 
+# Пул заранее запущенных драйверов Chrome, общий для бота и поиска выгодных товаров
+DRIVER_POOL_SIZE = 3  # Максимальное число одновременно запущенных браузеров
+DRIVER_POOL_ACQUIRE_TIMEOUT = 120  # Сколько секунд ждать свободный драйвер
+DRIVER_POOL_MAX_USES = 200  # После стольких выдач драйвер перезапускается (утечки памяти Chrome)
+
+# Кэш пути к chromedriver: ChromeDriverManager вызывается один раз на хост, а не при каждом запуске браузера
+CHROMEDRIVER_CACHE_FILE = 'app/data/chromedriver_cache.json'
+CHROMEDRIVER_PATH = os.getenv("WB_CHROMEDRIVER_PATH") # Явный путь к chromedriver, отключает поиск и кэш
+CHROMEDRIVER_OFFLINE = os.getenv("WB_CHROMEDRIVER_OFFLINE", "0") == "1" # Без сети: только кэш или chromedriver из PATH
+
+# Сколько товаров /find_deals парсит одновременно (каждый поток занимает драйвер из пула)
+FIND_DEALS_WORKERS = 3
+# Сколько товаров CLI парсит одновременно в пакетном режиме (--urls-file/--query)
+CLI_BATCH_WORKERS = 4
+# Сколько страниц выдачи грузится одновременно (дополнительные драйверы берутся из пула, если свободны)
+SEARCH_PAGE_WORKERS = 2
+# Отсев товаров по цене и бейджу "рубли за отзыв" прямо в выдаче, до открытия карточки
+CARD_PREFILTER_ENABLED = True
+CARD_PREFILTER_SLACK = 0.15  # Запас на расхождение цены в выдаче и на странице товара (доля)
+
+# Быстрая загрузка карточек обычным HTTP-запросом; браузер используется как фолбек
+HTTP_FETCH_ENABLED = True
+HTTP_FETCH_TIMEOUT = 10  # Таймаут HTTP-запроса, секунды
+HTTP_POOL_CONNECTIONS = 4  # Сколько хостов держим в пуле соединений
+HTTP_POOL_MAXSIZE = 16  # Keep-alive соединений на один хост
+HTTP_REQUIRED_FIELDS = ("product_name", "current_price")  # Без этих полей идем в браузер
+
+# Ожидание готовности карточки товара в браузере
+PRODUCT_PAGE_WAIT_TIMEOUT = 10  # Максимум секунд ожидания цены, пометки "нет в наличии" или капчи
+PRODUCT_PAGE_POLITENESS_DELAY = (0.0, 0.0)  # Необязательная случайная пауза перед загрузкой, (мин, макс) секунд
+
+# Снимки HTML проблемных страниц (вместо перезаписи debug_wb.html на каждом товаре)
+SNAPSHOTS_ENABLED = False  # Включается явно, по умолчанию диск не трогаем
+SNAPSHOT_DIR = 'app/data/snapshots'
+SNAPSHOT_FAILURE_STATUSES = ("captcha_detected", "essential_data_missing", "product_unavailable")
+SNAPSHOT_SAMPLE_RATE = 0.0  # Доля успешно разобранных страниц, которые тоже сохраняются (0.0 - 1.0)
+SNAPSHOT_MAX_FILES = 500
+SNAPSHOT_MAX_BYTES = 100 * 1024 * 1024  # Суммарный размер снимков на диске
+
+# Движок разбора HTML для BeautifulSoup: "lxml" (быстрый), "html.parser" (встроенный), "html5lib"
+HTML_PARSER_BACKEND = "lxml"
+# Предупреждение о смене самого частого селектора поля (признак смены верстки WB)
+SELECTOR_LEADER_MARGIN = 0.2  # Новый лидер должен обогнать прежнего на эту долю попаданий: чередование верстки не шумит
+SELECTOR_WARNING_INTERVAL = 10 * 60  # Не чаще одного предупреждения на поле за столько секунд
+
+# Кэш разобранных карточек по артикулу (память + диск)
+PRODUCT_CACHE_ENABLED = True
+PRODUCT_CACHE_TTL = 15 * 60  # Секунд, пока цена считается актуальной
+PRODUCT_CACHE_MEMORY_ITEMS = 2000  # Размер LRU в памяти
+PRODUCT_CACHE_DIR = 'app/data/product_cache'  # None - только память
+PRODUCT_CACHE_DISK_ITEMS = 50000  # Максимум записей на диске
+PRODUCT_CACHE_PRUNE_EVERY = 500  # Чистить диск раз в столько записей
+
+# Хранилище товаров и истории цен (SQLite)
+PRODUCT_DB_ENABLED = True
+PRODUCT_DB_PATH = os.getenv("WB_PRODUCT_DB_PATH", 'app/data/products.sqlite3')  # Для прогонов на заглушке — отдельный файл
+PRODUCT_DB_BATCH_SIZE = 50  # Наблюдений в одной транзакции
+PRODUCT_DB_FLUSH_INTERVAL = 30  # Не держать наблюдения в буфере дольше стольких секунд
+
+# Колоночная выгрузка карточек в Parquet (нужен pyarrow), разделы по дню и запросу
+DATASET_ENABLED = False  # Выгружать результаты /find_deals; CLI выгружает по флагу --out-parquet
+DATASET_DIR = 'app/data/dataset'
+DATASET_ROWS_PER_FILE = 5000  # Строк в одном файле раздела
+
+# Общий ограничитель частоты загрузок страниц WB и пауза при всплеске капч
+THROTTLE_ENABLED = True
+THROTTLE_RATE = 2.0  # Загрузок в секунду в среднем на весь процесс
+THROTTLE_BURST = 4  # Сколько загрузок можно сделать подряд без ожидания
+THROTTLE_MIN_RATE = 0.2  # Ниже этого темп после капч не снижается
+THROTTLE_RECOVERY_STEP = 0.05  # На столько загрузок в секунду темп растет после каждой загрузки без капчи
+CAPTCHA_WINDOW = 20  # По скольким последним загрузкам считается доля капч
+CAPTCHA_MIN_SAMPLES = 5  # Минимум загрузок в окне, чтобы принимать решение
+CAPTCHA_RATE_THRESHOLD = 0.3  # Доля капч, при которой загрузки приостанавливаются
+CAPTCHA_BACKOFF_BASE = 30  # Первая пауза, секунды; каждое следующее срабатывание подряд удваивает ее
+CAPTCHA_BACKOFF_MAX = 600
+CAPTCHA_PROBE_TIMEOUT = 60  # Если пробная загрузка не сообщила результат за столько секунд, пускаем следующую
+
+# Оценка прокси из PROXY_LIST: плохие выводятся из ротации, нагрузка распределяется по здоровым
+PROXY_EWMA_ALPHA = 0.2  # Вес новой загрузки в скользящих средних задержки, ошибок и капч
+PROXY_MIN_SAMPLES = 5  # Сколько загрузок нужно, прежде чем выводить прокси из ротации
+PROXY_MAX_ERROR_RATE = 0.5
+PROXY_MAX_CAPTCHA_RATE = 0.3
+PROXY_RETIRE_SECONDS = 10 * 60  # На сколько плохой прокси выводится из ротации
+
+# Очередь поисков /find_deals в боте
+SCHEDULER_MAX_RUNNING_JOBS = 2  # Поисков одновременно на весь бот
+SCHEDULER_PER_USER_LIMIT = 1  # Выполняющихся поисков на пользователя
+SCHEDULER_MAX_QUEUED_PER_USER = 0  # Сверх выполняющихся: кнопки статистики и остановки работают с одним поиском пользователя
+SCHEDULER_MAX_QUEUED_TOTAL = 50  # Дальше новые поиски отклоняются, чтобы очередь не росла бесконечно
+
+# Очередь исходящих сообщений бота: лимиты Telegram и группировка находок
+OUTBOX_PER_CHAT_INTERVAL = 1.0  # Секунд между сообщениями в один чат
+OUTBOX_GLOBAL_RATE = 25  # Сообщений в секунду на весь бот (лимит Telegram — 30)
+OUTBOX_MAX_BATCH = 10  # Находок в одном альбоме или сводке (альбом Telegram — до 10 фото)
+OUTBOX_MAX_QUEUED_PER_CHAT = 200  # Дальше новые сообщения в чат отбрасываются
+OUTBOX_MAX_RETRIES = 3  # Повторов отправки после RetryAfter и сетевых ошибок
+OUTBOX_CLOSE_TIMEOUT = 30  # Сколько секунд при остановке бота дожидаться отправки очереди
+
+# Кэш фото товаров для Telegram: file_id после первой отправки и локальные копии изображений
+PHOTO_FILE_ID_CACHE_FILE = 'app/data/photo_file_ids.json'
+PHOTO_FILE_ID_MAX_ITEMS = 20000
+PHOTO_FILE_ID_SAVE_EVERY = 20  # Сохранять индекс file_id на диск раз в столько новых записей
+PHOTO_CACHE_DIR = 'app/data/photo_cache'  # None — без локальных копий, фото качаются при каждой отправке
+PHOTO_CACHE_MAX_FILES = 2000
+PHOTO_CACHE_MAX_BYTES = 200 * 1024 * 1024
+PHOTO_CACHE_PRUNE_EVERY = 50  # Чистить каталог раз в столько скачиваний
+PHOTO_DOWNLOAD_TIMEOUT = 5  # Медленный хост картинок не задерживает сообщение дольше этого
+PHOTO_MAX_BYTES = 10 * 1024 * 1024  # Лимит Telegram на фото
+
+# Логи: запись в отдельном потоке через очередь, ротация по размеру и времени со сжатием
+LOG_FORMAT = os.getenv("WB_LOG_FORMAT", "text")  # "text" или "json" (JSON Lines с полями url/article/status/duration)
+LOG_MAX_BYTES = 10 * 1024 * 1024  # Размер файла, после которого он уходит в архив; 0 — без ограничения
+LOG_ROTATE_SECONDS = 24 * 60 * 60  # Не писать в один файл дольше этого (от запуска или прошлой ротации); 0 — только по размеру
+LOG_BACKUP_COUNT = 10  # Сколько архивных частей хранить
+LOG_COMPRESS = True  # Сжимать архивные части gzip
+LOG_QUEUE_SIZE = 10000  # Записей в очереди до отбрасывания новых; 0 — без ограничения
+
+# Метрики: задержки по стадиям и счетчики статусов, эндпоинт Prometheus и команда /metrics для админов
+METRICS_ENABLED = True
+METRICS_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)  # Границы корзин гистограмм, секунды
+METRICS_HOST = "127.0.0.1"  # Только локально: наружу метрики не торчат
+METRICS_PORT = int(os.getenv("WB_METRICS_PORT", "9108"))  # 0 — без HTTP-эндпоинта
+ADMIN_USER_IDS = {int(user_id) for user_id in os.getenv("WB_ADMIN_IDS", "").split(",") if user_id.strip()}  # Кому доступна /metrics
+
+# Офлайн-бенчмарк извлечения по сохраненным страницам (python -m app.core.benchmark)
+BENCHMARK_CORPUS_DIR = 'app/data/corpus/v1'  # Каталог с manifest.json; новая версия корпуса — новый каталог
+BENCHMARK_BASELINE_PATH = 'app/data/benchmark_baseline.json'  # Замеры этой машины, с которыми сравнивается прогон
+BENCHMARK_REPEAT = 20  # Прогонов каждой страницы (берется медиана)
+BENCHMARK_MAX_REGRESSION = 0.25  # Допустимое замедление прохода корпуса относительно базы (доля)
+
+# Локальная заглушка WB для нагрузочных прогонов: страницы корпуса бенчмарка с задержкой, капчей и ошибками
+MOCK_WB_HOST = "127.0.0.1"
+MOCK_WB_PORT = 8710  # Бот и парсер смотрят на нее при WB_BASE_URL=http://127.0.0.1:8710/
+MOCK_WB_LATENCY = (0.05, 0.3)  # Случайная задержка ответа, (мин, макс) секунд
+MOCK_WB_CAPTCHA_RATE = 0.0  # Доля ответов со страницей капчи вместо запрошенной
+MOCK_WB_ERROR_RATE = 0.0  # Доля ответов HTTP 503
+MOCK_WB_SEARCH_PAGES = 5  # Страниц выдачи по любому запросу
+MOCK_WB_CARDS_PER_PAGE = 30
+# Какая страница корпуса отдается по артикулу (доли; один артикул всегда получает одну и ту же страницу)
+MOCK_WB_PRODUCT_MIX = {"product_captured": 0.45, "product_wallet_feedback": 0.45, "product_sold_out": 0.05, "product_missing_data": 0.05}
+
+# Нагрузочный прогон конвейера /find_deals против заглушки (python -m app.core.loadtest)
+LOADTEST_WORKERS = (1, 2, 4)  # Воркеров карточек; по каждому значению отдельный прогон
+LOADTEST_PAGES = 3  # Страниц выдачи на прогон
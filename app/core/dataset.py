@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from urllib.parse import quote
+from .config import DATASET_DIR, DATASET_ROWS_PER_FILE
+from .utils import log_info, log_error
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError: # Необязательная зависимость: нужна только для выгрузки в Parquet и аналитики
+    pa = None
+    pq = None
+
+# Выгрузка разобранных карточек в колоночный формат (Parquet) с разбиением по дню и запросу:
+# <DATASET_DIR>/date=2024-05-01/query=<запрос>/part-<время>-<id>.parquet
+# Файлы только дописываются, существующие никогда не переписываются.
+
+def require_pyarrow():
+    if pa is None:
+        raise RuntimeError("Для выгрузки в Parquet нужен пакет pyarrow: pip install pyarrow")
+
+def product_schema():
+    require_pyarrow()
+    return pa.schema([
+        ("article", pa.string()),
+        ("url", pa.string()),
+        ("product_name", pa.string()),
+        ("brand", pa.string()),
+        ("current_price", pa.float64()),
+        ("second_price", pa.float64()),
+        ("original_price", pa.float64()),
+        ("feedback_discount", pa.float64()),
+        ("rating", pa.float64()),
+        ("reviews", pa.int64()),
+        ("source", pa.string()),
+        ("observed_at", pa.timestamp("ms", tz="UTC"))
+    ])
+
+def partition_path(root, observed_at, query):
+    """Каталог раздела; запрос кодируется как в URL, pyarrow раскодирует его при чтении."""
+    date = datetime.fromtimestamp(observed_at, tz=timezone.utc).strftime("%Y-%m-%d")
+    return os.path.join(root, f"date={date}", f"query={quote(query or '-', safe='')}")
+
+class DatasetWriter:
+    """Буферизует карточки по разделам и пишет каждый раздел отдельным Parquet-файлом по rows_per_file строк."""
+
+    def __init__(self, root=DATASET_DIR, rows_per_file=DATASET_ROWS_PER_FILE):
+        require_pyarrow()
+        self.root = root
+        self.rows_per_file = rows_per_file
+        self.schema = product_schema()
+        self._buffers = {} # каталог раздела -> список строк
+        self._lock = threading.Lock()
+
+    def add(self, data, query="", source=""):
+        """Добавляет успешно разобранную карточку; ошибки разбора не выгружаются."""
+        if not data or data.get("status") or not data.get("product_name"):
+            return
+        observed_at = time.time()
+        row = {field.name: data.get(field.name) for field in self.schema}
+        row["source"] = source
+        row["observed_at"] = int(observed_at * 1000)
+        path = partition_path(self.root, observed_at, query)
+        with self._lock:
+            rows = self._buffers.setdefault(path, [])
+            rows.append(row)
+            if len(rows) < self.rows_per_file:
+                return
+            del self._buffers[path]
+        self._write(path, rows)
+
+    def _write(self, path, rows):
+        table = pa.Table.from_pylist(rows, schema=self.schema)
+        file_path = os.path.join(path, f"part-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}.parquet")
+        try:
+            os.makedirs(path, exist_ok=True)
+            pq.write_table(table, file_path, compression="zstd")
+        except Exception as e:
+            log_error(f"Ошибка записи {len(rows)} строк в {file_path}: {e}")
+            return
+        log_info(f"Выгружено {len(rows)} карточек в {file_path}")
+
+    def flush(self):
+        with self._lock:
+            buffers, self._buffers = self._buffers, {}
+        for path, rows in buffers.items():
+            self._write(path, rows)
+
+    def close(self):
+        self.flush()
+
+_dataset_writer = None
+_dataset_writer_lock = threading.Lock()
+
+def get_dataset_writer():
+    """Общий для процесса писатель выгрузки в DATASET_DIR."""
+    global _dataset_writer
+    with _dataset_writer_lock:
+        if _dataset_writer is None:
+            _dataset_writer = DatasetWriter()
+        return _dataset_writer
@@ -0,0 +1,258 @@
+import re
+import threading
+import time
+import soupsieve
+from .config import SELECTOR_LEADER_MARGIN, SELECTOR_WARNING_INTERVAL
+from .utils import log_warning
+from .metrics import get_metrics, STAGE_SECONDS
+
+# Декларативная спецификация извлечения полей карточки товара.
+# Селекторы и регулярные выражения компилируются один раз при импорте. Каждое поле считает,
+# какой селектор сработал, и пробует их в порядке частоты попаданий: на типичной верстке
+# нужный элемент находится с первой попытки. Полнотекстовые поиски по документу — только крайний случай.
+
+# --- Регулярные выражения --- #
+PRICE_DIGITS_RE = re.compile(r'\d+')
+PRICE_WITH_CURRENCY_RE = re.compile(r'\d+\s*₽')
+FEEDBACK_TEXT_RE = re.compile(r'(\d+)\s*(₽|руб).*?(за|на)\s+отзыв', re.IGNORECASE)
+FEEDBACK_AMOUNT_RE = re.compile(r'(\d[\d\s]*)\s*(?:₽|руб)', re.IGNORECASE)
+FEEDBACK_AMOUNT_RUB_SIGN_RE = re.compile(r'(\d[\d\s]*)\s*₽', re.IGNORECASE)
+FEEDBACK_AMOUNT_RUB_WORD_RE = re.compile(r'(\d[\d\s]*)\s*руб', re.IGNORECASE)
+REVIEWS_COUNT_RE = re.compile(r'\d[\d\s]*')
+SELECTOR_OPTIONAL_PARTS_RE = re.compile(r':(?:not|has)\([^)]*\)|\[[^\]]*\]')
+SELECTOR_CLASS_RE = re.compile(r'\.(-?[_a-zA-Z][\w-]*)')
+SELECTOR_COMBINATOR_RE = re.compile(r'\s*[\s>+~]\s*')
+
+def required_classes(selector):
+    """Классы, без которых селектор заведомо ничего не найдет (части внутри :not/:has и [...] не учитываются)."""
+    if ',' in selector:
+        return frozenset()
+    return frozenset(SELECTOR_CLASS_RE.findall(SELECTOR_OPTIONAL_PARTS_RE.sub('', selector)))
+
+def subject_classes(selector):
+    """Классы самого искомого элемента (последнего составного селектора)."""
+    if ',' in selector:
+        return frozenset()
+    compounds = SELECTOR_COMBINATOR_RE.split(SELECTOR_OPTIONAL_PARTS_RE.sub('', selector).strip())
+    return frozenset(SELECTOR_CLASS_RE.findall(compounds[-1]))
+
+class ClassIndex:
+    """Элементы документа, сгруппированные по CSS-классам (строится за один проход по дереву).
+
+    Промах по отсутствующему классу не сканирует дерево, а поиск по классу проверяет только его элементы.
+    """
+
+    def __init__(self, soup):
+        self.soup = soup
+        self.elements = {}
+        for element in soup.descendants:
+            attrs = getattr(element, 'attrs', None)
+            if not attrs or 'class' not in attrs:
+                continue
+            class_names = attrs['class']
+            for class_name in (class_names.split() if isinstance(class_names, str) else class_names):
+                self.elements.setdefault(class_name, []).append(element)
+
+    def __contains__(self, class_name):
+        return class_name in self.elements
+
+    def has_all(self, class_names):
+        return all(class_name in self.elements for class_name in class_names)
+
+    def select_one(self, compiled, element_classes, root):
+        """Аналог compiled.select_one(root): первый в порядке документа элемент, подходящий под селектор."""
+        if root is not self.soup or not element_classes:
+            return compiled.select_one(root)
+        candidates = min((self.elements.get(class_name, ()) for class_name in element_classes), key=len)
+        for element in candidates:
+            if compiled.match(element):
+                return element
+        return None
+
+def build_class_index(soup):
+    return ClassIndex(soup)
+
+def may_match(selector_classes, class_index):
+    return class_index is None or class_index.has_all(selector_classes)
+
+def clean_and_convert_price(price_str):
+    if not price_str: return 0.0
+    cleaned = "".join(filter(lambda char: char.isdigit() or char == '.' or char == ',', price_str))
+    cleaned = cleaned.replace(",", ".")
+    parts = cleaned.split('.')
+    if len(parts) > 2:
+        if len(parts[-1]) <= 2:
+            cleaned = "".join(parts[:-1]) + "." + parts[-1]
+        else:
+            cleaned = "".join(parts)
+    elif not parts:
+         return 0.0
+    try:
+        return float(cleaned)
+    except ValueError:
+        return 0.0
+
+def parse_feedback_amount(text):
+    """Сумма из строки вида "150 ₽ за отзыв" или 0.0."""
+    match = FEEDBACK_AMOUNT_RE.search(text or "")
+    if not match:
+        return 0.0
+    try:
+        return float(match.group(1).replace(" ", ""))
+    except ValueError:
+        return 0.0
+
+class SelectorField:
+    """Поле карточки: CSS-селекторы в порядке частоты попаданий и статистика по ним."""
+
+    def __init__(self, name, selectors):
+        self.name = name
+        self._compiled = {selector: soupsieve.compile(selector) for selector in selectors}
+        self._required_classes = {selector: required_classes(selector) for selector in selectors}
+        self._subject_classes = {selector: subject_classes(selector) for selector in selectors}
+        self._original_index = {selector: index for index, selector in enumerate(selectors)}
+        self._hits = dict.fromkeys(selectors, 0)
+        self._order = list(selectors)
+        self._misses = 0
+        self._leader = None # Лидер, о котором уже известно (предупреждали или он был первым)
+        self._last_warning_at = None
+        self._lock = threading.Lock()
+
+    def extract(self, root, parse, class_index=None):
+        """Возвращает первое непустое parse(элемент) по селекторам; None, если ни один не подошел.
+
+        parse может вернуть None/0/"", чтобы отклонить найденный элемент и перейти к следующему селектору.
+        class_index (см. ClassIndex) позволяет пропускать селекторы с классами, которых нет в документе,
+        и искать элементы по индексу классов вместо обхода всего дерева.
+        """
+        started = time.perf_counter()
+        try:
+            return self._extract(root, parse, class_index)
+        finally:
+            get_metrics().observe(STAGE_SECONDS, time.perf_counter() - started, stage="field", field=self.name)
+
+    def _extract(self, root, parse, class_index):
+        for selector in self._order:
+            if not may_match(self._required_classes[selector], class_index):
+                continue
+            if class_index is None:
+                element = self._compiled[selector].select_one(root)
+            else:
+                element = class_index.select_one(self._compiled[selector], self._subject_classes[selector], root)
+            if element is None:
+                continue
+            value = parse(element)
+            if value:
+                self._record_hit(selector)
+                return value
+        with self._lock:
+            self._misses += 1
+        return None
+
+    def _record_hit(self, selector):
+        with self._lock:
+            self._hits[selector] += 1
+            position = self._order.index(selector)
+            if position > 0 and self._hits[self._order[position - 1]] < self._hits[selector]:
+                # Селектор обогнал соседа: пересортировываем, при равенстве сохраняем исходный приоритет.
+                # Новый список вместо sort() на месте: _extract в других потоках перебирает _order без блокировки
+                self._order = sorted(self._order, key=lambda s: (-self._hits[s], self._original_index[s]))
+            previous_leader = self._leader
+            leader_changed = self._order[0] == selector and self._take_leadership(selector)
+            if leader_changed:
+                hits_text = f"{self._hits[selector]} против {self._hits[previous_leader]} попаданий"
+        if leader_changed:
+            log_warning(f"Поле '{self.name}': теперь чаще всего срабатывает селектор '{selector}' вместо '{previous_leader}' "
+                        f"({hits_text}, возможно, WB изменил верстку).")
+
+    def _take_leadership(self, selector):
+        """Переводит лидерство на selector с гистерезисом; True — пора предупредить. Вызывается под _lock."""
+        leader = self._leader
+        if leader is None or not self._hits[leader]:
+            self._leader = selector # Первый сработавший селектор — не смена верстки
+            return False
+        # Пока разрыв меньше SELECTOR_LEADER_MARGIN, лидер не меняется: чередующиеся верстки не дают шквала предупреждений
+        if selector == leader or self._hits[selector] < self._hits[leader] * (1 + SELECTOR_LEADER_MARGIN):
+            return False
+        self._leader = selector
+        now = time.monotonic()
+        if self._last_warning_at is not None and now - self._last_warning_at < SELECTOR_WARNING_INTERVAL:
+            return False
+        self._last_warning_at = now
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {"order": list(self._order), "hits": dict(self._hits), "misses": self._misses}
+
+# --- Спецификация полей --- #
+PRODUCT_FIELDS = {
+    "product_name": SelectorField("product_name", [
+        "h1.product-page__title",
+        "h1:not(.popup__title)"
+    ]),
+    "wallet_price": SelectorField("wallet_price", [
+        "span.price-block__wallet-price",
+        ".price-block__price-with-discount .price__value",
+        "div[class*='wallet-price'] span[class*='price__value']",
+        "div[class*='wallet-price'] .price__active",
+        "div[class*='wallet-price'] .price__lower-price"
+    ]),
+    "price_block": SelectorField("price_block", [
+        ".product-page__price-block .price-block__content-bottom",
+        ".price-block__content-bottom"
+    ]),
+    "normal_price": SelectorField("normal_price", [
+        "ins.price-block__final-price", "span.price-block__final-price",
+        ".price-block__price:not([class*='old']):not([class*='wallet']) .price__active",
+        ".price-block__price:not([class*='old']):not([class*='wallet']) .price__lower-price",
+        "div.price-block__price > span.price-block__price-value:not(:has(del))"
+    ]),
+    "original_price": SelectorField("original_price", [
+        "del.price-block__old-price", "s.price-block__old-price", "del.price__old-price", "del.price--old"
+    ]),
+    "feedback_discount": SelectorField("feedback_discount", [
+        "span.feedbacks-points-sum",
+        ".badge--feedbacks-for-points .badge__text"
+    ]),
+    "rating": SelectorField("rating", [
+        ".product-review__rating",
+        ".product-page__reviews-rating"
+    ]),
+    "reviews": SelectorField("reviews", [
+        "a.product-review[data-feedbacks-count]",
+        ".product-review__count-review"
+    ]),
+    "brand": SelectorField("brand", [
+        "a[data-wba-brand-name]",
+        "span.product-page__link-brand",
+        ".seller-and-brand__item--brand .seller-and-brand__item-name",
+        "a.product-page__header-brand"
+    ]),
+    "main_image": SelectorField("main_image", [
+        "img.photo-zoom__preview",
+        "img.j-zoom-image"
+    ])
+}
+
+# Поля карточки в поисковой выдаче (цена и бейдж "рубли за отзыв" видны без открытия товара)
+SEARCH_CARD_FIELDS = {
+    "card_price": SelectorField("card_price", [
+        "ins.price__lower-price",
+        ".price__lower-price",
+        "span.price__wallet-price",
+        ".product-card__price ins"
+    ]),
+    "card_link": SelectorField("card_link", [
+        "a.product-card__link[href*='/detail.aspx']",
+        "a[href*='/detail.aspx']"
+    ])
+}
+SEARCH_CARD_SELECTOR = soupsieve.compile(".product-card, .j-card-item")
+
+GALLERY_IMAGE_SELECTORS = [(soupsieve.compile(selector), required_classes(selector)) for selector in (".swiper-slide img[src]", ".img-plug img[src]", ".pv__img img[src]")]
+JSON_LD_SELECTOR = soupsieve.compile("script[type='application/ld+json']")
+
+def selector_stats():
+    """Статистика попаданий по всем полям: по ней сразу видно, какие селекторы перестали работать."""
+    return {name: field.stats() for name, field in {**PRODUCT_FIELDS, **SEARCH_CARD_FIELDS}.items()}
@@ -0,0 +1,86 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from .config import HTTP_FETCH_TIMEOUT, HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE
+from .throttle import get_fetch_throttle
+from .proxies import get_proxy_manager
+from .utils import get_random_user_agent, log_info, log_warning
+from .metrics import get_metrics, STAGE_SECONDS
+
+# Загрузка страниц без браузера
+
+CAPTCHA_MARKER = "captcha__container" # Класс блока капчи WB, как и parser.CAPTCHA_CLASS
+
+class PageFetcher:
+    """Общий интерфейс загрузчика: fetch(url) возвращает HTML страницы или None при ошибке."""
+
+    def fetch(self, url):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class HttpFetcher(PageFetcher):
+    """Загрузка HTML через общий requests.Session: keep-alive и пул соединений на каждый хост."""
+
+    def __init__(self, timeout=HTTP_FETCH_TIMEOUT, pool_connections=HTTP_POOL_CONNECTIONS, pool_maxsize=HTTP_POOL_MAXSIZE, user_agent=None):
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({
+            "User-Agent": user_agent if user_agent else get_random_user_agent(),
+            "Accept": "text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8",
+            "Accept-Language": "ru-RU,ru;q=0.9,en;q=0.8",
+            "Connection": "keep-alive"
+        })
+
+    def fetch(self, url):
+        get_fetch_throttle().wait()
+        proxy_manager = get_proxy_manager()
+        proxy = proxy_manager.acquire()
+        try:
+            return self._fetch(url, proxy, proxy_manager)
+        finally:
+            proxy_manager.release(proxy)
+
+    def _fetch(self, url, proxy, proxy_manager):
+        proxies = {"http": f"http://{proxy}", "https": f"http://{proxy}"} if proxy else None
+        started = time.perf_counter()
+        try:
+            response = self.session.get(url, timeout=self.timeout, proxies=proxies)
+        except requests.RequestException as e:
+            get_fetch_throttle().record(False) # Освобождает пробную загрузку автомата капчи
+            proxy_manager.record(proxy, error=True)
+            log_warning(f"HTTP-ошибка при загрузке {url}: {type(e).__name__} - {e}")
+            return None
+        if response.status_code != 200:
+            # 429/498 — WB режет частоту запросов с этого адреса: для ограничителя и прокси это равносильно капче
+            rate_limited = response.status_code in (429, 498)
+            get_fetch_throttle().record(rate_limited)
+            proxy_manager.record(proxy, captcha=rate_limited, error=response.status_code >= 500)
+            log_warning(f"HTTP {response.status_code} при загрузке {url}")
+            return None
+        if not response.encoding or response.encoding.lower() == "iso-8859-1":
+            response.encoding = "utf-8" # requests по умолчанию считает text/html латиницей
+        elapsed = time.perf_counter() - started
+        proxy_manager.record(proxy, latency=elapsed, captcha=CAPTCHA_MARKER in response.text)
+        get_metrics().observe(STAGE_SECONDS, elapsed, stage="http_fetch")
+        log_info(f"HTTP-загрузка {url} заняла {elapsed:.3f} с")
+        return response.text
+
+    def close(self):
+        self.session.close()
+
+_http_fetcher = None
+_http_fetcher_lock = threading.Lock()
+
+def get_http_fetcher():
+    """Возвращает общий для процесса HttpFetcher, чтобы соединения переиспользовались между запросами."""
+    global _http_fetcher
+    with _http_fetcher_lock:
+        if _http_fetcher is None:
+            _http_fetcher = HttpFetcher()
+        return _http_fetcher
@@ -1,4 +1,5 @@
 # ... существующий код filters.py ... 
+from .config import CARD_PREFILTER_SLACK
 
 # def filter_product(product, min_price, max_price, min_rating, min_reviews, brand=None):
 #     if not (min_price <= product["current_price"] <= max_price):
@@ -32,4 +33,24 @@ def is_matching_deal(product_data: dict, user_min_price=None, user_max_price=Non
         return False
 
     # Если товар "выгодный" и вписывается в ценовой диапазон, возвращаем True
-    return True 
\ No newline at end of file
+    return True 
+
+def is_plausible_deal(card_data: dict, user_min_price=None, user_max_price=None, slack=CARD_PREFILTER_SLACK) -> bool:
+    """Грубая проверка по карточке из выдачи: может ли товар пройти is_matching_deal.
+
+    Цена в выдаче может немного отличаться от цены на странице товара, поэтому сравнение идет с запасом slack (доля).
+    Если цены или скидки за отзыв на карточке не видно, товар не отсеивается.
+    """
+    card_price = card_data.get('card_price')
+    if not card_price:
+        return True
+
+    if user_min_price is not None and card_price < user_min_price * (1 - slack):
+        return False
+    if user_max_price is not None and card_price > user_max_price * (1 + slack):
+        return False
+
+    feedback_discount = card_data.get('card_feedback_discount')
+    if feedback_discount is not None and feedback_discount <= card_price * (1 - slack):
+        return False
+    return True
@@ -0,0 +1,57 @@
+import importlib.util
+import time
+from bs4 import BeautifulSoup
+from .config import HTML_PARSER_BACKEND
+from .utils import log_warning
+
+# Выбор движка разбора HTML для BeautifulSoup.
+# Селекторы извлечения работают поверх дерева bs4, поэтому результат не зависит от движка,
+# а скорость построения дерева заметно отличается (lxml быстрее встроенного html.parser).
+
+# Имя движка -> модуль, который должен быть установлен (html.parser встроен в Python)
+HTML_PARSER_BACKENDS = {
+    "html.parser": None,
+    "lxml": "lxml",
+    "html5lib": "html5lib"
+}
+
+_warned_backends = set()
+
+def available_backends():
+    """Движки, которые можно использовать в текущем окружении."""
+    return [name for name, module in HTML_PARSER_BACKENDS.items() if module is None or importlib.util.find_spec(module)]
+
+def resolve_backend(backend=None):
+    """Возвращает имя движка; если нужный не установлен — откатывается на html.parser."""
+    backend = backend or HTML_PARSER_BACKEND
+    module = HTML_PARSER_BACKENDS.get(backend, "")
+    if module is None or (module and importlib.util.find_spec(module)):
+        return backend
+    if backend not in _warned_backends:
+        _warned_backends.add(backend)
+        log_warning(f"HTML-движок '{backend}' недоступен, использую html.parser.")
+    return "html.parser"
+
+def make_soup(markup, backend=None, parse_only=None):
+    """Строит дерево BeautifulSoup выбранным движком."""
+    return BeautifulSoup(markup, resolve_backend(backend), parse_only=parse_only)
+
+def check_backend_parity(page_source, url, backends=None):
+    """Разбирает страницу каждым движком и возвращает (результаты, время, расхождения с первым движком)."""
+    from .parser import parse_product_html # Локальный импорт: parser сам зависит от этого модуля
+    backends = backends or available_backends()
+    results, timings = {}, {}
+    for backend in backends:
+        started = time.perf_counter()
+        results[backend] = parse_product_html(page_source, url, backend=backend)
+        timings[backend] = time.perf_counter() - started
+    reference_backend = backends[0]
+    reference = results[reference_backend]
+    mismatches = {}
+    for backend in backends[1:]:
+        diff = {field: (reference.get(field), results[backend].get(field))
+                for field in set(reference) | set(results[backend])
+                if reference.get(field) != results[backend].get(field)}
+        if diff:
+            mismatches[backend] = diff
+    return results, timings, mismatches
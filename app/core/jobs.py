@@ -0,0 +1,65 @@
+import threading
+from .utils import log_warning
+
+# Примитивы для долгих задач (поиск /find_deals, пакетный режим CLI): токен отмены и счетчики прогресса.
+# Оба потокобезопасны и живут в памяти процесса, так что проверка отмены и обновление статистики
+# не ходят в хранилище FSM на каждом товаре.
+
+class CancellationToken:
+    """Флаг отмены с обработчиками: при cancel() каждый зарегистрированный обработчик вызывается один раз."""
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._event.is_set()
+
+    def cancel(self):
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = list(self._callbacks.values()), {}
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                log_warning(f"Ошибка в обработчике отмены: {type(e).__name__} - {e}")
+
+    def register(self, callback):
+        """Регистрирует обработчик и возвращает его id для unregister; если отмена уже была, вызывает его сразу."""
+        with self._lock:
+            if not self._event.is_set():
+                self._next_id += 1
+                self._callbacks[self._next_id] = callback
+                return self._next_id
+        callback()
+        return None
+
+    def unregister(self, callback_id):
+        with self._lock:
+            self._callbacks.pop(callback_id, None)
+
+class ProgressCounters:
+    """Атомарные счетчики прогресса задачи; snapshot() отдает согласованный срез для показа пользователю."""
+
+    def __init__(self, *names):
+        self._values = dict.fromkeys(names, 0)
+        self._lock = threading.Lock()
+
+    def increment(self, name, amount=1):
+        with self._lock:
+            self._values[name] = self._values.get(name, 0) + amount
+            return self._values[name]
+
+    def get(self, name):
+        with self._lock:
+            return self._values.get(name, 0)
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._values)
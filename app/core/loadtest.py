@@ -0,0 +1,137 @@
+import argparse
+import os
+import queue
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+from .config import (WB_BASE_URL, LOADTEST_WORKERS, LOADTEST_PAGES, DEFAULT_SEARCH_QUERY, CARD_PREFILTER_ENABLED, PRODUCT_DB_ENABLED,
+                     PRODUCT_DB_PATH)
+from .filters import is_matching_deal, is_plausible_deal
+from .metrics import get_metrics, metrics_source
+from .parser import DriverPool, iter_search_cards, parse_product
+from .storage import get_product_store
+from .throttle import get_fetch_throttle
+from .utils import log_error
+
+# Нагрузочный прогон конвейера /find_deals против локальной заглушки WB (app/core/mock_wb.py):
+#   python -m app.core.mock_wb &
+#   WB_BASE_URL=http://127.0.0.1:8710/ WB_PRODUCT_DB_PATH=/tmp/loadtest.sqlite3 python -m app.core.loadtest --workers 1 2 4 8
+# Как в боте: выдача в браузере, отсев по карточкам, разбор карточек в workers потоков (HTTP, браузер из пула как фолбек),
+# is_matching_deal. Отправка в Telegram не входит: ее темп задают лимиты Telegram (очередь бота), а не хост.
+# Кэш карточек не используется, иначе повторные прогоны мерили бы кэш.
+
+REAL_WB_HOSTS = ("wildberries.ru", "wb.ru")
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+def run_pipeline(workers, query, pages, min_price=None, max_price=None):
+    """Один прогон: выдача -> отсев по карточкам -> разбор карточек в workers потоков -> is_matching_deal."""
+    pool = DriverPool(size=workers + 1) # Как в боте: один драйвер под выдачу, остальные под фолбек карточек
+    pool.warm_up() # Запуск Chrome не входит в замер
+    links = queue.Queue() # Ссылки на товары; None — сигнал воркеру завершиться
+    statuses = Counter()
+    latencies = []
+    results_lock = threading.Lock()
+
+    def produce_links():
+        try:
+            with metrics_source("loadtest"), pool.driver() as driver:
+                if not driver:
+                    log_error("Не удалось получить драйвер из пула для загрузки выдачи.")
+                    return
+                for card in iter_search_cards(driver, search_query=query, max_pages=pages, min_price_rub=min_price,
+                                              max_price_rub=max_price, driver_pool=pool):
+                    if CARD_PREFILTER_ENABLED and not is_plausible_deal(card, user_min_price=min_price, user_max_price=max_price):
+                        with results_lock:
+                            statuses["skipped"] += 1
+                        continue
+                    links.put(card["url"])
+        except Exception as e:
+            log_error(f"Ошибка загрузки выдачи в нагрузочном прогоне: {type(e).__name__} - {e}")
+        finally:
+            for _ in range(workers):
+                links.put(None)
+
+    def process_items():
+        while True:
+            url = links.get()
+            if url is None:
+                return
+            started = time.perf_counter()
+            try:
+                data = parse_product(url, driver_pool=pool, use_cache=False, source="loadtest")
+                status = (data.get("status") or "ok") if data else "error"
+                deal = status == "ok" and is_matching_deal(data, user_min_price=min_price, user_max_price=max_price)
+            except Exception as e:
+                log_error(f"Ошибка разбора {url} в нагрузочном прогоне: {type(e).__name__} - {e}")
+                status, deal = "error", False
+            elapsed = time.perf_counter() - started
+            with results_lock:
+                latencies.append(elapsed)
+                statuses[status] += 1
+                statuses["deals"] += deal
+
+    threads = [threading.Thread(target=produce_links, name="loadtest-links")]
+    threads += [threading.Thread(target=process_items, name=f"loadtest-item-{index}") for index in range(workers)]
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        elapsed = time.perf_counter() - started
+        pool.close()
+    latencies.sort()
+    return {
+        "workers": workers,
+        "items": len(latencies),
+        "elapsed": elapsed,
+        "items_per_second": len(latencies) / elapsed if elapsed > 0 else 0.0,
+        "p50": percentile(latencies, 0.5),
+        "p95": percentile(latencies, 0.95),
+        "statuses": statuses,
+    }
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Нагрузочный прогон /find_deals против локальной заглушки WB")
+    arg_parser.add_argument('--workers', type=int, nargs='+', default=list(LOADTEST_WORKERS), help='Воркеров карточек; прогон на каждое значение')
+    arg_parser.add_argument('--pages', type=int, default=LOADTEST_PAGES, help='Страниц выдачи на прогон')
+    arg_parser.add_argument('--query', type=str, default=DEFAULT_SEARCH_QUERY)
+    arg_parser.add_argument('--min-price', type=float, default=None)
+    arg_parser.add_argument('--max-price', type=float, default=None)
+    arg_parser.add_argument('--throttle', action='store_true', help='Оставить ограничитель частоты загрузок (по умолчанию выключен: меряется хост, а не темп для WB)')
+    arg_parser.add_argument('--stages', action='store_true', help='Показать задержки по стадиям после каждого прогона')
+    args = arg_parser.parse_args(argv)
+
+    host = (urlsplit(WB_BASE_URL).hostname or "").lower()
+    if any(host == real_host or host.endswith("." + real_host) for real_host in REAL_WB_HOSTS):
+        print(f"WB_BASE_URL указывает на настоящий сайт ({WB_BASE_URL}). Запусти заглушку (python -m app.core.mock_wb) и укажи ее адрес в WB_BASE_URL.")
+        return 2
+    if PRODUCT_DB_ENABLED and not os.getenv("WB_PRODUCT_DB_PATH"):
+        print(f"Внимание: карточки заглушки пишутся в основную базу {PRODUCT_DB_PATH}; для прогонов задай WB_PRODUCT_DB_PATH.")
+    get_fetch_throttle().enabled = args.throttle
+
+    print(f"Заглушка {WB_BASE_URL}, запрос '{args.query}', страниц выдачи: {args.pages}, ограничитель: {'вкл' if args.throttle else 'выкл'}")
+    print(f"{'воркеров':>8} {'товаров':>8} {'время, с':>9} {'товаров/с':>10} {'p50, с':>8} {'p95, с':>8}  статусы")
+    try:
+        for workers in args.workers:
+            get_metrics().reset()
+            report = run_pipeline(max(1, workers), args.query, args.pages, args.min_price, args.max_price)
+            statuses = ", ".join(f"{status}={count}" for status, count in report["statuses"].most_common())
+            print(f"{report['workers']:>8} {report['items']:>8} {report['elapsed']:>9.1f} {report['items_per_second']:>10.2f} "
+                  f"{report['p50']:>8.3f} {report['p95']:>8.3f}  {statuses}")
+            if args.stages:
+                print(get_metrics().summary())
+    finally:
+        if PRODUCT_DB_ENABLED:
+            get_product_store().close()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+import bisect
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from .config import METRICS_ENABLED, METRICS_LATENCY_BUCKETS
+from .utils import log_info, log_error
+
+# Метрики процесса в памяти: гистограммы задержек по стадиям и счетчики событий.
+# Метка source — точка входа (cli, bot_link, find_deals): parse_product выставляет ее в контексте,
+# и все стадии внутри разбора (драйвер, загрузка, ожидание, BeautifulSoup, поля) помечаются ею автоматически.
+# Отдаются в текстовом формате Prometheus (render) и кратким отчетом для команды бота (summary).
+
+STAGE_SECONDS = "wb_stage_seconds"
+PARSE_RESULTS = "wb_parse_results_total"
+TELEGRAM_SENDS = "wb_telegram_sends_total"
+
+METRIC_HELP = {
+    STAGE_SECONDS: ("histogram", "Длительность стадии, секунды"),
+    PARSE_RESULTS: ("counter", "Результаты разбора карточек по статусам"),
+    TELEGRAM_SENDS: ("counter", "Отправки сообщений в Telegram"),
+}
+
+_current_source = contextvars.ContextVar("metrics_source", default="")
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # Последняя ячейка — больше самой большой границы
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Оценка квантиля по границам корзин (верхняя граница корзины, куда попал квантиль)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for index, bucket_count in enumerate(self.counts):
+            cumulative += bucket_count
+            if cumulative >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+class MetricsRegistry:
+    """Потокобезопасный реестр гистограмм и счетчиков с метками."""
+
+    def __init__(self, buckets=METRICS_LATENCY_BUCKETS, enabled=METRICS_ENABLED):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self._histograms = {} # (имя, метки) -> Histogram
+        self._counters = {} # (имя, метки) -> число
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(name, labels):
+        if "source" not in labels:
+            labels["source"] = _current_source.get()
+        return name, tuple(sorted(labels.items()))
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram(self.buckets)
+            histogram.observe(seconds)
+
+    def inc(self, name, amount=1, **labels):
+        if not self.enabled:
+            return
+        key = self._key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    @contextmanager
+    def timer(self, stage, **labels):
+        """Замеряет блок кода как стадию stage гистограммы wb_stage_seconds."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(STAGE_SECONDS, time.perf_counter() - started, stage=stage, **labels)
+
+    def render(self):
+        """Все метрики в текстовом формате Prometheus."""
+        with self._lock:
+            histograms = {key: (list(h.counts), h.sum, h.count) for key, h in self._histograms.items()}
+            counters = dict(self._counters)
+        lines = []
+        names = sorted({name for name, _ in histograms} | {name for name, _ in counters})
+        for name in names:
+            metric_type, help_text = METRIC_HELP.get(name, ("untyped", name))
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for (metric_name, labels), value in sorted(counters.items()):
+                if metric_name == name:
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (metric_name, labels), (counts, total, count) in sorted(histograms.items()):
+                if metric_name != name:
+                    continue
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket_count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {total:.6f}")
+                lines.append(f"{name}_count{_format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Короткий отчет для людей: p50/p95 и число замеров по стадиям, счетчики статусов."""
+        with self._lock:
+            stages = [(dict(labels), h.count, h.sum, h.quantile(0.5), h.quantile(0.95))
+                      for (name, labels), h in self._histograms.items() if name == STAGE_SECONDS]
+            counters = [(name, dict(labels), value) for (name, labels), value in self._counters.items()]
+        lines = []
+        for labels, count, total, p50, p95 in sorted(stages, key=lambda row: (row[0].get("stage", ""), sorted(row[0].items()))):
+            label_text = " ".join(f"{key}={value}" for key, value in sorted(labels.items()) if key != "stage" and value)
+            lines.append(f"{labels.get('stage')} [{label_text or '-'}]: n={count} avg={total / count:.3f}s p50≤{p50}s p95≤{p95}s")
+        for name, labels, value in sorted(counters, key=lambda row: (row[0], sorted(row[1].items()))):
+            label_text = " ".join(f"{key}={value}" for key, value in sorted(labels.items()) if value)
+            lines.append(f"{name} [{label_text or '-'}]: {value}")
+        return "\n".join(lines)
+
+    def histograms(self, name):
+        """Срез гистограмм метрики name: список (метки, число замеров, сумма секунд)."""
+        with self._lock:
+            return [(dict(labels), h.count, h.sum) for (metric_name, labels), h in self._histograms.items() if metric_name == name]
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+def _escape_label_value(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label_value(value)}"' for key, value in labels) + "}"
+
+@contextmanager
+def metrics_source(source):
+    """Помечает все метрики внутри блока точкой входа source (cli, bot_link, find_deals)."""
+    token = _current_source.set(source or _current_source.get())
+    try:
+        yield
+    finally:
+        _current_source.reset(token)
+
+_metrics = None
+_metrics_lock = threading.Lock()
+
+def get_metrics():
+    """Общий для процесса реестр метрик."""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = MetricsRegistry()
+        return _metrics
+
+@contextmanager
+def use_metrics(registry):
+    """Временно подменяет общий реестр (бенчмарк замеряет код теми же таймерами, не смешивая с рабочими метриками)."""
+    global _metrics
+    with _metrics_lock:
+        previous, _metrics = _metrics, registry
+    try:
+        yield registry
+    finally:
+        with _metrics_lock:
+            _metrics = previous
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = get_metrics().render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Опросы Prometheus не засоряют лог
+
+def start_metrics_server(host, port):
+    """Поднимает HTTP-эндпоинт /metrics в фоновом потоке; возвращает сервер (shutdown() для остановки) или None."""
+    try:
+        server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    except OSError as e:
+        log_error(f"Не удалось запустить эндпоинт метрик на {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    log_info(f"Метрики доступны на http://{host}:{server.server_address[1]}/metrics")
+    return server
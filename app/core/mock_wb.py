@@ -0,0 +1,190 @@
+import argparse
+import random
+import re
+import struct
+import sys
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+from .benchmark import load_corpus
+from .config import (BENCHMARK_CORPUS_DIR, MOCK_WB_HOST, MOCK_WB_PORT, MOCK_WB_LATENCY, MOCK_WB_CAPTCHA_RATE, MOCK_WB_ERROR_RATE,
+                     MOCK_WB_SEARCH_PAGES, MOCK_WB_CARDS_PER_PAGE, MOCK_WB_PRODUCT_MIX)
+from .utils import log_info, log_error
+
+# Локальная заглушка Wildberries для нагрузочных прогонов без обращений к настоящему сайту:
+#   python -m app.core.mock_wb --latency 0.05 0.3 --captcha-rate 0.05 --error-rate 0.02
+#   WB_BASE_URL=http://127.0.0.1:8710/ python -m app.core.loadtest
+# Отдает страницы корпуса бенчмарка: выдачу по любому запросу (карточки размножаются с новыми артикулами)
+# и карточки товаров. Ссылки на WB и его CDN переписываются на заглушку, чтобы браузер не ходил наружу.
+
+SEARCH_PATH = "/catalog/0/search.aspx"
+PRODUCT_PATH_RE = re.compile(r"^/catalog/(\d+)/detail\.aspx$")
+STATIC_PREFIX = "/static/"
+IMAGE_EXTENSIONS = (".webp", ".jpg", ".jpeg", ".png")
+FIRST_ARTICLE = 200000000 # Артикулы заглушки не пересекаются с артикулами корпуса
+
+SEARCH_CARD_RE = re.compile(r"<article\b.*?</article>", re.S)
+SEARCH_CARD_ARTICLE_RE = re.compile(r'data-nm-id="(\d+)"')
+SEARCH_RESULTS_COUNT_RE = re.compile(r'(class="searching-results__count"><span>)\d+')
+WB_SITE_LINK_RE = re.compile(r"https://www\.wildberries\.ru/")
+WB_STATIC_LINK_RE = re.compile(r"(?:https?:)?//(?:[a-z0-9-]+\.)*(?:wbbasket\.ru|wb\.ru)/")
+
+def _placeholder_png(size=64):
+    """Серый квадрат PNG вместо фото товара с CDN."""
+    def chunk(tag, data):
+        return struct.pack(">I", len(data)) + tag + data + struct.pack(">I", zlib.crc32(tag + data) & 0xffffffff)
+    rows = b"".join(b"\x00" + b"\xcc\xcc\xcc" * size for _ in range(size))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", size, size, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(rows)) + chunk(b"IEND", b""))
+
+class MockWbSite:
+    """Страницы заглушки, собранные из корпуса бенчмарка под адрес base_url."""
+
+    def __init__(self, base_url, corpus_dir=BENCHMARK_CORPUS_DIR, search_pages=MOCK_WB_SEARCH_PAGES,
+                 cards_per_page=MOCK_WB_CARDS_PER_PAGE, product_mix=MOCK_WB_PRODUCT_MIX):
+        self.base_url = base_url
+        self.search_pages = search_pages
+        self.cards_per_page = cards_per_page
+        _, pages = load_corpus(corpus_dir)
+        sources = {page["id"]: self._rebase(page_source) for page, page_source in pages}
+        self.captcha_page = sources["product_captcha"]
+        self.image = _placeholder_png()
+        total_weight = sum(product_mix.values())
+        self._product_mix = [] # (накопленная доля, HTML)
+        cumulative = 0.0
+        for page_id, weight in product_mix.items():
+            cumulative += weight / total_weight
+            self._product_mix.append((cumulative, sources[page_id]))
+        search_source = sources["search_page"]
+        cards = list(SEARCH_CARD_RE.finditer(search_source))
+        self._search_cards = [card.group(0) for card in cards]
+        self._search_head = SEARCH_RESULTS_COUNT_RE.sub(rf"\g<1>{search_pages * cards_per_page}", search_source[:cards[0].start()])
+        self._search_tail = search_source[cards[-1].end():]
+
+    def _rebase(self, page_source):
+        page_source = WB_SITE_LINK_RE.sub(self.base_url, page_source)
+        return WB_STATIC_LINK_RE.sub(self.base_url + STATIC_PREFIX.lstrip("/"), page_source)
+
+    def search_page(self, page_number):
+        """Страница выдачи page_number; за последней страницей — выдача без карточек."""
+        cards = []
+        if 1 <= page_number <= self.search_pages:
+            for index in range(self.cards_per_page):
+                card = self._search_cards[index % len(self._search_cards)]
+                article = FIRST_ARTICLE + (page_number - 1) * self.cards_per_page + index
+                cards.append(card.replace(SEARCH_CARD_ARTICLE_RE.search(card).group(1), str(article)))
+        return self._search_head + "\n".join(cards) + self._search_tail
+
+    def product_page(self, article):
+        """Карточка товара; страница корпуса выбирается по артикулу, поэтому повторная загрузка дает ту же страницу."""
+        point = random.Random(int(article)).random()
+        for cumulative, page_source in self._product_mix:
+            if point < cumulative:
+                return page_source
+        return self._product_mix[-1][1]
+
+class _MockWbRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1" # Keep-alive, как у настоящего WB: HttpFetcher держит соединения в пуле
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if url.path.startswith(STATIC_PREFIX):
+            # Статика CDN отдается сразу: задержка и сбои касаются только страниц
+            if url.path.lower().endswith(IMAGE_EXTENSIONS):
+                self._send(200, "image/png", server.site.image)
+            else:
+                self._send(404, "text/plain; charset=utf-8", b"")
+            return
+        article_match = PRODUCT_PATH_RE.match(url.path)
+        if url.path != SEARCH_PATH and not article_match:
+            self._send(404, "text/plain; charset=utf-8", b"")
+            return
+        time.sleep(random.uniform(*server.latency))
+        if random.random() < server.error_rate:
+            server.count("error")
+            self._send(503, "text/plain; charset=utf-8", b"Service Unavailable")
+            return
+        if random.random() < server.captcha_rate:
+            server.count("captcha")
+            page_source = server.site.captcha_page
+        elif article_match:
+            server.count("product")
+            page_source = server.site.product_page(article_match.group(1))
+        else:
+            server.count("search")
+            page_number = parse_qs(url.query).get("page", ["1"])[0]
+            page_source = server.site.search_page(int(page_number) if page_number.isdigit() else 1)
+        self._send(200, "text/html; charset=utf-8", page_source.encode("utf-8"))
+
+    def _send(self, status, content_type, body):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # Сотни запросов в секунду не засоряют консоль
+
+class MockWbServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки с задержкой ответа и долями капч и ошибок; ведет счетчики отданных ответов."""
+
+    daemon_threads = True
+    request_queue_size = 128 # Очередь соединений по умолчанию (5) переполняется при десятках воркеров
+
+    def __init__(self, host=MOCK_WB_HOST, port=MOCK_WB_PORT, latency=MOCK_WB_LATENCY, captcha_rate=MOCK_WB_CAPTCHA_RATE,
+                 error_rate=MOCK_WB_ERROR_RATE, **site_options):
+        super().__init__((host, port), _MockWbRequestHandler)
+        self.base_url = f"http://{host}:{self.server_address[1]}/"
+        self.site = MockWbSite(self.base_url, **site_options)
+        self.latency = latency
+        self.captcha_rate = captcha_rate
+        self.error_rate = error_rate
+        self.counts = {}
+        self._counts_lock = threading.Lock()
+
+    def count(self, kind):
+        with self._counts_lock:
+            self.counts[kind] = self.counts.get(kind, 0) + 1
+
+def start_mock_wb(**options):
+    """Поднимает заглушку в фоновом потоке; возвращает сервер (base_url — адрес для WB_BASE_URL, shutdown() — остановка)."""
+    server = MockWbServer(**options)
+    threading.Thread(target=server.serve_forever, name="mock-wb-http", daemon=True).start()
+    return server
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Локальная заглушка Wildberries для нагрузочных прогонов")
+    arg_parser.add_argument('--host', type=str, default=MOCK_WB_HOST)
+    arg_parser.add_argument('--port', type=int, default=MOCK_WB_PORT)
+    arg_parser.add_argument('--latency', type=float, nargs=2, default=MOCK_WB_LATENCY, metavar=('MIN', 'MAX'), help='Задержка ответа, секунды')
+    arg_parser.add_argument('--captcha-rate', type=float, default=MOCK_WB_CAPTCHA_RATE, help='Доля ответов с капчей')
+    arg_parser.add_argument('--error-rate', type=float, default=MOCK_WB_ERROR_RATE, help='Доля ответов HTTP 503')
+    arg_parser.add_argument('--pages', type=int, default=MOCK_WB_SEARCH_PAGES, help='Страниц выдачи по любому запросу')
+    arg_parser.add_argument('--cards', type=int, default=MOCK_WB_CARDS_PER_PAGE, help='Карточек на странице выдачи')
+    arg_parser.add_argument('--corpus', type=str, default=BENCHMARK_CORPUS_DIR, help='Каталог корпуса с manifest.json')
+    args = arg_parser.parse_args(argv)
+
+    try:
+        server = MockWbServer(args.host, args.port, tuple(args.latency), args.captcha_rate, args.error_rate,
+                              corpus_dir=args.corpus, search_pages=args.pages, cards_per_page=args.cards)
+    except OSError as e:
+        log_error(f"Не удалось запустить заглушку WB на {args.host}:{args.port}: {e}")
+        return 1
+    log_info(f"Заглушка WB слушает {server.base_url}: задержка {args.latency[0]}-{args.latency[1]} с, "
+             f"капча {args.captcha_rate:.0%}, ошибки {args.error_rate:.0%}, выдача {args.pages}x{args.cards}")
+    print(f"WB_BASE_URL={server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    print(f"Отдано: {server.counts}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
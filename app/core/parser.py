@@ -2,28 +2,45 @@
 
 import time
 import random
+import queue
+import threading
 import requests
 import re # Импортируем re для скидки за отзыв
+import json
 from selenium import webdriver
 from selenium.webdriver.chrome.options import Options
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.service import Service
-from bs4 import BeautifulSoup
+from .snapshots import capture_snapshot
+from .html_backend import make_soup
+from .extraction import (PRODUCT_FIELDS, GALLERY_IMAGE_SELECTORS, JSON_LD_SELECTOR, PRICE_DIGITS_RE, PRICE_WITH_CURRENCY_RE,
+                         FEEDBACK_TEXT_RE, FEEDBACK_AMOUNT_RE, FEEDBACK_AMOUNT_RUB_SIGN_RE, FEEDBACK_AMOUNT_RUB_WORD_RE,
+                         REVIEWS_COUNT_RE, SEARCH_CARD_FIELDS, SEARCH_CARD_SELECTOR, clean_and_convert_price, parse_feedback_amount,
+                         build_class_index, may_match)
+from .cache import get_product_cache
+from .storage import get_product_store
+from .fetcher import PageFetcher, get_http_fetcher
+from .throttle import get_fetch_throttle
+from .proxies import get_proxy_manager
+from .chromedriver import resolve_chromedriver_path, remember_chrome_version, invalidate_chromedriver_cache, is_chromedriver_version_mismatch
 from .utils import get_random_user_agent, get_random_proxy, log_info, log_error, log_warning # ИЗМЕНЕН ИМПОРТ
-from .config import DEFAULT_MAX_PAGES # ИЗМЕНЕН ИМПОРТ
+from .metrics import get_metrics, metrics_source, STAGE_SECONDS, PARSE_RESULTS
+from .config import DEFAULT_MAX_PAGES, DRIVER_POOL_SIZE, DRIVER_POOL_ACQUIRE_TIMEOUT, DRIVER_POOL_MAX_USES, HTTP_FETCH_ENABLED, HTTP_REQUIRED_FIELDS, PRODUCT_PAGE_WAIT_TIMEOUT, PRODUCT_PAGE_POLITENESS_DELAY, PRODUCT_CACHE_ENABLED, PRODUCT_DB_ENABLED, SEARCH_PAGE_WORKERS, WB_BASE_URL, CHROMEDRIVER_OFFLINE # ИЗМЕНЕН ИМПОРТ
 from urllib.parse import urljoin, urlencode # Добавляем urlencode
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException
+from selenium.common.exceptions import TimeoutException, WebDriverException
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
 # Сбор ссылок с поисковой выдачи или категории
 
-def get_product_links(driver, search_query=None, category_url=None, max_pages=DEFAULT_MAX_PAGES, min_price_rub=None, max_price_rub=None):
-    links = set()
-    base_url_wb = "https://www.wildberries.ru/"
+SEARCH_CARD_SELECTORS = [".product-card__wrapper", ".product-card", ".j-card-item", ".search-product-card"]
+# "Найдено 1 234 товара" в заголовке выдачи; число может быть обернуто во вложенные теги
+SEARCH_RESULTS_COUNT_RE = re.compile(r'class="[^"]*(?:searching-results__count|goods-count)[^"]*"[^>]*>(?:\s*<[^>]+>)*\s*(\d[\d\s\u00a0]*)')
 
-    price_params = ""
+def build_search_page_urls(search_query=None, category_url=None, max_pages=DEFAULT_MAX_PAGES, min_price_rub=None, max_price_rub=None):
+    """URL страниц выдачи 1..max_pages с фильтром цены priceU и "Рубли за отзыв"."""
     # Формируем параметр priceU, если указаны цены
     # Минимальная цена 0 копеек, если не указана
     min_kopecks = int(min_price_rub * 100) if min_price_rub is not None and min_price_rub >= 0 else 0
@@ -38,157 +55,307 @@ def get_product_links(driver, search_query=None, category_url=None, max_pages=DE
     price_params = f"&priceU={min_kopecks}%3B{max_kopecks}"
     feedback_filter = "&ffeedbackpoints=1" # Используем фильтр "Рубли за отзыв"
 
+    page_urls = []
     for page in range(1, max_pages + 1):
-        current_page_url = ""
         if category_url:
             # Для URL категории, добавляем page, priceU и фильтр. Учитываем, что category_url может уже иметь параметры.
             separator = '&' if '?' in category_url else '?'
-            current_page_url = f"{category_url}{separator}page={page}{price_params}{feedback_filter}"
+            page_urls.append(f"{category_url}{separator}page={page}{price_params}{feedback_filter}")
         elif search_query:
             # Для поискового запроса, добавляем сортировку по популярности и фильтр
-            current_page_url = f"https://www.wildberries.ru/catalog/0/search.aspx?page={page}&sort=popular&search={search_query}{price_params}{feedback_filter}"
+            page_urls.append(f"{WB_BASE_URL}catalog/0/search.aspx?page={page}&sort=popular&search={search_query}{price_params}{feedback_filter}")
         else:
             log_warning("get_product_links вызван без search_query и category_url.")
             break # Невозможно сформировать URL
-        
-        if page > 1:
-            time.sleep(random.uniform(0.2, 0.5))
-        log_info(f"Загружаю страницу: {current_page_url}")
-        try:
-            driver.get(current_page_url)
-            WebDriverWait(driver, 10).until(
-                EC.any_of(
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".product-card__wrapper")),
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".product-card")),
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".j-card-item")),
-                    EC.presence_of_element_located((By.CSS_SELECTOR, ".search-product-card")) 
-                )
-            )
-        except TimeoutException:
-            log_error(f"Timeout при загрузке страницы: {current_page_url}")
+    return page_urls
+
+def load_search_page(driver, page_url):
+    """Открывает страницу выдачи и ждет карточки товаров; возвращает HTML или None по таймауту."""
+    throttle = get_fetch_throttle()
+    proxy_manager = get_proxy_manager()
+    proxy = proxy_manager.proxy_for(driver)
+    throttle.wait()
+    log_info(f"Загружаю страницу: {page_url}")
+    started = time.perf_counter()
+    try:
+        driver.get(page_url)
+        WebDriverWait(driver, 10).until(
+            EC.any_of(*(EC.presence_of_element_located((By.CSS_SELECTOR, selector)) for selector in SEARCH_CARD_SELECTORS))
+        )
+    except TimeoutException:
+        captcha = CAPTCHA_CLASS in driver.page_source
+        throttle.record(captcha)
+        proxy_manager.record(proxy, error=not captcha, captcha=captcha)
+        log_error(f"{'Капча' if captcha else 'Timeout'} при загрузке страницы: {page_url}")
+        return None
+    except Exception:
+        throttle.record(False) # Драйвер упал или закрыт отменой: освобождаем пробную загрузку автомата капчи
+        proxy_manager.record(proxy, error=True)
+        raise
+    elapsed = time.perf_counter() - started
+    throttle.record(False)
+    proxy_manager.record(proxy, latency=elapsed)
+    get_metrics().observe(STAGE_SECONDS, elapsed, stage="search_page_load")
+    return driver.page_source
+
+def extract_product_links(page_source):
+    """Ссылки на карточки товаров со страницы выдачи в порядке появления, без повторов."""
+    return [card["url"] for card in extract_search_cards(page_source)]
+
+def _card_feedback_discount(card_element):
+    """Сумма с бейджа "N ₽ за отзыв" на карточке выдачи или None, если бейджа нет."""
+    for text in card_element.find_all(string=lambda s: s and "отзыв" in s.lower()):
+        text_for_search = text.parent.get_text(" ", strip=True) if text.parent else str(text)
+        if FEEDBACK_TEXT_RE.search(text_for_search):
+            amount = parse_feedback_amount(text_for_search)
+            if amount:
+                return amount
+    return None
+
+def extract_search_cards(page_source, backend=None):
+    """Карточки со страницы выдачи: ссылка, артикул, цена и скидка за отзыв (None, если на карточке их не видно).
+
+    Ссылки вне распознанных карточек тоже попадают в результат, но без цены — такие товары не отсеиваются заранее.
+    """
+    cards = {}
+    soup = make_soup(page_source, backend)
+    for card_element in SEARCH_CARD_SELECTOR.select(soup):
+        if card_element.find_parent(class_=["product-card", "j-card-item"]):
+            continue # Вложенный блок уже учтенной карточки
+        href = SEARCH_CARD_FIELDS["card_link"].extract(card_element, lambda el: el.get("href"))
+        if not href:
+            continue
+        url = urljoin(WB_BASE_URL, href.split("?")[0])
+        if url in cards:
             continue
-        soup = BeautifulSoup(driver.page_source, "html.parser")
-        for a in soup.find_all("a", href=True):
-            if "/catalog/" in a["href"] and "/detail.aspx" in a["href"]:
-                href_part = a["href"].split("?")[0]
-                full_url = urljoin(base_url_wb, href_part)
-                links.add(full_url)
-    return list(links)
+        card_price = SEARCH_CARD_FIELDS["card_price"].extract(card_element, lambda el: clean_and_convert_price(el.get_text(strip=True)))
+        cards[url] = {
+            "url": url,
+            "article": card_element.get("data-nm-id") or extract_article(url),
+            "card_price": card_price,
+            "card_feedback_discount": _card_feedback_discount(card_element)
+        }
+    for a in soup.find_all("a", href=True):
+        if "/catalog/" in a["href"] and "/detail.aspx" in a["href"]:
+            url = urljoin(WB_BASE_URL, a["href"].split("?")[0])
+            if url not in cards:
+                cards[url] = {"url": url, "article": extract_article(url), "card_price": None, "card_feedback_discount": None}
+    return list(cards.values())
+
+def extract_results_count(page_source):
+    """Число найденных товаров из заголовка выдачи или None, если его нет на странице."""
+    match = SEARCH_RESULTS_COUNT_RE.search(page_source or "")
+    if not match:
+        return None
+    digits = "".join(char for char in match.group(1) if char.isdigit())
+    return int(digits) if digits else None
+
+def iter_product_links(driver, search_query=None, category_url=None, max_pages=DEFAULT_MAX_PAGES, min_price_rub=None, max_price_rub=None,
+                       driver_pool=None, page_workers=SEARCH_PAGE_WORKERS):
+    """Отдает ссылки на товары постранично, по мере загрузки выдачи (см. iter_search_cards)."""
+    for card in iter_search_cards(driver, search_query, category_url, max_pages, min_price_rub, max_price_rub, driver_pool, page_workers):
+        yield card["url"]
+
+def iter_search_cards(driver, search_query=None, category_url=None, max_pages=DEFAULT_MAX_PAGES, min_price_rub=None, max_price_rub=None,
+                      driver_pool=None, page_workers=SEARCH_PAGE_WORKERS):
+    """Отдает карточки выдачи (см. extract_search_cards) постранично; повторы между страницами отбрасываются.
+
+    Следующие страницы грузятся заранее на дополнительных драйверах из пула (до page_workers одновременно),
+    а ссылки отдаются строго по порядку страниц. Выдача заканчивается, как только страница не дала новых ссылок
+    или набрано столько ссылок, сколько товаров WB показал в заголовке выдачи.
+    """
+    page_urls = build_search_page_urls(search_query, category_url, max_pages, min_price_rub, max_price_rub)
+    if not page_urls:
+        return
+    pool = driver_pool or get_driver_pool()
+    extra_drivers = []
+    for _ in range(min(page_workers, len(page_urls)) - 1):
+        extra_driver = pool.try_acquire()
+        if not extra_driver:
+            break
+        extra_drivers.append(extra_driver)
+    idle_drivers = queue.Queue()
+    for page_driver in [driver] + extra_drivers:
+        idle_drivers.put(page_driver)
+
+    def load_page(page_url, delay):
+        page_driver = idle_drivers.get()
+        try:
+            if delay:
+                time.sleep(random.uniform(0.2, 0.5))
+            return load_search_page(page_driver, page_url)
+        finally:
+            idle_drivers.put(page_driver)
+
+    workers = 1 + len(extra_drivers)
+    if workers > 1:
+        log_info(f"Загружаю выдачу в {workers} драйвера одновременно.")
+    seen = set()
+    total_count = None
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="search-page")
+    pending = {}
+    next_page = 0
+    try:
+        for page_index, page_url in enumerate(page_urls):
+            # Держим в работе не больше страниц, чем драйверов, и не забегаем за известный конец выдачи
+            while next_page < len(page_urls) and len(pending) < workers:
+                pending[next_page] = executor.submit(load_page, page_urls[next_page], next_page >= workers)
+                next_page += 1
+            page_source = pending.pop(page_index).result()
+            if total_count is None and page_source:
+                total_count = extract_results_count(page_source)
+            new_cards = [card for card in extract_search_cards(page_source) if card["url"] not in seen] if page_source else []
+            if not new_cards:
+                log_info(f"Страница {page_index + 1} не дала новых ссылок, выдача закончилась.")
+                return
+            seen.update(card["url"] for card in new_cards)
+            yield from new_cards
+            if total_count is not None and len(seen) >= total_count:
+                log_info(f"Собраны все {total_count} товаров выдачи на странице {page_index + 1}.")
+                return
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+        for extra_driver in extra_drivers:
+            pool.release(extra_driver)
+
+def get_product_links(driver, search_query=None, category_url=None, max_pages=DEFAULT_MAX_PAGES, min_price_rub=None, max_price_rub=None):
+    return list(iter_product_links(driver, search_query, category_url, max_pages, min_price_rub, max_price_rub))
 
 # Парсинг карточки товара
 
+# Признаки, по которым карточка считается готовой к разбору
+PRODUCT_TITLE_SELECTOR = "h1.product-page__title, .product-page__header h1"
+PRODUCT_PRICE_SELECTORS = [
+    ".price-block__wallet-price",
+    ".price-block__final-price",
+    ".price-block__price .price__lower-price",
+    "div[class*='wallet-price'] span[class*='price__value']"
+]
+PRODUCT_UNAVAILABLE_SELECTORS = [
+    ".product-page__title--not-found",
+    ".product-page__title-status--sold-out",
+    "div.soldout-title > h1",
+    ".empty-state-page__title",
+    ".error-page__title"
+]
+CAPTCHA_SELECTOR = "div.captcha__container"
+CAPTCHA_CLASS = "captcha__container"
+
+def wait_for_product_page(driver, timeout=PRODUCT_PAGE_WAIT_TIMEOUT):
+    """Ждет, пока на карточке появятся название и цена, пометка о недоступности или капча."""
+    try:
+        WebDriverWait(driver, timeout, poll_frequency=0.1).until(
+            EC.any_of(
+                EC.all_of(
+                    EC.presence_of_element_located((By.CSS_SELECTOR, PRODUCT_TITLE_SELECTOR)),
+                    EC.presence_of_element_located((By.CSS_SELECTOR, ", ".join(PRODUCT_PRICE_SELECTORS)))
+                ),
+                EC.presence_of_element_located((By.CSS_SELECTOR, ", ".join(PRODUCT_UNAVAILABLE_SELECTORS))),
+                EC.presence_of_element_located((By.CSS_SELECTOR, CAPTCHA_SELECTOR))
+            )
+        )
+        return True
+    except TimeoutException:
+        log_warning(f"Карточка {driver.current_url} не стала готовой за {timeout} с, разбираю то, что загрузилось.")
+        return False
+
+def load_product_page(driver, url):
+    """Открывает карточку в браузере и возвращает отрендеренный HTML, как только страница готова."""
+    min_delay, max_delay = PRODUCT_PAGE_POLITENESS_DELAY
+    if max_delay > 0:
+        time.sleep(random.uniform(min_delay, max_delay)) # Необязательная пауза, чтобы не частить запросами
+    get_fetch_throttle().wait()
+    metrics = get_metrics()
+    with metrics.timer("driver_get"):
+        driver.get(url)
+    with metrics.timer("page_wait"):
+        wait_for_product_page(driver)
+    return driver.page_source
+
 def parse_product_page(driver, url):
     log_info(f"Начинаю парсинг URL: {url}") # Логирование начала парсинга URL
-    driver.get(url)
-    time.sleep(random.uniform(1.0, 2.0)) # INCREASED delay back to 1.0-2.0 seconds
-    page_source = driver.page_source
-    soup = BeautifulSoup(page_source, "html.parser")
-    
-    debug_file_path = "app/data/debug_wb.html"
-    try:
-        with open(debug_file_path, 'w', encoding='utf-8') as f:
-            f.write(soup.prettify())
-        # log_info(f"Debug HTML сохранен в {debug_file_path} для URL: {url}") # Можно закомментировать, чтобы не спамить в лог
-    except Exception as e:
-        log_error(f"Ошибка сохранения debug HTML для {url}: {e}")
+    page_source = load_product_page(driver, url)
+    return _record_captcha(parse_product_html(page_source, url))
 
-    if soup.find("div", class_="captcha__container") or "капча" in page_source.lower() or "captcha" in page_source.lower():
+def _record_captcha(data):
+    """Сообщает ограничителю загрузок, была ли капча на загруженной странице."""
+    get_fetch_throttle().record(bool(data) and data.get("status") == "captcha_detected")
+    return data
+
+ARTICLE_REGEX = re.compile(r"/catalog/(\d+)/detail.aspx")
+
+def extract_article(url):
+    """Артикул товара из ссылки на карточку или пустая строка."""
+    article_match = ARTICLE_REGEX.search(url)
+    return article_match.group(1) if article_match else ""
+
+# Разбор HTML карточки товара (не зависит от того, чем страница была получена)
+
+def parse_product_html(page_source, url, backend=None):
+    with get_metrics().timer("parse_html"):
+        data = _parse_product_html(page_source, url, backend)
+    # Снимок сырого HTML сохраняется только при сбоях или по выборке, на успешном пути диск не трогаем
+    capture_snapshot(page_source, url, data.get("status", "ok"), extract_article(url))
+    return data
+
+def _parse_product_html(page_source, url, backend=None):
+    with get_metrics().timer("soup_build"):
+        soup = make_soup(page_source, backend)
+
+    class_index = build_class_index(soup)
+    page_source_lower = page_source.lower()
+    if (CAPTCHA_CLASS in class_index and soup.select_one(CAPTCHA_SELECTOR)) or "капча" in page_source_lower or "captcha" in page_source_lower:
         log_warning(f"Обнаружена капча на странице: {url}") # Изменено на warning, т.к. это не ошибка парсера
         return {"status": "captcha_detected", "url": url}
 
-    article_match = re.search(r"/catalog/(\d+)/detail.aspx", url)
-    article = article_match.group(1) if article_match else ""
+    article = extract_article(url)
     
-    h1 = soup.find("h1", class_=lambda x: x != 'popup__title')
-    product_name = h1.text.strip() if h1 else ""
+    product_name = PRODUCT_FIELDS["product_name"].extract(soup, lambda el: el.text.strip(), class_index) or ""
     
     if not product_name:
         log_warning(f"Название товара не найдено для URL: {url}. Проверьте селектор h1.")
         # Проверим, есть ли сообщение о том, что товар не найден или распродан
-        not_found_selectors = [
-            ".product-page__title--not-found",
-            ".product-page__title-status--sold-out",
-            "div.soldout-title > h1",
-            ".empty-state-page__title",
-            ".error-page__title"
-        ]
-        for selector in not_found_selectors:
+        for selector in PRODUCT_UNAVAILABLE_SELECTORS:
             not_found_el = soup.select_one(selector)
             if not_found_el:
                 message = not_found_el.text.strip()
                 log_warning(f"Страница для {url} сообщает: '{message}'. Товар отсутствует или распродан.")
                 return {"status": "product_unavailable", "message": message, "url": url}
 
-    price_wb_wallet_val = 0.0
-    price_normal_current_val = 0.0
-    original_price_val = 0.0
     final_current_price = 0.0
     final_second_price = 0.0
 
-    def clean_and_convert_price(price_str):
-        if not price_str: return 0.0
-        cleaned = "".join(filter(lambda char: char.isdigit() or char == '.' or char == ',', price_str))
-        cleaned = cleaned.replace(",", ".")
-        parts = cleaned.split('.')
-        if len(parts) > 2:
-            if len(parts[-1]) <= 2:
-                cleaned = "".join(parts[:-1]) + "." + parts[-1]
-            else:
-                cleaned = "".join(parts)
-        elif not parts:
-             return 0.0
-        try:
-            return float(cleaned)
-        except ValueError:
-            return 0.0
-
-    wallet_price_selectors = [
-        "span.price-block__wallet-price", 
-        ".price-block__price-with-discount .price__value", 
-        "div[class*='wallet-price'] span[class*='price__value']",
-        "div[class*='wallet-price'] .price__active",
-        "div[class*='wallet-price'] .price__lower-price"
-    ]
-    for selector in wallet_price_selectors:
-        wallet_price_el = soup.select_one(selector)
-        if wallet_price_el:
-            if wallet_price_el.find_parent(['del', 's']): continue
-            price_wb_wallet_val = clean_and_convert_price(wallet_price_el.get_text(strip=True))
-            if price_wb_wallet_val > 0: break
+    def not_crossed_out_price(el):
+        if el.find_parent(['del', 's']): return None
+        return clean_and_convert_price(el.get_text(strip=True))
+
+    price_wb_wallet_val = PRODUCT_FIELDS["wallet_price"].extract(soup, not_crossed_out_price, class_index) or 0.0
         
     if price_wb_wallet_val == 0.0:
+        # Крайний случай: ищем цену рядом с текстом "с WB кошельком" по всему документу
         wallet_text_node = soup.find(string=lambda t: t and "с wb кошельком" in t.lower())
         if wallet_text_node:
             parent_container = wallet_text_node.find_parent(lambda tag: tag.name in ['div', 'span'] and any(c.isdigit() for c in tag.get_text(strip=True)) and "₽" in tag.get_text(strip=True), limit=3)
             if parent_container:
-                price_candidates_text = parent_container.find_all(string=re.compile(r'\d+'))
+                price_candidates_text = parent_container.find_all(string=PRICE_DIGITS_RE)
                 for cand_text in price_candidates_text:
                     if "₽" in cand_text and not cand_text.find_parent(['del', 's']):
                         price_wb_wallet_val = clean_and_convert_price(cand_text)
                         if price_wb_wallet_val > 0: break
 
-    price_block_content = soup.select_one(".product-page__price-block .price-block__content-bottom, .price-block__content-bottom")
+    price_block_content = PRODUCT_FIELDS["price_block"].extract(soup, lambda el: el, class_index)
     search_area_normal_price = price_block_content if price_block_content else soup
 
-    normal_price_selectors = [
-        "ins.price-block__final-price", "span.price-block__final-price",
-        ".price-block__price:not([class*='old']):not([class*='wallet']) .price__active",
-        ".price-block__price:not([class*='old']):not([class*='wallet']) .price__lower-price",
-        "div.price-block__price > span.price-block__price-value:not(:has(del))"
-    ]
-    for selector in normal_price_selectors:
-        el = search_area_normal_price.select_one(selector)
-        if el:
-            if el.find_parent(['del', 's']): continue
-            temp_price = clean_and_convert_price(el.get_text(strip=True))
-            if price_wb_wallet_val > 0 and abs(temp_price - price_wb_wallet_val) < 0.01:
-                continue
-            if temp_price > 0:
-                price_normal_current_val = temp_price
-                break
+    def normal_price(el):
+        temp_price = not_crossed_out_price(el)
+        if temp_price and price_wb_wallet_val > 0 and abs(temp_price - price_wb_wallet_val) < 0.01:
+            return None
+        return temp_price
+
+    price_normal_current_val = PRODUCT_FIELDS["normal_price"].extract(search_area_normal_price, normal_price, class_index) or 0.0
 
     if price_normal_current_val == 0.0:
-        all_price_strings = search_area_normal_price.find_all(string=re.compile(r'\d+\s*₽'))
+        all_price_strings = search_area_normal_price.find_all(string=PRICE_WITH_CURRENCY_RE)
         for price_str_node in all_price_strings:
             if not price_str_node.find_parent(['del', 's']) and not price_str_node.find_parent(class_=[lambda c: c and 'wallet' in c, "price-block__price-with-discount", "price-block__old-price"]):
                 temp_price = clean_and_convert_price(price_str_node)
@@ -198,19 +365,12 @@ def parse_product_page(driver, url):
                     price_normal_current_val = temp_price
                     break
 
-    original_price_selectors = ["del.price-block__old-price", "s.price-block__old-price", "del.price__old-price", "del.price--old"]
-    for selector in original_price_selectors:
-        el = soup.select_one(selector)
-        if el:
-            original_price_val = clean_and_convert_price(el.get_text(strip=True))
-            if original_price_val > 0: break
+    original_price_val = PRODUCT_FIELDS["original_price"].extract(soup, lambda el: clean_and_convert_price(el.get_text(strip=True)), class_index) or 0.0
 
     if price_wb_wallet_val > 0:
         final_current_price = price_wb_wallet_val
         if price_normal_current_val > 0 and abs(price_normal_current_val - price_wb_wallet_val) > 0.01:
             final_second_price = price_normal_current_val
-        elif final_second_price == 0.0 and original_price_val > price_wb_wallet_val:
-             pass 
     elif price_normal_current_val > 0: 
         final_current_price = price_normal_current_val
     
@@ -218,32 +378,36 @@ def parse_product_page(driver, url):
     if final_second_price > 0 and final_current_price > 0 and final_second_price <= final_current_price: final_second_price = 0.0
 
     if not product_name and final_current_price == 0.0:
-        log_warning(f"Ключевые данные (название и цена) не найдены для URL: {url}. HTML сохранен в debug_wb.html")
+        log_warning(f"Ключевые данные (название и цена) не найдены для URL: {url}")
         return {"status": "essential_data_missing", "message": "Product name and price not found", "url": url}
     elif not product_name: # Цена есть, названия нет
-        log_warning(f"Название товара не найдено, но цена ({final_current_price}) есть для URL: {url}. HTML сохранен в debug_wb.html")
+        log_warning(f"Название товара не найдено, но цена ({final_current_price}) есть для URL: {url}")
         # Решаем, возвращать ли такой товар. Пока вернем как есть, но без названия он не будет обработан в хендлере.
         # Можно вернуть: {"status": "product_name_missing", "message": "Product name not found but price exists", "url": url}
         # Но это потребует обработки нового статуса в handlers.py. Пока оставим так.
         pass # Данные будут возвращены ниже, но product_name будет пуст
     elif final_current_price == 0.0:
-        log_warning(f"Цена не найдена (0.0) для товара '{product_name}' ({url}). HTML сохранен в debug_wb.html")
+        log_warning(f"Цена не найдена (0.0) для товара '{product_name}' ({url})")
         # Можно добавить статус типа "price_not_found", но для простоты пока оставим, 
         # хендлер отфильтрует по цене > 0 если нужно для сделок.
         pass
 
-    feedback_discount_val = 0.0
-    feedback_el = soup.select_one("span.feedbacks-points-sum")
-    if feedback_el:
-        feedback_discount_val = clean_and_convert_price(feedback_el.get_text(strip=True))
+    def feedback_amount(el):
+        if el.name == "span" and "feedbacks-points-sum" in el.get("class", []):
+            return clean_and_convert_price(el.get_text(strip=True))
+        return parse_feedback_amount(el.get_text(" ", strip=True))
+
+    feedback_discount_val = PRODUCT_FIELDS["feedback_discount"].extract(soup, feedback_amount, class_index) or 0.0
     
     if feedback_discount_val == 0.0: 
-        feedback_tags = soup.find_all(string=re.compile(r'(\d+)\s*(₽|руб).*?(за|на)\s+отзыв', re.IGNORECASE))
+        # Крайний случай: полнотекстовый поиск "N ₽ за отзыв" — один проход по документу вместо двух
+        review_strings = soup.find_all(string=lambda t: t and "отзыв" in t.lower())
+        feedback_tags = [t for t in review_strings if FEEDBACK_TEXT_RE.search(t)]
         if not feedback_tags: 
-            feedback_tags_general = soup.find_all(string=lambda t: t and "₽ за отзыв" in t.lower() or "руб. за отзыв" in t.lower())
+            feedback_tags_general = [t for t in review_strings if "₽ за отзыв" in t.lower() or "руб. за отзыв" in t.lower()]
             for tag_text in feedback_tags_general:
-                match = re.search(r'(\d[\d\s]*)\s*₽', tag_text, re.IGNORECASE)
-                if not match: match = re.search(r'(\d[\d\s]*)\s*руб', tag_text, re.IGNORECASE)
+                match = FEEDBACK_AMOUNT_RUB_SIGN_RE.search(tag_text)
+                if not match: match = FEEDBACK_AMOUNT_RUB_WORD_RE.search(tag_text)
                 if match:
                     try: 
                         feedback_discount_val = float(match.group(1).replace(" ", ""))
@@ -251,37 +415,47 @@ def parse_product_page(driver, url):
                     except ValueError: pass
         else: 
             for tag_text in feedback_tags:
-                match = re.search(r'(\d[\d\s]*)\s*(?:₽|руб)', tag_text, re.IGNORECASE) 
+                match = FEEDBACK_AMOUNT_RE.search(tag_text) 
                 if match:
                     try: 
                         feedback_discount_val = float(match.group(1).replace(" ", ""))
                         if feedback_discount_val > 0: break
                     except ValueError: pass
 
-    rating = 0.0
-    rating_tag = soup.find("span", string=lambda t: t and ("оценок" in t or "оценка" in t or "отзывов" in t))
-    if rating_tag and rating_tag.find_previous_sibling("span", class_=lambda c: c and 'star' in c):
-         rating_value_element = rating_tag.find_previous_sibling("span", class_=lambda c: c and 'star' in c)
-         if rating_value_element:
-            try: rating = float(rating_value_element.text.replace(",", ".").strip())
+    def rating_value(el):
+        try: return float(el.get_text(strip=True).replace(",", "."))
+        except ValueError: return None
+
+    def reviews_count(el):
+        count_text = el.get("data-feedbacks-count") or el.get_text(" ", strip=True)
+        count_match = REVIEWS_COUNT_RE.search(count_text)
+        return int("".join(filter(str.isdigit, count_match.group(0)))) if count_match else None
+
+    rating = PRODUCT_FIELDS["rating"].extract(soup, rating_value, class_index) or 0.0
+    reviews = PRODUCT_FIELDS["reviews"].extract(soup, reviews_count, class_index) or 0
+    if rating == 0.0 or reviews == 0:
+        # Крайний случай: ищем подпись "N оценок" по тексту всего документа
+        rating_tag = soup.find("span", string=lambda t: t and ("оценок" in t or "оценка" in t or "отзывов" in t))
+        if rating == 0.0:
+            if rating_tag and rating_tag.find_previous_sibling("span", class_=lambda c: c and 'star' in c):
+                 rating_value_element = rating_tag.find_previous_sibling("span", class_=lambda c: c and 'star' in c)
+                 if rating_value_element:
+                    try: rating = float(rating_value_element.text.replace(",", ".").strip())
+                    except: pass
+            elif rating_tag: 
+                try:
+                    rating_parent = rating_tag.find_previous("span")
+                    if rating_parent:
+                        rating = float(rating_parent.text.replace(",", "."))
+                except: pass
+        if rating_tag and reviews == 0:
+            try:
+                reviews_text = rating_tag.get_text(strip=True).split()[0]
+                reviews = int("".join(filter(str.isdigit, reviews_text)))
             except: pass
-    elif rating_tag: 
-        try:
-            rating_parent = rating_tag.find_previous("span")
-            if rating_parent:
-                rating = float(rating_parent.text.replace(",", "."))
-        except: pass
-    reviews = 0
-    if rating_tag:
-        try:
-            reviews_text = rating_tag.get_text(strip=True).split()[0]
-            reviews = int("".join(filter(str.isdigit, reviews_text)))
-        except: pass
-    brand = ""
-    brand_link = soup.find("a", {"data-wba-brand-name": True})
-    if brand_link:
-        brand = brand_link.get("data-wba-brand-name")
-    else: 
+
+    brand = PRODUCT_FIELDS["brand"].extract(soup, lambda el: el.get("data-wba-brand-name") or el.get_text(strip=True), class_index) or ""
+    if not brand:
         brand_tag = soup.find("a", class_=lambda c: c and "brand" in c)
         if not brand_tag:
             brand_tag_original = soup.find("span", string="Оригинал")
@@ -294,19 +468,16 @@ def parse_product_page(driver, url):
     images = []
     page_base_url = url # Используем URL страницы как базу для относительных путей изображений
 
-    main_image_selector = 'img.photo-zoom__preview, img.j-zoom-image'
-    main_img_tag = soup.select_one(main_image_selector)
-    if main_img_tag:
-        main_img_src = main_img_tag.get('src')
-        if main_img_src:
-            resolved_main_img = urljoin(page_base_url, main_img_src)
-            if resolved_main_img not in images:
-                images.append(resolved_main_img)
-
-    gallery_selectors = [".swiper-slide img[src]", ".img-plug img[src]", ".pv__img img[src]"]
-    for selector in gallery_selectors:
+    main_img_src = PRODUCT_FIELDS["main_image"].extract(soup, lambda el: el.get('src'), class_index)
+    if main_img_src:
+        resolved_main_img = urljoin(page_base_url, main_img_src)
+        if resolved_main_img not in images:
+            images.append(resolved_main_img)
+
+    for gallery_selector, gallery_classes in GALLERY_IMAGE_SELECTORS:
         if len(images) >= 5: break
-        for img_tag in soup.select(selector):
+        if not may_match(gallery_classes, class_index): continue
+        for img_tag in gallery_selector.select(soup):
             if len(images) >= 5: break
             gallery_src = img_tag.get('src')
             if gallery_src:
@@ -316,10 +487,9 @@ def parse_product_page(driver, url):
     
     if len(images) < 5 and page_source: # Ищем в JSON-LD, если мало изображений
         try:
-            script_tags = soup.find_all('script', type='application/ld+json')
+            script_tags = JSON_LD_SELECTOR.select(soup)
             for script in script_tags:
                 if len(images) >= 5: break
-                import json # Импорт здесь, т.к. используется редко
                 json_data = json.loads(script.string)
                 if json_data.get('@type') == 'Product' and json_data.get('image'):
                     img_candidates = json_data['image']
@@ -366,37 +536,322 @@ def parse_product_page(driver, url):
 # Получение Selenium driver с прокси и User-Agent
 
 def get_driver(proxy=None, user_agent=None):
+    user_agent = user_agent if user_agent else get_random_user_agent()
     options = Options()
     options.add_argument("--no-sandbox")
     options.add_argument("--disable-dev-shm-usage")
     options.add_argument("--headless")
     options.add_argument("--disable-gpu")
-    options.add_argument("user-agent=" + (user_agent if user_agent else get_random_user_agent()))
+    options.add_argument("user-agent=" + user_agent)
     options.add_experimental_option("prefs", {"profile.managed_default_content_settings.images": 2}) # Disable images
     # options.add_argument("--window-size=1920x1080")
     options.add_experimental_option("excludeSwitches", ["enable-automation"])
     options.add_experimental_option('useAutomationExtension', False)
     options.add_argument("--disable-blink-features=AutomationControlled")
 
-    # if proxy:
-    #     options.add_argument(f"--proxy-server={proxy}")
+    if proxy:
+        options.add_argument(f"--proxy-server={proxy}")
 
-    try:
-        service = Service(ChromeDriverManager().install())
-        driver = webdriver.Chrome(service=service, options=options)
-    except Exception as e:
-        log_error(f"Ошибка инициализации драйвера: {e}")
-        # Попытка использовать уже скачанный драйвер, если webdriver_manager не сработал
+    started = time.perf_counter()
+    driver_path = resolve_chromedriver_path()
+    driver = None
+    if driver_path:
+        try:
+            driver = webdriver.Chrome(service=Service(driver_path), options=options)
+        except Exception as e:
+            log_error(f"Ошибка инициализации драйвера ({driver_path}): {e}")
+            # Закэшированный chromedriver устарел после обновления Chrome — получаем заново. Кэш сбрасывается только
+            # при несовпадении версий и не в офлайн-режиме: там путь потом не получить, а разовый сбой Chrome его не портит
+            fresh_driver_path = None
+            if not CHROMEDRIVER_OFFLINE and is_chromedriver_version_mismatch(e):
+                invalidate_chromedriver_cache()
+                fresh_driver_path = resolve_chromedriver_path(refresh=True)
+            if fresh_driver_path and fresh_driver_path != driver_path:
+                try:
+                    driver = webdriver.Chrome(service=Service(fresh_driver_path), options=options)
+                    driver_path = fresh_driver_path
+                except Exception as e_fresh:
+                    log_error(f"Ошибка инициализации драйвера ({fresh_driver_path}): {e_fresh}")
+    if driver is None:
+        # Попытка использовать chromedriver из PATH, если путь не найден или не сработал
         try:
             log_info("Попытка использовать chromedriver из PATH, если он доступен")
             driver = webdriver.Chrome(options=options)
+            driver_path = "PATH"
         except Exception as e_fallback:
             log_error(f"Ошибка инициализации драйвера (fallback): {e_fallback}")
             return None
+    elapsed = time.perf_counter() - started
+    get_metrics().observe(STAGE_SECONDS, elapsed, stage="driver_start")
+    log_info(f"Драйвер запущен за {elapsed:.2f} с (chromedriver: {driver_path}, прокси: {proxy or 'нет'})")
+    remember_chrome_version(driver)
     # Изменение User-Agent через CDP
     try:
-        driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": options.arguments[-1].split('=',1)[1]})
+        driver.execute_cdp_cmd('Network.setUserAgentOverride', {"userAgent": user_agent})
     except Exception as e:
         log_warning(f"Не удалось изменить User-Agent через CDP: {e}")
 
-    return driver 
\ No newline at end of file
+    return driver
+
+# Пул заранее запущенных драйверов
+
+class DriverPool:
+    """Ограниченный пул заранее запущенных драйверов Chrome с проверкой их состояния."""
+
+    def __init__(self, size=DRIVER_POOL_SIZE, driver_factory=None, max_uses=DRIVER_POOL_MAX_USES, proxy_manager=None):
+        self.size = max(1, size)
+        self.max_uses = max_uses
+        self._driver_factory = driver_factory or get_driver
+        self.proxy_manager = proxy_manager or get_proxy_manager() # Каждый драйвер живет с одним прокси
+        self._idle = queue.LifoQueue() # LIFO: чаще выдаем "горячие" драйверы
+        self._lock = threading.Lock()
+        self._created = 0
+        self._uses = {}
+        self._closed = False
+
+    def _create_driver(self):
+        with self._lock:
+            if self._closed or self._created >= self.size:
+                return None
+            self._created += 1
+        driver = None
+        proxy = self.proxy_manager.acquire(for_browser=True)
+        try:
+            driver = self._driver_factory(proxy=proxy) if proxy else self._driver_factory()
+        finally:
+            if not driver:
+                with self._lock:
+                    self._created -= 1
+                self.proxy_manager.record(proxy, error=True)
+                self.proxy_manager.release(proxy)
+        if driver:
+            self._uses[id(driver)] = 0
+            self.proxy_manager.bind(driver, proxy)
+        return driver
+
+    def _discard(self, driver):
+        with self._lock:
+            self._created -= 1
+        self._uses.pop(id(driver), None)
+        self.proxy_manager.unbind(driver)
+        try:
+            driver.quit()
+        except Exception as e:
+            log_warning(f"Ошибка при закрытии драйвера из пула: {e}")
+
+    @staticmethod
+    def _is_healthy(driver):
+        try:
+            driver.current_url # Дешевая команда: падает, если браузер или сессия умерли
+            return True
+        except Exception:
+            return False
+
+    def warm_up(self, count=None):
+        """Заранее запускает драйверы, чтобы первые запросы не ждали старта Chrome."""
+        target = self.size if count is None else min(count, self.size)
+        started = 0
+        while self._created < target:
+            driver = self._create_driver()
+            if not driver:
+                break
+            self._idle.put(driver)
+            started += 1
+        log_info(f"Пул драйверов прогрет: запущено {started}, всего {self._created} из {self.size}.")
+        return started
+
+    def _check_out(self, driver):
+        """Проверяет драйвер перед выдачей; неисправный закрывается."""
+        if not self._is_healthy(driver):
+            log_warning("Драйвер из пула не отвечает, заменяю его новым.")
+            self._discard(driver)
+            return False
+        if self.proxy_manager.is_retired(self.proxy_manager.proxy_for(driver)):
+            log_info("Прокси драйвера выведен из ротации, перезапускаю драйвер с другим прокси.")
+            self._discard(driver)
+            return False
+        self._uses[id(driver)] = self._uses.get(id(driver), 0) + 1
+        return True
+
+    def acquire(self, timeout=DRIVER_POOL_ACQUIRE_TIMEOUT):
+        """Выдает исправный драйвер из пула или None, если его не удалось получить за timeout секунд."""
+        deadline = time.monotonic() + timeout
+        while not self._closed:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._create_driver()
+                if not driver:
+                    if self._created == 0:
+                        # Создать драйвер не удалось, а ждать возврата некого
+                        return None
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        log_error(f"Не дождались свободного драйвера из пула за {timeout} с.")
+                        return None
+                    try:
+                        driver = self._idle.get(timeout=min(remaining, 1.0))
+                    except queue.Empty:
+                        continue
+            if self._check_out(driver):
+                return driver
+        return None
+
+    def try_acquire(self):
+        """Драйвер без ожидания: свободный или новый, если пул еще не заполнен; иначе None."""
+        while not self._closed:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                driver = self._create_driver()
+                if not driver:
+                    return None
+            if self._check_out(driver):
+                return driver
+        return None
+
+    def release(self, driver, broken=False):
+        """Возвращает драйвер в пул; сломанные и отработавшие свой ресурс драйверы закрываются."""
+        if not driver:
+            return
+        if broken or self._closed or self._uses.get(id(driver), 0) >= self.max_uses:
+            self._discard(driver)
+            return
+        self._idle.put(driver)
+
+    @contextmanager
+    def driver(self, timeout=DRIVER_POOL_ACQUIRE_TIMEOUT):
+        """Контекстный менеджер: выдает драйвер (или None) и гарантированно возвращает его в пул."""
+        driver = self.acquire(timeout)
+        broken = False
+        try:
+            yield driver
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            self.release(driver, broken=broken)
+
+    def close(self):
+        """Закрывает все свободные драйверы; выданные будут закрыты при возврате."""
+        self._closed = True
+        while True:
+            try:
+                driver = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(driver)
+        log_info("Пул драйверов закрыт.")
+
+_driver_pool = None
+_driver_pool_lock = threading.Lock()
+
+def get_driver_pool():
+    """Возвращает общий для процесса пул драйверов, создавая его при первом обращении."""
+    global _driver_pool
+    with _driver_pool_lock:
+        if _driver_pool is None or _driver_pool._closed:
+            _driver_pool = DriverPool(DRIVER_POOL_SIZE)
+        return _driver_pool
+
+class DriverPoolFetcher(PageFetcher):
+    """Загрузка карточек через браузер из пула драйверов (полный рендер страницы).
+
+    При отмене cancel_token драйвер закрывается прямо во время загрузки: fetch сразу возвращает None,
+    а сам драйвер в пул не возвращается.
+    """
+
+    def __init__(self, driver_pool=None, cancel_token=None):
+        self.driver_pool = driver_pool
+        self.cancel_token = cancel_token
+
+    def _is_cancelled(self):
+        return self.cancel_token is not None and self.cancel_token.cancelled
+
+    def fetch(self, url):
+        pool = self.driver_pool or get_driver_pool()
+        if self._is_cancelled():
+            return None
+        driver = pool.acquire()
+        if not driver:
+            return None
+        proxy = pool.proxy_manager.proxy_for(driver)
+        callback_id = self.cancel_token.register(lambda: quit_driver_in_background(driver)) if self.cancel_token else None
+        broken = False
+        started = time.perf_counter()
+        try:
+            page_source = load_product_page(driver, url)
+        except Exception:
+            broken = True
+            get_fetch_throttle().record(False) # Загрузка не дошла до разбора: освобождаем пробную загрузку автомата капчи
+            if self._is_cancelled():
+                log_info(f"Загрузка {url} прервана отменой задачи.")
+                return None
+            pool.proxy_manager.record(proxy, error=True)
+            raise
+        finally:
+            if callback_id is not None:
+                self.cancel_token.unregister(callback_id)
+            pool.release(driver, broken=broken or self._is_cancelled())
+        pool.proxy_manager.record(proxy, latency=time.perf_counter() - started, captcha=CAPTCHA_CLASS in page_source)
+        return page_source
+
+def quit_driver_in_background(driver):
+    # quit() блокирует до ответа chromedriver, а отмена приходит из цикла событий бота
+    threading.Thread(target=driver.quit, name="driver-cancel", daemon=True).start()
+
+def _has_required_fields(data):
+    return bool(data) and not data.get("status") and all(data.get(field) for field in HTTP_REQUIRED_FIELDS)
+
+def parse_product(url, http_fetcher=None, driver_pool=None, use_cache=PRODUCT_CACHE_ENABLED, source="", cancel_token=None):
+    """Парсит карточку: из кэша по артикулу, иначе быстрым HTTP-запросом, браузер из пула — только при капче или нехватке полей.
+
+    Каждый свежий (не из кэша) успешный разбор записывается в хранилище истории цен с пометкой source.
+    При отмене cancel_token (см. jobs.CancellationToken) загрузка прерывается и возвращается статус "cancelled".
+    Все метрики внутри разбора помечаются точкой входа source.
+    """
+    with metrics_source(source), get_metrics().timer("parse_product"):
+        article = extract_article(url)
+        if not use_cache or not article:
+            return _parse_and_store(url, http_fetcher, driver_pool, source, cancel_token)
+        data = get_product_cache().get_or_load(article, lambda: _parse_and_store(url, http_fetcher, driver_pool, source, cancel_token))
+        if data and data.get("url") != url:
+            data["url"] = url # Тот же артикул мог прийти по другой ссылке
+        return data
+
+def _parse_and_store(url, http_fetcher, driver_pool, source, cancel_token=None):
+    started = time.perf_counter()
+    data = _parse_product_uncached(url, http_fetcher, driver_pool, cancel_token)
+    status = (data.get("status") or "ok") if data else "error"
+    get_metrics().inc(PARSE_RESULTS, status=status)
+    log_info(f"Парсинг {url} завершен: {status}", url=url, article=extract_article(url), status=status,
+             duration=round(time.perf_counter() - started, 3), source=source)
+    if PRODUCT_DB_ENABLED:
+        get_product_store().add(data, source)
+    return data
+
+def _parse_product_uncached(url, http_fetcher=None, driver_pool=None, cancel_token=None):
+    cancelled_result = {"status": "cancelled", "url": url}
+    if cancel_token is not None and cancel_token.cancelled:
+        return cancelled_result
+    log_info(f"Начинаю парсинг URL: {url}")
+    if HTTP_FETCH_ENABLED:
+        fetcher = http_fetcher or get_http_fetcher()
+        page_source = fetcher.fetch(url)
+        if page_source:
+            data = _record_captcha(parse_product_html(page_source, url))
+            if _has_required_fields(data) or (data and data.get("status") == "product_unavailable"):
+                return data
+            log_info(f"HTTP-загрузка {url} не дала полных данных (статус: {data.get('status') if data else None}), переключаюсь на браузер.")
+
+    if cancel_token is not None and cancel_token.cancelled:
+        return cancelled_result
+    page_source = DriverPoolFetcher(driver_pool, cancel_token).fetch(url)
+    if cancel_token is not None and cancel_token.cancelled:
+        if page_source is not None:
+            get_fetch_throttle().record(CAPTCHA_CLASS in page_source) # Страница загружена, но разбирать ее уже не нужно
+        return cancelled_result
+    if page_source is None:
+        log_error(f"Не удалось получить драйвер из пула для {url}")
+        return {"status": "driver_unavailable", "url": url}
+    return _record_captcha(parse_product_html(page_source, url))
@@ -0,0 +1,138 @@
+import threading
+import time
+from .config import (PROXY_LIST, PROXY_EWMA_ALPHA, PROXY_MIN_SAMPLES, PROXY_MAX_ERROR_RATE, PROXY_MAX_CAPTCHA_RATE,
+                     PROXY_RETIRE_SECONDS)
+from .utils import log_info, log_warning
+
+# Пул прокси с оценкой качества. По каждому прокси скользящим средним считаются задержка, доля ошибок
+# и доля капч; плохие прокси выводятся из ротации на PROXY_RETIRE_SECONDS, потом возвращаются "с чистого листа".
+# Нагрузка распределяется по здоровым прокси: выбирается наименее занятый, при равенстве — с лучшей оценкой.
+
+class ProxyStats:
+    def __init__(self, proxy):
+        self.proxy = proxy
+        self.samples = 0
+        self.latency = None # Скользящее среднее, секунды
+        self.error_rate = 0.0
+        self.captcha_rate = 0.0
+        self.in_use = 0 # Сколько драйверов и HTTP-запросов сейчас работают через прокси
+        self.retired_until = 0.0
+
+    def score(self):
+        """Меньше — лучше: задержка со штрафом за ошибки и капчи (неизвестная задержка считается за 1 с)."""
+        latency = self.latency if self.latency is not None else 1.0
+        return latency * (1 + 5 * self.error_rate + 10 * self.captcha_rate)
+
+    def as_dict(self):
+        return {"proxy": self.proxy, "samples": self.samples, "latency": self.latency, "error_rate": round(self.error_rate, 3),
+                "captcha_rate": round(self.captcha_rate, 3), "in_use": self.in_use, "retired": self.retired_until > time.monotonic()}
+
+def proxy_has_credentials(proxy):
+    return "@" in proxy
+
+class ProxyManager:
+    """Выбор прокси для драйверов и HTTP-запросов с учетом их здоровья."""
+
+    def __init__(self, proxies=PROXY_LIST, alpha=PROXY_EWMA_ALPHA, min_samples=PROXY_MIN_SAMPLES,
+                 max_error_rate=PROXY_MAX_ERROR_RATE, max_captcha_rate=PROXY_MAX_CAPTCHA_RATE, retire_seconds=PROXY_RETIRE_SECONDS):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.max_error_rate = max_error_rate
+        self.max_captcha_rate = max_captcha_rate
+        self.retire_seconds = retire_seconds
+        self._stats = {proxy: ProxyStats(proxy) for proxy in proxies}
+        self._driver_proxies = {} # id(драйвера) -> прокси
+        self._lock = threading.Lock()
+
+    def __bool__(self):
+        return bool(self._stats)
+
+    def _is_available(self, stats, now):
+        if stats.retired_until > now:
+            return False
+        if stats.retired_until:
+            # Срок вывода из ротации истек: даем прокси новый шанс
+            stats.retired_until = 0.0
+            stats.samples = 0
+            stats.error_rate = stats.captcha_rate = 0.0
+            log_info(f"Прокси {stats.proxy} возвращен в ротацию.")
+        return True
+
+    def acquire(self, for_browser=False):
+        """Занимает наименее загруженный из здоровых прокси (вернуть через release); None, если прокси не заданы
+        или все выведены из ротации.
+
+        Chrome не принимает логин и пароль в --proxy-server, поэтому для браузера прокси с авторизацией пропускаются.
+        """
+        now = time.monotonic()
+        with self._lock:
+            candidates = [stats for stats in self._stats.values()
+                          if self._is_available(stats, now) and not (for_browser and proxy_has_credentials(stats.proxy))]
+            if not candidates:
+                if self._stats:
+                    log_warning("Нет доступных прокси, работаю без прокси.")
+                return None
+            best = min(candidates, key=lambda stats: (stats.in_use, stats.score()))
+            best.in_use += 1
+            return best.proxy
+
+    def release(self, proxy):
+        if not proxy:
+            return
+        with self._lock:
+            self._stats[proxy].in_use -= 1
+
+    def bind(self, driver, proxy):
+        """Привязывает драйвер к занятому для него прокси на все время жизни драйвера."""
+        if proxy:
+            with self._lock:
+                self._driver_proxies[id(driver)] = proxy
+
+    def unbind(self, driver):
+        """Отвязывает закрываемый драйвер и освобождает его прокси."""
+        with self._lock:
+            proxy = self._driver_proxies.pop(id(driver), None)
+        self.release(proxy)
+
+    def proxy_for(self, driver):
+        with self._lock:
+            return self._driver_proxies.get(id(driver))
+
+    def is_retired(self, proxy):
+        with self._lock:
+            return bool(proxy) and self._stats[proxy].retired_until > time.monotonic()
+
+    def record(self, proxy, latency=None, error=False, captcha=False):
+        """Учитывает результат загрузки через прокси; при превышении порогов выводит его из ротации."""
+        if not proxy or proxy not in self._stats:
+            return
+        retired_reason = None
+        with self._lock:
+            stats = self._stats[proxy]
+            stats.samples += 1
+            if latency is not None and not error:
+                stats.latency = latency if stats.latency is None else stats.latency + self.alpha * (latency - stats.latency)
+            stats.error_rate += self.alpha * (float(error) - stats.error_rate)
+            stats.captcha_rate += self.alpha * (float(captcha) - stats.captcha_rate)
+            if stats.samples < self.min_samples or stats.retired_until:
+                return
+            if stats.error_rate > self.max_error_rate or stats.captcha_rate > self.max_captcha_rate:
+                stats.retired_until = time.monotonic() + self.retire_seconds
+                retired_reason = f"ошибки {stats.error_rate:.0%}, капчи {stats.captcha_rate:.0%}"
+        if retired_reason:
+            log_warning(f"Прокси {proxy} выведен из ротации на {self.retire_seconds} с ({retired_reason}).")
+
+    def stats(self):
+        with self._lock:
+            return [stats.as_dict() for stats in self._stats.values()]
+
+_proxy_manager = None
+_proxy_manager_lock = threading.Lock()
+
+def get_proxy_manager():
+    """Общий для процесса менеджер прокси из PROXY_LIST."""
+    global _proxy_manager
+    with _proxy_manager_lock:
+        if _proxy_manager is None:
+            _proxy_manager = ProxyManager()
+        return _proxy_manager
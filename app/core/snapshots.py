@@ -0,0 +1,67 @@
+import gzip
+import os
+import random
+import threading
+from datetime import datetime
+from .config import SNAPSHOTS_ENABLED, SNAPSHOT_DIR, SNAPSHOT_FAILURE_STATUSES, SNAPSHOT_SAMPLE_RATE, SNAPSHOT_MAX_FILES, SNAPSHOT_MAX_BYTES
+from .utils import log_info, log_error
+
+# Снимки сырого HTML для разбора проблемных страниц.
+# Файлы: <SNAPSHOT_DIR>/<артикул>_<время>_<статус>.html.gz, старые удаляются по количеству и объему.
+
+_snapshot_lock = threading.Lock()
+
+def should_capture_snapshot(status):
+    """Сохранять ли снимок страницы с таким статусом разбора."""
+    if not SNAPSHOTS_ENABLED:
+        return False
+    if status in SNAPSHOT_FAILURE_STATUSES:
+        return True
+    return SNAPSHOT_SAMPLE_RATE > 0 and random.random() < SNAPSHOT_SAMPLE_RATE
+
+def save_snapshot(page_source, url, status, article=""):
+    """Сохраняет HTML в сжатом виде и возвращает путь к файлу (или None при ошибке)."""
+    timestamp = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+    file_name = f"{article or 'unknown'}_{timestamp}_{status}.html.gz"
+    file_path = os.path.join(SNAPSHOT_DIR, file_name)
+    try:
+        os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+        with gzip.open(file_path, 'wt', encoding='utf-8', compresslevel=6) as f:
+            f.write(f"<!-- {url} -->\n")
+            f.write(page_source)
+    except Exception as e:
+        log_error(f"Ошибка сохранения снимка HTML для {url}: {e}")
+        return None
+    log_info(f"Снимок HTML ({status}) для {url} сохранен в {file_path}")
+    prune_snapshots()
+    return file_path
+
+def capture_snapshot(page_source, url, status, article=""):
+    """Сохраняет снимок, только если он нужен для этого статуса."""
+    if not page_source or not should_capture_snapshot(status):
+        return None
+    return save_snapshot(page_source, url, status, article)
+
+def prune_snapshots(max_files=SNAPSHOT_MAX_FILES, max_bytes=SNAPSHOT_MAX_BYTES):
+    """Удаляет самые старые снимки, пока их число и суммарный размер не уложатся в лимиты."""
+    with _snapshot_lock:
+        try:
+            entries = []
+            for entry in os.scandir(SNAPSHOT_DIR):
+                if entry.is_file() and entry.name.endswith(".html.gz"):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except FileNotFoundError:
+            return 0
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and (len(entries) > max_files or total_bytes > max_bytes):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total_bytes -= size
+            removed += 1
+        return removed
@@ -0,0 +1,165 @@
+import atexit
+import json
+import os
+import sqlite3
+import threading
+import time
+from .config import PRODUCT_DB_PATH, PRODUCT_DB_BATCH_SIZE, PRODUCT_DB_FLUSH_INTERVAL
+from .utils import log_info, log_error
+
+# Хранилище товаров и истории цен во встроенной SQLite.
+# products — последняя известная карточка по артикулу, observations — каждое наблюдение цены/скидки за отзыв.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    article TEXT PRIMARY KEY,
+    url TEXT,
+    product_name TEXT,
+    brand TEXT,
+    images TEXT,
+    first_seen REAL NOT NULL,
+    last_seen REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS observations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    article TEXT NOT NULL REFERENCES products(article),
+    observed_at REAL NOT NULL,
+    current_price REAL,
+    second_price REAL,
+    original_price REAL,
+    feedback_discount REAL,
+    rating REAL,
+    reviews INTEGER,
+    source TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_observations_article_time ON observations(article, observed_at);
+CREATE INDEX IF NOT EXISTS idx_observations_time ON observations(observed_at);
+"""
+
+UPSERT_PRODUCT_SQL = """
+INSERT INTO products (article, url, product_name, brand, images, first_seen, last_seen)
+VALUES (?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT(article) DO UPDATE SET
+    url = excluded.url,
+    product_name = excluded.product_name,
+    brand = excluded.brand,
+    images = excluded.images,
+    last_seen = excluded.last_seen
+"""
+
+INSERT_OBSERVATION_SQL = """
+INSERT INTO observations (article, observed_at, current_price, second_price, original_price, feedback_discount, rating, reviews, source)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+"""
+
+OBSERVATION_FIELDS = ("observed_at", "current_price", "second_price", "original_price", "feedback_discount", "rating", "reviews", "source")
+
+class ProductStore:
+    """Буферизованная запись карточек и наблюдений цен в SQLite пачками."""
+
+    def __init__(self, db_path=PRODUCT_DB_PATH, batch_size=PRODUCT_DB_BATCH_SIZE, flush_interval=PRODUCT_DB_FLUSH_INTERVAL):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(SCHEMA)
+        self._pending = []
+        self._oldest_pending_at = None
+        self.written = 0 # Наблюдений, записанных за время работы
+        self._lock = threading.Lock() # Буфер
+        self._db_lock = threading.Lock() # Соединение SQLite
+
+    def add(self, data, source=""):
+        """Ставит успешно разобранную карточку в очередь на запись; пишет пачкой, когда буфер заполнен или устарел."""
+        if not data or data.get("status") or not data.get("article"):
+            return
+        with self._lock:
+            self._pending.append((time.time(), source, data))
+            if self._oldest_pending_at is None:
+                self._oldest_pending_at = time.monotonic()
+            need_flush = len(self._pending) >= self.batch_size or time.monotonic() - self._oldest_pending_at >= self.flush_interval
+        if need_flush:
+            self.flush()
+
+    def flush(self):
+        """Записывает накопленные наблюдения одной транзакцией."""
+        with self._lock:
+            pending, self._pending = self._pending, []
+            self._oldest_pending_at = None
+        if not pending:
+            return 0
+        products = {}
+        observations = []
+        for observed_at, source, data in pending:
+            article = data["article"]
+            first_seen = products[article][5] if article in products else observed_at
+            products[article] = (article, data.get("url", ""), data.get("product_name", ""), data.get("brand", ""),
+                                 json.dumps(data.get("images", []), ensure_ascii=False), first_seen, observed_at)
+            observations.append((article, observed_at, data.get("current_price", 0.0), data.get("second_price", 0.0),
+                                 data.get("original_price", 0.0), data.get("feedback_discount", 0.0),
+                                 data.get("rating", 0.0), data.get("reviews", 0), source))
+        try:
+            with self._db_lock, self._connection:
+                self._connection.executemany(UPSERT_PRODUCT_SQL, list(products.values()))
+                self._connection.executemany(INSERT_OBSERVATION_SQL, observations)
+        except sqlite3.Error as e:
+            log_error(f"Ошибка записи {len(observations)} наблюдений в {self.db_path}: {e}")
+            return 0
+        with self._lock:
+            self.written += len(observations)
+        log_info(f"Записано в базу: {len(products)} товаров, {len(observations)} наблюдений.")
+        return len(observations)
+
+    def get_product(self, article):
+        with self._db_lock:
+            row = self._connection.execute(
+                "SELECT article, url, product_name, brand, images, first_seen, last_seen FROM products WHERE article = ?", (article,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"article": row[0], "url": row[1], "product_name": row[2], "brand": row[3],
+                "images": json.loads(row[4] or "[]"), "first_seen": row[5], "last_seen": row[6]}
+
+    def price_history(self, article, since=None):
+        """Наблюдения по одному артикулу в хронологическом порядке."""
+        return self.price_history_many([article], since).get(article, [])
+
+    def price_history_many(self, articles, since=None):
+        """История цен сразу для многих артикулов: {артикул: [наблюдения по времени]}."""
+        history = {}
+        articles = list(articles)
+        for start in range(0, len(articles), 500): # Ограничение SQLite на число параметров
+            chunk = articles[start:start + 500]
+            query = (f"SELECT article, {', '.join(OBSERVATION_FIELDS)} FROM observations "
+                     f"WHERE article IN ({', '.join('?' * len(chunk))})")
+            params = list(chunk)
+            if since is not None:
+                query += " AND observed_at >= ?"
+                params.append(since)
+            query += " ORDER BY article, observed_at"
+            with self._db_lock:
+                rows = self._connection.execute(query, params).fetchall()
+            for row in rows:
+                history.setdefault(row[0], []).append(dict(zip(OBSERVATION_FIELDS, row[1:])))
+        return history
+
+    def close(self):
+        self.flush()
+        with self._db_lock:
+            self._connection.close()
+
+_product_store = None
+_product_store_lock = threading.Lock()
+
+def get_product_store():
+    """Общее для процесса хранилище; при выходе из процесса недописанный буфер сбрасывается на диск."""
+    global _product_store
+    with _product_store_lock:
+        if _product_store is None:
+            _product_store = ProductStore()
+            atexit.register(_product_store.flush)
+        return _product_store
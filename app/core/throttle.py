@@ -0,0 +1,163 @@
+import threading
+import time
+from collections import deque
+from .config import (THROTTLE_ENABLED, THROTTLE_RATE, THROTTLE_BURST, THROTTLE_MIN_RATE, THROTTLE_RECOVERY_STEP,
+                     CAPTCHA_WINDOW, CAPTCHA_MIN_SAMPLES, CAPTCHA_RATE_THRESHOLD, CAPTCHA_BACKOFF_BASE, CAPTCHA_BACKOFF_MAX,
+                     CAPTCHA_PROBE_TIMEOUT)
+from .utils import log_info, log_warning
+from .metrics import get_metrics, STAGE_SECONDS
+
+# Общий для процесса ограничитель частоты запросов к WB (бот и CLI, HTTP и браузер).
+# Токен-бакет задает темп, автомат "капча" (circuit breaker) при всплеске капч останавливает загрузки
+# с экспоненциальной паузой, затем пропускает одну пробную загрузку и только после нее возобновляет работу.
+# После срабатывания темп снижается вдвое и плавно возвращается к THROTTLE_RATE на успешных загрузках.
+
+class TokenBucket:
+    """Токен-бакет: в среднем rate запросов в секунду, всплеск до burst запросов подряд."""
+
+    def __init__(self, rate=THROTTLE_RATE, burst=THROTTLE_BURST):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def acquire(self):
+        """Ждет и забирает один токен; возвращает, сколько секунд пришлось ждать."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+    def set_rate(self, rate):
+        with self._lock:
+            self._refill()
+            self.rate = rate
+
+class CaptchaCircuitBreaker:
+    """Размыкается, когда доля капч в последних window загрузках превышает threshold.
+
+    closed — загрузки идут; open — все ждут окончания паузы; half_open — идет одна пробная загрузка.
+    Каждое повторное срабатывание подряд удваивает паузу (до backoff_max).
+    """
+
+    def __init__(self, window=CAPTCHA_WINDOW, min_samples=CAPTCHA_MIN_SAMPLES, threshold=CAPTCHA_RATE_THRESHOLD,
+                 backoff_base=CAPTCHA_BACKOFF_BASE, backoff_max=CAPTCHA_BACKOFF_MAX, probe_timeout=CAPTCHA_PROBE_TIMEOUT):
+        self.min_samples = min_samples
+        self.threshold = threshold
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.probe_timeout = probe_timeout
+        self.state = "closed"
+        self.trips = 0 # Срабатываний подряд без успешной пробы
+        self._outcomes = deque(maxlen=window) # True — капча
+        self._open_until = 0.0
+        self._probe_started_at = None
+        self._condition = threading.Condition()
+
+    def _backoff(self):
+        return min(self.backoff_max, self.backoff_base * 2 ** (self.trips - 1))
+
+    def _trip(self):
+        self.trips += 1
+        self.state = "open"
+        self._open_until = time.monotonic() + self._backoff()
+        self._probe_started_at = None
+        self._outcomes.clear()
+        log_warning(f"Слишком много капч: загрузки приостановлены на {self._backoff():.0f} с (срабатывание №{self.trips}).")
+
+    def wait(self):
+        """Блокирует, пока загрузки запрещены; в half_open пропускает только одну пробную загрузку."""
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.state == "closed":
+                    return
+                if self.state == "open":
+                    if now < self._open_until:
+                        self._condition.wait(self._open_until - now)
+                        continue
+                    self.state = "half_open"
+                    self._probe_started_at = None
+                if self._probe_started_at is None or now - self._probe_started_at > self.probe_timeout:
+                    # Пробная загрузка (или замена той, что так и не сообщила результат)
+                    self._probe_started_at = now
+                    log_info("Пауза после капч закончилась, пробная загрузка.")
+                    return
+                self._condition.wait(self.probe_timeout)
+
+    def record(self, captcha):
+        """Сообщает результат загрузки: была ли на странице капча."""
+        with self._condition:
+            if self.state == "half_open":
+                if captcha:
+                    self._trip()
+                else:
+                    log_info("Пробная загрузка прошла без капчи, загрузки возобновлены.")
+                    self.state = "closed"
+                    self.trips = 0
+                    self._outcomes.clear()
+                self._condition.notify_all()
+                return
+            if self.state == "open":
+                return # Загрузка началась до срабатывания, ее результат уже ничего не меняет
+            self._outcomes.append(bool(captcha))
+            if len(self._outcomes) >= self.min_samples and sum(self._outcomes) / len(self._outcomes) >= self.threshold:
+                self._trip()
+
+class FetchThrottle:
+    """Токен-бакет и автомат капчи вместе; темп снижается вдвое при срабатывании и растет на успешных загрузках."""
+
+    def __init__(self, rate=THROTTLE_RATE, burst=THROTTLE_BURST, min_rate=THROTTLE_MIN_RATE, recovery_step=THROTTLE_RECOVERY_STEP,
+                 breaker=None, enabled=THROTTLE_ENABLED):
+        self.enabled = enabled
+        self.max_rate = rate
+        self.min_rate = min_rate
+        self.recovery_step = recovery_step
+        self.bucket = TokenBucket(rate, burst)
+        self.breaker = breaker or CaptchaCircuitBreaker()
+        self.throttled_seconds = 0.0 # Суммарное время ожидания, для статистики
+
+    def wait(self):
+        """Вызывается перед каждой загрузкой страницы WB."""
+        if not self.enabled:
+            return
+        started = time.monotonic()
+        self.breaker.wait()
+        self.bucket.acquire()
+        waited = time.monotonic() - started
+        self.throttled_seconds += waited
+        get_metrics().observe(STAGE_SECONDS, waited, stage="throttle_wait")
+
+    def record(self, captcha):
+        if not self.enabled:
+            return
+        trips_before = self.breaker.trips
+        self.breaker.record(captcha)
+        if self.breaker.trips > trips_before:
+            self.bucket.set_rate(max(self.min_rate, self.bucket.rate / 2))
+            log_warning(f"Темп загрузок снижен до {self.bucket.rate:.2f} в секунду.")
+        elif not captcha and self.bucket.rate < self.max_rate:
+            self.bucket.set_rate(min(self.max_rate, self.bucket.rate + self.recovery_step))
+
+_fetch_throttle = None
+_fetch_throttle_lock = threading.Lock()
+
+def get_fetch_throttle():
+    """Общий для процесса ограничитель: все загрузки страниц WB проходят через него."""
+    global _fetch_throttle
+    with _fetch_throttle_lock:
+        if _fetch_throttle is None:
+            _fetch_throttle = FetchThrottle()
+        return _fetch_throttle
@@ -1,10 +1,18 @@
+import atexit
+import gzip
+import json
 import logging
+import queue
 import random
 import os # Добавлен импорт os
+import shutil
+import time
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 # fake_useragent может вызывать проблемы при сборке или на некоторых системах,
 # поэтому лучше иметь простой список User-Agent как фолбек.
 # from fake_useragent import UserAgent 
-from .config import PROXY_LIST # ИЗМЕНЕН ИМПОРТ
+from .config import (PROXY_LIST, LOG_FORMAT, LOG_MAX_BYTES, LOG_ROTATE_SECONDS, LOG_BACKUP_COUNT, LOG_COMPRESS, # ИЗМЕНЕН ИМПОРТ
+                     LOG_QUEUE_SIZE)
 
 # Пример User-Agent
 USER_AGENTS = [
@@ -23,33 +31,112 @@ PROCESSED_ITEMS_LOG_FILE_PATH = os.path.join(LOG_DIR, 'processed_items.log') # 
 general_logger = logging.getLogger("general")
 processed_items_logger = logging.getLogger("processed_items")
 
-def setup_logging():
+# Обработчики бота и воркеры только кладут запись в очередь, на диск пишет отдельный поток QueueListener
+_log_listener = None
+
+class DroppingQueueHandler(QueueHandler):
+    """Кладет запись в очередь без ожидания; при переполненной очереди запись отбрасывается и считается."""
+
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class CompressingRotatingFileHandler(RotatingFileHandler):
+    """Ротация по размеру и по времени; архивные части сжимаются gzip (в потоке записи логов)."""
+
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, rotate_seconds=LOG_ROTATE_SECONDS,
+                 compress=LOG_COMPRESS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+        self.rotate_seconds = rotate_seconds
+        self._rollover_at = time.time() + rotate_seconds
+        if compress:
+            self.namer = lambda name: name + ".gz"
+            self.rotator = _gzip_rotator
+
+    def shouldRollover(self, record):
+        if self.rotate_seconds and time.time() >= self._rollover_at and os.path.getsize(self.baseFilename) > 0:
+            return True
+        return bool(super().shouldRollover(record))
+
+    def doRollover(self):
+        super().doRollover()
+        self._rollover_at = time.time() + self.rotate_seconds
+
+def _gzip_rotator(source, dest):
+    with open(source, 'rb') as f_in, gzip.open(dest, 'wb') as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+class TextLogFormatter(logging.Formatter):
+    """Обычная строка лога; структурные поля дописываются в конец как key=value."""
+
+    def format(self, record):
+        line = super().format(record)
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " | " + " ".join(f"{key}={value}" for key, value in fields.items())
+        return line
+
+class JsonLogFormatter(logging.Formatter):
+    """Одна запись — одна строка JSON: время, уровень, логгер, сообщение и структурные поля."""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def _make_formatter(log_format, text_format):
+    return JsonLogFormatter() if log_format == "json" else TextLogFormatter(text_format)
+
+def setup_logging(log_format=LOG_FORMAT):
+    global _log_listener
+    if _log_listener is not None:
+        return # Повторный вызов не должен дублировать записи
     if not os.path.exists(LOG_DIR):
         os.makedirs(LOG_DIR)
-    
-    # Настройка основного логгера
-    general_logger.setLevel(logging.INFO)
-    general_formatter = logging.Formatter('%(asctime)s %(levelname)s:%(message)s')
-    general_handler = logging.FileHandler(GENERAL_LOG_FILE_PATH, encoding='utf-8') # Добавим encoding
-    general_handler.setFormatter(general_formatter)
-    general_logger.addHandler(general_handler)
-    # Чтобы избежать двойного логирования, если basicConfig был вызван где-то еще
-    general_logger.propagate = False 
-
-    # Настройка логгера для обработанных товаров
-    processed_items_logger.setLevel(logging.INFO)
-    processed_formatter = logging.Formatter('%(asctime)s: %(message)s')
-    processed_handler = logging.FileHandler(PROCESSED_ITEMS_LOG_FILE_PATH, encoding='utf-8') # Добавим encoding
-    processed_handler.setFormatter(processed_formatter)
-    processed_items_logger.addHandler(processed_handler)
-    processed_items_logger.propagate = False
-
-    # Убираем старый logging.basicConfig, так как мы настроили логгеры вручную
-    # logging.basicConfig(
-    #     filename=GENERAL_LOG_FILE_PATH, 
-    #     level=logging.INFO,
-    #     format='%(asctime)s %(levelname)s:%(message)s'
-    # )
+
+    # Файловые обработчики работают только в потоке QueueListener; фильтр по имени логгера выбирает файл
+    general_handler = CompressingRotatingFileHandler(GENERAL_LOG_FILE_PATH)
+    general_handler.setFormatter(_make_formatter(log_format, '%(asctime)s %(levelname)s:%(message)s'))
+    general_handler.addFilter(logging.Filter(general_logger.name))
+    processed_handler = CompressingRotatingFileHandler(PROCESSED_ITEMS_LOG_FILE_PATH)
+    processed_handler.setFormatter(_make_formatter(log_format, '%(asctime)s: %(message)s'))
+    processed_handler.addFilter(logging.Filter(processed_items_logger.name))
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    queue_handler = DroppingQueueHandler(log_queue)
+    for logger in (general_logger, processed_items_logger):
+        logger.setLevel(logging.INFO)
+        logger.addHandler(queue_handler)
+        # Чтобы избежать двойного логирования, если basicConfig был вызван где-то еще
+        logger.propagate = False
+
+    _log_listener = QueueListener(log_queue, general_handler, processed_handler, respect_handler_level=True)
+    _log_listener.start()
+    atexit.register(shutdown_logging)
+
+def shutdown_logging():
+    """Дописывает очередь логов на диск и останавливает поток записи."""
+    global _log_listener
+    if _log_listener is None:
+        return
+    _log_listener.stop()
+    for handler in _log_listener.handlers:
+        handler.close()
+    _log_listener = None
 
 def get_random_user_agent():
     # try:
@@ -65,14 +152,19 @@ def get_random_proxy():
         return random.choice(PROXY_LIST)
     return None
 
-def log_info(msg):
-    general_logger.info(msg)
+# Именованные аргументы — структурные поля записи (url, article, status, duration...):
+# в формате json это отдельные ключи, в текстовом — хвост key=value
+def _extra(fields):
+    return {"fields": fields} if fields else None
+
+def log_info(msg, **fields):
+    general_logger.info(msg, extra=_extra(fields))
 
-def log_error(msg):
-    general_logger.error(msg)
+def log_error(msg, **fields):
+    general_logger.error(msg, extra=_extra(fields))
 
-def log_warning(msg):
-    general_logger.warning(msg)
+def log_warning(msg, **fields):
+    general_logger.warning(msg, extra=_extra(fields))
 
-def log_processed_item(msg): # Новая функция логирования
-    processed_items_logger.info(msg) 
\ No newline at end of file
+def log_processed_item(msg, **fields): # Новая функция логирования
+    processed_items_logger.info(msg, extra=_extra(fields)) 
\ No newline at end of file
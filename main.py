@@ -1,32 +1,152 @@
 import argparse
+import csv
 import sys
-from app.core.parser import get_driver, parse_product_page
-from app.core.filters import filter_product
-from app.core.utils import get_random_user_agent, get_random_proxy, log_info, log_error
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from app.core.parser import get_driver_pool, parse_product, iter_product_links
+from app.core.storage import get_product_store
+from app.core.dataset import DatasetWriter
+from app.core.metrics import get_metrics
+from app.core.config import PRODUCT_DB_ENABLED, PRODUCT_DB_PATH, DEFAULT_MAX_PAGES, CLI_BATCH_WORKERS
+from app.core.utils import log_error
 import json
-import pandas as pd
+
+def write_csv(path, rows):
+    fieldnames = []
+    for row in rows:
+        fieldnames.extend(key for key in row if key not in fieldnames)
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        writer.writerows(rows)
+
+def iter_urls_from_file(path):
+    """Ссылки из файла (по одной в строке, '#' — комментарий); '-' — читать из stdin."""
+    f = sys.stdin if path == '-' else open(path, 'r', encoding='utf-8')
+    try:
+        for line in f:
+            url = line.strip()
+            if url and not url.startswith('#'):
+                yield url
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+def iter_urls_from_search(args):
+    """Ссылки из поисковой выдачи или категории; драйвер выдачи берется из того же пула, что и для карточек."""
+    with get_driver_pool().driver() as links_driver:
+        if not links_driver:
+            log_error("Не удалось получить драйвер из пула для загрузки выдачи.")
+            return
+        yield from iter_product_links(links_driver, search_query=args.query, category_url=args.category_url,
+                                      max_pages=args.max_pages, min_price_rub=args.min_price, max_price_rub=args.max_price)
+
+def run_batch(urls, out_path, workers, dataset_writer=None, query=""):
+    """Парсит ссылки потоком: в работе не больше 2*workers товаров, каждая запись сразу дописывается в JSONL."""
+    statuses = Counter()
+    started = time.perf_counter()
+    out = sys.stdout if out_path == '-' else open(out_path, 'a', encoding='utf-8')
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cli-item") as executor:
+            in_flight = set()
+
+            def write_done(done):
+                for future in done:
+                    try:
+                        data = future.result()
+                    except Exception as e:
+                        log_error(f"Ошибка парсинга в пакетном режиме: {type(e).__name__} - {e}")
+                        data = None
+                    if not data:
+                        statuses["error"] += 1
+                        continue
+                    statuses[data.get("status") or "ok"] += 1
+                    out.write(json.dumps(data, ensure_ascii=False) + "\n")
+                    out.flush() # Уже разобранное переживет падение процесса
+                    if dataset_writer:
+                        dataset_writer.add(data, query=query, source="cli")
+
+            for url in urls:
+                if len(in_flight) >= workers * 2:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    write_done(done)
+                in_flight.add(executor.submit(parse_product, url, source="cli"))
+            write_done(wait(in_flight).done)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return statuses, time.perf_counter() - started
+
+def print_summary(statuses, elapsed):
+    total = sum(statuses.values())
+    rate = total / elapsed if elapsed > 0 else 0.0
+    print(f"Обработано: {total} за {elapsed:.1f} с ({rate:.2f} товаров/с)", file=sys.stderr)
+    for status, count in statuses.most_common():
+        print(f"  {status}: {count}", file=sys.stderr)
 
 def main():
     parser = argparse.ArgumentParser(description="Wildberries парсер (CLI)")
-    parser.add_argument('--url', type=str, help='URL карточки товара для парсинга')
-    parser.add_argument('--out-json', type=str, default='app/data/results.json', help='Файл для JSON')
-    parser.add_argument('--out-csv', type=str, default='app/data/results.csv', help='Файл для CSV')
+    source_group = parser.add_mutually_exclusive_group()
+    source_group.add_argument('--url', type=str, help='URL карточки товара для парсинга')
+    source_group.add_argument('--urls-file', type=str, help="Файл со ссылками, по одной в строке ('-' — stdin)")
+    source_group.add_argument('--query', type=str, help='Поисковый запрос: парсить товары из выдачи')
+    source_group.add_argument('--category-url', type=str, help='URL категории: парсить товары из нее')
+    parser.add_argument('--max-pages', type=int, default=DEFAULT_MAX_PAGES, help='Страниц выдачи для --query/--category-url')
+    parser.add_argument('--min-price', type=float, default=None, help='Минимальная цена в выдаче, руб')
+    parser.add_argument('--max-price', type=float, default=None, help='Максимальная цена в выдаче, руб')
+    parser.add_argument('--workers', type=int, default=CLI_BATCH_WORKERS, help='Сколько товаров парсить одновременно')
+    parser.add_argument('--out-jsonl', type=str, default='app/data/results.jsonl', help="Куда дописывать результаты пакетного режима ('-' — stdout)")
+    parser.add_argument('--out-parquet', type=str, default=None, help='Каталог колоночной выгрузки (Parquet, разделы по дню и запросу)')
+    parser.add_argument('--out-json', type=str, default=None, help='Дополнительно сохранить результат --url в JSON')
+    parser.add_argument('--out-csv', type=str, default=None, help='Дополнительно сохранить результат --url в CSV')
+    parser.add_argument('--metrics', action='store_true', help='Вывести в stderr задержки по стадиям и счетчики статусов')
     args = parser.parse_args()
 
-    if not args.url:
-        print("Укажи ссылку через --url")
+    if not (args.url or args.urls_file or args.query or args.category_url):
+        print("Укажи ссылку через --url, файл со ссылками через --urls-file или поиск через --query/--category-url")
         sys.exit(1)
 
-    driver = get_driver(get_random_proxy(), get_random_user_agent())
-    data = parse_product_page(driver, args.url)
-    driver.quit()
+    if not args.url:
+        # Пакетный режим: драйверы пула и HTTP-сессия переиспользуются на всю пачку
+        urls = iter_urls_from_file(args.urls_file) if args.urls_file else iter_urls_from_search(args)
+        dataset_writer = DatasetWriter(args.out_parquet) if args.out_parquet else None
+        try:
+            statuses, elapsed = run_batch(urls, args.out_jsonl, max(1, args.workers), dataset_writer, args.query or args.category_url or "")
+        finally:
+            get_driver_pool().close()
+            if PRODUCT_DB_ENABLED:
+                get_product_store().close()
+            if dataset_writer:
+                dataset_writer.close()
+        print_summary(statuses, elapsed)
+        if args.metrics:
+            print(get_metrics().summary(), file=sys.stderr)
+        return
+
+    # Браузер из пула запускается, только если HTTP-загрузки карточки не хватило
+    data = parse_product(args.url, source="cli")
+    get_driver_pool().close()
+    stored = False
+    if PRODUCT_DB_ENABLED:
+        store = get_product_store()
+        store.close() # Дописывает буфер; карточки со статусом (капча, распродано) в базу не попадают
+        stored = store.written > 0
     if data:
-        with open(args.out_json, 'w', encoding='utf-8') as f:
-            json.dump([data], f, ensure_ascii=False, indent=2)
-        pd.DataFrame([data]).to_csv(args.out_csv, index=False, encoding='utf-8-sig')
-        print(f"Сохранено: {args.out_json}, {args.out_csv}")
+        if args.out_json:
+            with open(args.out_json, 'w', encoding='utf-8') as f:
+                json.dump([data], f, ensure_ascii=False, indent=2)
+        if args.out_csv:
+            write_csv(args.out_csv, [data])
+        saved_to = [path for path in (PRODUCT_DB_PATH if stored else None, args.out_json, args.out_csv) if path]
+        if saved_to:
+            print(f"Сохранено: {', '.join(saved_to)}")
+        else:
+            print(f"Результат не сохранен (статус: {data.get('status') or 'ok'}).")
     else:
         print("Не удалось спарсить товар.")
+    if args.metrics:
+        print(get_metrics().summary(), file=sys.stderr)
 
 if __name__ == "__main__":
-    main() 
\ No newline at end of file
+    main()